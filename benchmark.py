@@ -0,0 +1,408 @@
+#!/usr/bin/python3
+import os
+os.environ['MKL_NUM_THREADS'] = '1'
+os.environ['NUMEXPR_NUM_THREADS'] = '1'
+os.environ['OMP_NUM_THREADS'] = '1'
+os.environ['OPENBLAS_NUM_THREADS'] = '1'
+
+import io
+import csv
+import sys
+import json
+import time
+import random
+import collections
+import getopt
+import platform
+import resource
+import subprocess
+import contextlib
+
+import numpy as np
+
+# python3 benchmark.py -n 5000 -w bench -o results.json
+# python3 benchmark.py -n 5000 -w bench -o new_results.json -c results.json
+#
+# Generates a synthetic collection of legal cases in the CSV format read by VectorSpaceModel.parse_data,
+# builds its index with index.py in a child process, measuring the documents indexed per second and the
+# peak resident memory of the build, and times Boolean, phrasal and free text queries (approach 1 and 2)
+# sampled from the collection. The results are written into a JSON file, and compared with the results
+# of a previous run given with -c: every metric that got worse by more than the tolerance is reported
+# as a regression, and the script exits with status 1.
+
+# Words of the collection, most frequent first. The remaining words of the vocabulary are made of SYLLABLES.
+LEGAL_WORDS = ('court', 'appeal', 'plaintiff', 'defendant', 'judge', 'evidence', 'contract', 'damages', 'claim',
+               'section', 'order', 'trial', 'counsel', 'respondent', 'appellant', 'accused', 'sentence', 'offence',
+               'witness', 'judgment', 'property', 'agreement', 'breach', 'negligence', 'liability', 'statute',
+               'application', 'decision', 'tribunal', 'jurisdiction', 'prosecution', 'conviction', 'injunction',
+               'trust', 'company', 'director', 'shares', 'payment', 'loan', 'bank', 'estate', 'land', 'tenant',
+               'lease', 'insurance', 'policy', 'employment', 'dismissal', 'compensation', 'costs', 'interest',
+               'defence', 'charge', 'guilty', 'imprisonment', 'fine', 'police', 'statement', 'confession', 'custody',
+               'marriage', 'divorce', 'child', 'maintenance', 'will', 'probate', 'arbitration', 'award', 'tort',
+               'fraud', 'misrepresentation', 'consideration', 'estoppel', 'equity', 'remedy', 'relief', 'motion',
+               'affidavit', 'hearing', 'precedent', 'ruling', 'verdict', 'jury', 'magistrate', 'inquiry', 'phone',
+               'call', 'quiet', 'vehicle', 'accident', 'injury', 'medical', 'doctor', 'hospital', 'drug', 'trafficking')
+SYLLABLES = ('ba', 'ko', 'ri', 'tan', 'sel', 'mo', 'di', 'ven', 'lu', 'par', 'ge', 'nor', 'fi', 'sto', 'we', 'xal')
+
+COURTS = ('SG High Court', 'SG Court of Appeal', 'SG District Court', 'HK High Court', 'HK Court of Final Appeal',
+          'UK House of Lords', 'UK Court of Appeal', 'UK Supreme Court', 'AU High Court', 'CA Supreme Court')
+
+# Words per sentence of the generated documents, so that the sentence tokenizer has work to do
+SENTENCE_LENGTH = 20
+
+# Query kinds timed by run_queries, as (name, approach)
+QUERY_KINDS = (('boolean', 1), ('phrase', 1), ('freetext_approach1', 1), ('freetext_approach2', 2))
+
+# Metrics compared by compare_results, as (section, metric, True if a higher value is better)
+COMPARED_METRICS = [('index', 'docs_per_sec', True), ('index', 'peak_rss_mb', False), ('index', 'index_mb', False)] + \
+                   [(name, metric, False) for name, _ in QUERY_KINDS for metric in ('p50_ms', 'p90_ms', 'p99_ms')] + \
+                   [('queries', 'peak_rss_mb', False)]
+
+# Smallest change of a latency, in milliseconds, reported as a regression, as the latencies of fast queries
+# vary by more than the tolerance from run to run
+MIN_LATENCY_CHANGE_MS = 1.0
+
+def make_vocabulary(vocab_size, seed=0):
+    """
+    Method to make the words of a synthetic collection, LEGAL_WORDS first and then random words of 2 to 4
+    SYLLABLES, all distinct
+
+        Returns:
+            a list of vocab_size words, in the order of their rank
+    """
+    rng = random.Random(seed)
+    words = list(LEGAL_WORDS[:vocab_size])
+    seen = set(words)
+    while len(words) < vocab_size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+def generate_corpus(out_file, num_docs, vocab_size=20000, zipf_exponent=1.0, doc_length=400, seed=0):
+    """
+    Method to write a synthetic collection of legal cases in the format of the dataset: document_id,
+    title, content, date_posted and court. The words of the contents follow a Zipf distribution, the
+    probability of the word of rank r being proportional to 1 / r ** zipf_exponent, and the length of
+    the documents a log-normal distribution of mean doc_length.
+
+        Returns:
+            the vocabulary, in the order of its rank
+    """
+    vocabulary = make_vocabulary(vocab_size, seed)
+    rng = np.random.default_rng(seed)
+    probabilities = 1 / np.arange(1, vocab_size + 1, dtype=np.float64) ** zipf_exponent
+    probabilities /= probabilities.sum()
+    # log-normal lengths with a mean of doc_length
+    sigma = 0.5
+    lengths = np.maximum(rng.lognormal(np.log(doc_length) - sigma * sigma / 2, sigma, num_docs).astype(np.int64), 5)
+    dates = rng.integers(631152000, 1672531200, num_docs) # 1990 to 2022
+
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['document_id', 'title', 'content', 'date_posted', 'court'])
+        for i in range(num_docs):
+            words = [vocabulary[rank] for rank in rng.choice(vocab_size, lengths[i], p=probabilities).tolist()]
+            sentences = [' '.join(words[start:start + SENTENCE_LENGTH]) + ' .' for start in range(0, len(words), SENTENCE_LENGTH)]
+            parties = [vocabulary[rank].capitalize() for rank in rng.integers(len(LEGAL_WORDS), vocab_size, 2).tolist()] \
+                if vocab_size > len(LEGAL_WORDS) else ['Someone', 'Another']
+            writer.writerow([100000 + i, '{} v {}'.format(*parties), ' '.join(sentences),
+                             time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(dates[i]))), COURTS[i % len(COURTS)]])
+    return vocabulary
+
+def sample_queries(dataset_file, num_queries, vocabulary, seed=0):
+    """
+    Method to sample the queries of every kind from the documents of a dataset, so that they have results.
+    Words among the 20 most frequent of the vocabulary, and words in every document, whose idf is 0, are
+    left out of the queries, as they are in almost every document.
+
+        Returns:
+            a dictionary { 'boolean' / 'phrase' / 'freetext' : list of query strings }, the phrases being
+            the words of the phrase without quotes
+    """
+    rng = random.Random(seed)
+    csv.field_size_limit(sys.maxsize)
+    with open(dataset_file, 'r') as file:
+        reader = csv.reader(file, delimiter=',')
+        next(reader) # skip column titles
+        documents = [[word for word in data[2].split() if word.isalpha()] for data in reader]
+    doc_freqs = collections.Counter(term for words in documents for term in set(word.lower() for word in words))
+    common = set(vocabulary[:20]).union(word for word, doc_freq in doc_freqs.items() if doc_freq == len(documents))
+    documents = [words for words in documents if len(words) >= 10]
+
+    def is_rare(word):
+        return word.lower() not in common
+
+    def sample_words(words, k):
+        rare_words = [word for word in words if is_rare(word)]
+        return rng.sample(rare_words if len(rare_words) >= k else words, k)
+
+    def sample_phrase(words, length):
+        # adjacent words without a common word, from another document if this one has none
+        for _ in range(100):
+            starts = [start for start in range(len(words) - length + 1) if all(is_rare(word) for word in words[start:start + length])]
+            if len(starts) != 0:
+                start = rng.choice(starts)
+                return ' '.join(words[start:start + length])
+            words = rng.choice(documents)
+        start = rng.randrange(len(words) - length + 1)
+        return ' '.join(words[start:start + length])
+
+    queries = {'boolean': [], 'phrase': [], 'freetext': []}
+    for i in range(num_queries):
+        words = rng.choice(documents)
+        # two or three terms, or a phrase and a term, of the same document
+        if i % 3 == 2:
+            queries['boolean'].append('"{}" AND {}'.format(sample_phrase(words, 2), sample_words(words, 1)[0]))
+        else:
+            queries['boolean'].append(' AND '.join(sample_words(words, 2 + i % 2)))
+        queries['phrase'].append(sample_phrase(words, 2 + i % 2))
+        queries['freetext'].append(' '.join(sample_words(words, rng.randint(3, 5))))
+    return queries
+
+def get_peak_rss_mb(usage):
+    """
+    Method to get the peak resident memory of a resource usage in MB, ru_maxrss being in KB on Linux
+    and in bytes on macOS
+    """
+    return usage.ru_maxrss / (1024 * 1024 if platform.system() == 'Darwin' else 1024)
+
+def build_index(dataset_file, index_dir, index_options=()):
+    """
+    Method to build the index of a dataset in index_dir with index.py, in a child process so that its
+    peak resident memory can be measured on its own
+
+        Returns:
+            a dictionary of the build metrics
+    """
+    index_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.py")
+    command = [sys.executable, index_script, '-i', os.path.abspath(dataset_file), '-d', 'dictionary.txt', '-p', 'postings.txt'] + list(index_options)
+    st = time.time()
+    with open(os.path.join(index_dir, "index.log"), 'w') as log:
+        process = subprocess.Popen(command, cwd=index_dir, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - st
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError("index.py failed with status {}, see {}".format(process.returncode, os.path.join(index_dir, "index.log")))
+
+    with open(dataset_file, 'r') as file:
+        csv.field_size_limit(sys.maxsize)
+        num_docs = len(set(data[0] for data in csv.reader(file, delimiter=','))) - 1
+    index_bytes = sum(os.path.getsize(os.path.join(index_dir, file_name)) for file_name in os.listdir(index_dir)
+                      if file_name != "index.log" and os.path.isfile(os.path.join(index_dir, file_name)))
+    return {'docs': num_docs, 'seconds': seconds, 'docs_per_sec': num_docs / max(seconds, 1e-9),
+            'peak_rss_mb': get_peak_rss_mb(usage), 'index_mb': index_bytes / (1024 * 1024)}
+
+def summarize_latencies(latencies, num_results, num_errors=0):
+    """
+    Method to summarize the latencies of queries in milliseconds, leaving out the queries that failed
+    """
+    latencies = np.array(latencies, dtype=np.float64)
+    if len(latencies) == 0:
+        return {'queries': 0, 'errors': num_errors}
+    return {'queries': len(latencies), 'errors': num_errors, 'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)), 'p90_ms': float(np.percentile(latencies, 90)),
+            'p99_ms': float(np.percentile(latencies, 99)), 'max_ms': float(latencies.max()),
+            'mean_results': num_results / len(latencies)}
+
+def run_queries(index_dir, queries, K=10, tokenizer_mode='nltk', repeats=3):
+    """
+    Method to time the queries on the index of index_dir, one QueryParser running all of them without a
+    query cache, so that every query is measured. The queries of a kind are run repeats times in a row,
+    with the postings cache kept between the queries of a run, as in search.py, and emptied before every
+    run, and the latency of a query is its fastest run, the least disturbed by the other processes.
+    Phrases are matched with QueryParser.process_phrase, as process_query ranks a query without AND
+    as free text. A query that raises an error is counted, and left out of the latencies.
+
+        Returns:
+            a dictionary { query kind : latency metrics }, see QUERY_KINDS
+    """
+    from query_parser import QueryParser
+    from query_cache import QueryCache
+    from postings_cache import PostingsCache
+
+    cwd = os.getcwd()
+    # the document table and the other fixed name files are read from the current directory
+    os.chdir(index_dir)
+    try:
+        st = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser = QueryParser("dictionary.txt", "postings.txt", tokenizer_mode=tokenizer_mode, query_cache=QueryCache(max_entries=0))
+        metrics = {'load_ms': (time.time() - st) * 1000}
+
+        for name, approach in QUERY_KINDS:
+            kind_queries = queries[name.split('_')[0]]
+            latencies = [float('inf')] * len(kind_queries)
+            failed = set()
+            for _ in range(repeats):
+                parser.postings_cache = PostingsCache()
+                num_results = 0
+                for i, query in enumerate(kind_queries):
+                    if i in failed:
+                        continue
+                    st = time.perf_counter()
+                    try:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            if name == 'phrase':
+                                results = parser.process_phrase(parser.tokenize_query(query))
+                            else:
+                                results = parser.process_query([query], K, approach)
+                    except Exception as e:
+                        print("{} query {!r} failed: {!r}".format(name, query, e))
+                        failed.add(i)
+                        continue
+                    latencies[i] = min(latencies[i], (time.perf_counter() - st) * 1000)
+                    num_results += len(results)
+            metrics[name] = summarize_latencies([latency for i, latency in enumerate(latencies) if i not in failed], num_results, len(failed))
+    finally:
+        os.chdir(cwd)
+    metrics['peak_rss_mb'] = get_peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+    return metrics
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    Method to compare the metrics of two runs, see COMPARED_METRICS
+
+        Returns:
+            a list of (metric, baseline value, current value, relative change, True if it is a regression),
+            a regression being a change for the worse of more than tolerance, and of more than
+            MIN_LATENCY_CHANGE_MS for latencies
+    """
+    def get_section(results, section):
+        return results[section] if section in ('index', 'queries') else results['queries'].get(section, {})
+
+    comparison = []
+    for section, metric, higher_is_better in COMPARED_METRICS:
+        base_value = get_section(baseline, section).get(metric)
+        curr_value = get_section(current, section).get(metric)
+        if not base_value or curr_value is None:
+            continue
+        change = (curr_value - base_value) / base_value
+        regression = -change > tolerance if higher_is_better else change > tolerance
+        if metric.endswith('_ms') and abs(curr_value - base_value) <= MIN_LATENCY_CHANGE_MS:
+            regression = False
+        comparison.append(('{}.{}'.format(section, metric), base_value, curr_value, change, regression))
+    return comparison
+
+def usage():
+    print("usage: " + sys.argv[0] + " -o results-file [-n number-of-documents] [-i dataset-file] [-w work-directory] [-v vocabulary-size]")
+    print("       [-z zipf-exponent] [-l document-length] [-q queries-per-kind] [-r repeats] [-s seed] [-f] [-m memory-limit-mb] [-c baseline-file] [-t tolerance]")
+    print("  -n  number of documents of the synthetic collection (default 2000)")
+    print("  -i  benchmark an existing dataset file instead of generating one")
+    print("  -w  directory of the generated dataset and of the index (default bench)")
+    print("  -v  number of distinct words of the synthetic collection (default 20000)")
+    print("  -z  exponent of the Zipf distribution of the words (default 1.0)")
+    print("  -l  mean number of words per document (default 400)")
+    print("  -q  number of queries of every kind (default 50)")
+    print("  -r  number of runs of the queries, the latency of a query being its fastest run (default 3)")
+    print("  -s  seed of the collection and of the queries (default 0)")
+    print("  -f  tokenize with the fast regex tokenizer, index.py -f")
+    print("  -m  build the index in blocks, index.py -m")
+    print("  -c  compare the results with the results-file of a previous run, and exit with status 1 on a regression")
+    print("  -t  relative change for the worse reported as a regression (default 0.1)")
+
+if __name__ == '__main__':
+    results_file = dataset_file = baseline_file = None
+    work_dir = "bench"
+    num_docs = 2000
+    vocab_size = 20000
+    zipf_exponent = 1.0
+    doc_length = 400
+    num_queries = 50
+    repeats = 3
+    seed = 0
+    tokenizer_mode = 'nltk'
+    memory_limit = None
+    tolerance = 0.1
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:n:i:w:v:z:l:q:r:s:fm:c:t:')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-o':
+            results_file = a
+        elif o == '-n':
+            num_docs = int(a)
+        elif o == '-i':
+            dataset_file = a
+        elif o == '-w':
+            work_dir = a
+        elif o == '-v':
+            vocab_size = int(a)
+        elif o == '-z':
+            zipf_exponent = float(a)
+        elif o == '-l':
+            doc_length = int(a)
+        elif o == '-q':
+            num_queries = int(a)
+        elif o == '-r':
+            repeats = int(a)
+        elif o == '-s':
+            seed = int(a)
+        elif o == '-f':
+            tokenizer_mode = 'fast'
+        elif o == '-m':
+            memory_limit = a
+        elif o == '-c':
+            baseline_file = a
+        elif o == '-t':
+            tolerance = float(a)
+        else:
+            assert False, "unhandled option"
+
+    if results_file == None:
+        usage()
+        sys.exit(2)
+
+    index_dir = os.path.join(work_dir, "index")
+    os.makedirs(index_dir, exist_ok=True)
+    if dataset_file == None:
+        dataset_file = os.path.join(work_dir, "dataset.csv")
+        print("generating {} documents into {}...".format(num_docs, dataset_file))
+        vocabulary = generate_corpus(dataset_file, num_docs, vocab_size, zipf_exponent, doc_length, seed)
+        corpus_config = {'num_docs': num_docs, 'vocab_size': vocab_size, 'zipf_exponent': zipf_exponent, 'doc_length': doc_length}
+    else:
+        vocabulary = []
+        corpus_config = None
+
+    index_options = (['-f'] if tokenizer_mode == 'fast' else []) + (['-m', memory_limit] if memory_limit is not None else [])
+    print("indexing...")
+    index_metrics = build_index(dataset_file, index_dir, index_options)
+    print("{docs} documents in {seconds:.1f} seconds, {docs_per_sec:.1f} docs/sec, peak RSS {peak_rss_mb:.1f}MB, "
+          "index {index_mb:.1f}MB".format(**index_metrics))
+
+    print("running queries...")
+    query_metrics = run_queries(index_dir, sample_queries(dataset_file, num_queries, vocabulary, seed), tokenizer_mode=tokenizer_mode, repeats=repeats)
+    print("{:<20} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10}".format("queries", "count", "errors", "p50 ms", "p90 ms", "p99 ms", "results"))
+    for name, _ in QUERY_KINDS:
+        metrics = query_metrics[name]
+        if metrics['queries'] != 0:
+            print("{:<20} {:>8} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.1f}".format(name, metrics['queries'], metrics['errors'], metrics['p50_ms'],
+                                                                                      metrics['p90_ms'], metrics['p99_ms'], metrics['mean_results']))
+
+    results = {'config': {'dataset': dataset_file, 'synthetic': corpus_config, 'num_queries': num_queries, 'repeats': repeats, 'seed': seed, 'tokenizer_mode': tokenizer_mode,
+                          'memory_limit': memory_limit},
+               'environment': {'python': platform.python_version(), 'machine': platform.machine(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+               'index': index_metrics, 'queries': query_metrics}
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("results written into", results_file)
+
+    if baseline_file != None:
+        with open(baseline_file, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != results['config']:
+            print("warning: the baseline was run with another configuration,", baseline.get('config'))
+        comparison = compare_results(baseline, results, tolerance)
+        print("{:<32} {:>12} {:>12} {:>9}".format("metric", "baseline", "current", "change"))
+        for metric, base_value, curr_value, change, regression in comparison:
+            print("{:<32} {:>12.2f} {:>12.2f} {:>+8.1f}% {}".format(metric, base_value, curr_value, change * 100, "REGRESSION" if regression else ""))
+        num_regressions = sum(1 for comparison_row in comparison if comparison_row[4])
+        print("{} regressions of more than {:.0f}%".format(num_regressions, tolerance * 100))
+        if num_regressions != 0:
+            sys.exit(1)
@@ -0,0 +1,132 @@
+import numpy as np
+
+# Number of documents covered by a container, as in Roaring bitmaps: a document is stored in the
+# container of its index in the document table divided by CONTAINER_SIZE
+CONTAINER_SIZE = 1 << 16
+
+# Containers with more documents than this are bitmaps of CONTAINER_SIZE bits (as little-endian
+# uint64 words), the others are sorted arrays of uint16, whichever takes less space
+ARRAY_CONTAINER_MAX = 4096
+
+# Terms in more than 1 / DENSE_TERM_RATIO of the documents are stored as DocBitmaps in bitmaps.txt
+DENSE_TERM_RATIO = 16
+
+def make_container(values):
+    """
+    Method to store the documents of a container, given as ascending offsets in the container
+
+        Returns:
+            a NumPy array of uint16 offsets, or of uint64 words for a bitmap
+    """
+    if len(values) <= ARRAY_CONTAINER_MAX:
+        return np.asarray(values, dtype='<u2')
+    bits = np.zeros(CONTAINER_SIZE, dtype=bool)
+    bits[values] = True
+    return np.packbits(bits, bitorder='little').view('<u8')
+
+def is_bitmap(container):
+    return container.dtype.itemsize == 8
+
+def container_values(container):
+    """
+    Method to get the ascending offsets of the documents of a container
+    """
+    if not is_bitmap(container):
+        return container
+    return np.flatnonzero(np.unpackbits(container.view(np.uint8), bitorder='little')).astype('<u2')
+
+def container_contains(container, values):
+    """
+    Method to check which offsets are documents of a container
+
+        Returns:
+            a NumPy array of bool, one per value
+    """
+    if is_bitmap(container):
+        values = values.astype(np.uint64)
+        return ((container[values >> np.uint64(6)] >> (values & np.uint64(63))) & np.uint64(1)).astype(bool)
+    # array containers are never empty
+    positions = np.minimum(np.searchsorted(container, values), len(container) - 1)
+    return container[positions] == values
+
+def intersect_containers(container1, container2):
+    """
+    Method to intersect two containers, with the strategy of their types: AND of the words of two
+    bitmaps, bit tests of the offsets of an array in a bitmap, or a merge of two arrays
+
+        Returns:
+            a container, None if the intersection is empty
+    """
+    if is_bitmap(container1) and is_bitmap(container2):
+        words = container1 & container2
+        cardinality = int(np.unpackbits(words.view(np.uint8)).sum())
+        if cardinality == 0:
+            return None
+        return words if cardinality > ARRAY_CONTAINER_MAX else container_values(words)
+
+    if is_bitmap(container1):
+        container1, container2 = container2, container1
+    if is_bitmap(container2):
+        values = container1[container_contains(container2, container1)]
+    else:
+        values = np.intersect1d(container1, container2, assume_unique=True)
+    return values if len(values) != 0 else None
+
+class DocBitmap:
+    '''
+    Roaring-style set of documents, stored by their index in the document table (the docIDs in
+    ascending order) and split into containers of CONTAINER_SIZE documents, each one a bitmap or
+    a sorted array, see make_container
+    '''
+
+    def __init__(self, containers, doc_ids):
+        self.containers = containers # { container key : container }, keys in ascending order
+        self.doc_ids = doc_ids # NumPy array of the docIDs of the document table, in ascending order
+        self.cardinality = None
+
+    def __len__(self):
+        if self.cardinality is None:
+            self.cardinality = sum(int(np.unpackbits(container.view(np.uint8)).sum()) if is_bitmap(container) else len(container)
+                                   for container in self.containers.values())
+        return self.cardinality
+
+    '''
+    Returns the intersection of the two DocBitmaps of the same document table
+    '''
+    def intersect(self, other):
+        containers = {}
+        for key, container in self.containers.items():
+            if key in other.containers:
+                intersection = intersect_containers(container, other.containers[key])
+                if intersection is not None:
+                    containers[key] = intersection
+        return DocBitmap(containers, self.doc_ids)
+
+    '''
+    Returns the docIDs of the ascending list of docIDs that are in the DocBitmap, in the same order
+    '''
+    def filter(self, doc_ids):
+        if len(doc_ids) == 0:
+            return []
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        indices = np.searchsorted(self.doc_ids, doc_ids)
+        found = (indices < len(self.doc_ids)) & (self.doc_ids[np.minimum(indices, len(self.doc_ids) - 1)] == doc_ids)
+        keys = indices // CONTAINER_SIZE
+        for key in np.unique(keys[found]).tolist():
+            in_key = found & (keys == key)
+            container = self.containers.get(key)
+            if container is None:
+                found[in_key] = False
+            else:
+                found[in_key] = container_contains(container, indices[in_key] % CONTAINER_SIZE)
+        return doc_ids[found].tolist()
+
+    '''
+    Returns the docIDs of the DocBitmap in ascending order
+    '''
+    def to_doc_ids(self):
+        if len(self.containers) == 0:
+            return []
+        indices = np.concatenate([key * CONTAINER_SIZE + container_values(container).astype(np.int64)
+                                  for key, container in self.containers.items()])
+        return self.doc_ids[indices].tolist()
@@ -0,0 +1,173 @@
+import os
+import calendar
+import time
+
+import numpy as np
+
+from postings_codec import decode_fields, encode_fields
+
+# Date of the documents whose date_posted cannot be parsed, never in a date range
+NO_DATE = np.iinfo(np.int64).min
+
+# Formats of date_posted in the dataset, and of the dates of the date filters
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d/%m/%Y')
+
+# Filters of DocFields.filter_mask
+FILTER_KEYS = ('court', 'date_from', 'date_to', 'title')
+
+def parse_date(value):
+    """
+    Method to parse a date, e.g. date_posted, into seconds since the epoch (UTC)
+
+        Returns:
+            an int, or NO_DATE if value is not a date
+    """
+    for date_format in DATE_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(value.strip(), date_format))
+        except ValueError:
+            continue
+    return NO_DATE
+
+def parse_filter_date(value):
+    """
+    Method to parse the date of a date filter, see parse_date
+
+        Returns:
+            an int, raising ValueError if value is not a date
+    """
+    date = parse_date(value) if isinstance(value, str) else NO_DATE
+    if date == NO_DATE:
+        raise ValueError("invalid date {!r}, expected one of the formats {}".format(value, ', '.join(DATE_FORMATS)))
+    return date
+
+def check_filters(filters):
+    """
+    Method to check the filters of DocFields.filter_mask, raising ValueError on an unknown filter or
+    a date that cannot be parsed
+    """
+    unknown = [key for key in filters if key not in FILTER_KEYS]
+    if len(unknown) != 0:
+        raise ValueError("unknown filters {}, expected {}".format(', '.join(map(str, unknown)), ', '.join(FILTER_KEYS)))
+    for key in ('date_from', 'date_to'):
+        if filters.get(key) is not None:
+            parse_filter_date(filters[key])
+
+class DocFields:
+    '''
+    Fields of every document, stored as columns in ascending docID, i.e. in the order of the
+    document table of QueryParser: the court as an index into the sorted names of the courts
+    (dictionary encoding), the date as seconds since the epoch, and an inverted index of the
+    terms of the titles
+    '''
+
+    def __init__(self, doc_ids, courts, court_codes, dates, title_index):
+        self.doc_ids = doc_ids # NumPy array of docIDs in ascending order
+        self.courts = courts # names of the courts, sorted
+        self.court_codes = court_codes # NumPy array, the index in courts of the court of every document
+        self.dates = dates # NumPy array, the date of every document, in seconds since the epoch
+        self.title_index = title_index # { term : [index of document...] }
+
+    '''
+    Returns a NumPy array of bool, True for the documents that pass every filter. filters is a
+    dictionary of
+        'court': a court name, or a list of court names, matched regardless of case
+        'date_from', 'date_to': the first and last days of the documents, e.g. '2000-01-31'
+        'title': words that must all be in the title, tokenized with tokenize like the titles
+    '''
+    def filter_mask(self, filters, tokenize):
+        check_filters(filters)
+        mask = np.ones(len(self.doc_ids), dtype=bool)
+        if filters.get('court') is not None:
+            names = [filters['court']] if isinstance(filters['court'], str) else filters['court']
+            names = set(name.strip().lower() for name in names)
+            codes = [code for code, court in enumerate(self.courts) if court.lower() in names]
+            mask &= np.isin(self.court_codes, codes)
+        if filters.get('date_from') is not None:
+            mask &= self.dates >= parse_filter_date(filters['date_from'])
+        if filters.get('date_to') is not None:
+            date_to = parse_filter_date(filters['date_to'])
+            # a day without a time covers the whole day
+            if len(filters['date_to'].strip()) <= 10:
+                date_to += 24 * 60 * 60 - 1
+            mask &= (self.dates <= date_to) & (self.dates != NO_DATE)
+        if filters.get('title') is not None:
+            for term in tokenize(filters['title']):
+                term_mask = np.zeros(len(self.doc_ids), dtype=bool)
+                term_mask[self.title_index.get(term, [])] = True
+                mask &= term_mask
+        return mask
+
+def build_fields(doc_ids, titles, dates, courts, tokenize):
+    """
+    Method to build the DocFields of documents
+
+        Parameters:
+            doc_ids: a list of docIDs
+            titles, dates, courts: dictionaries { docID : title, date_posted or court as in the dataset }
+            tokenize: the function tokenizing the titles, e.g. Tokenizer.tokenize
+
+        Returns:
+            a DocFields
+    """
+    doc_ids = sorted(doc_ids, key=int)
+    court_names = sorted(set(courts[doc_id].strip() for doc_id in doc_ids))
+    court_codes = {court: code for code, court in enumerate(court_names)}
+    title_index = {}
+    for index, doc_id in enumerate(doc_ids):
+        for term in sorted(set(tokenize(titles[doc_id]))):
+            title_index.setdefault(term, []).append(index)
+    return DocFields(np.array([int(doc_id) for doc_id in doc_ids], dtype=np.int64), court_names,
+                     np.array([court_codes[courts[doc_id].strip()] for doc_id in doc_ids], dtype=np.int64),
+                     np.array([parse_date(dates[doc_id]) for doc_id in doc_ids], dtype=np.int64), title_index)
+
+def merge_fields(segment_fields, owners):
+    """
+    Method to merge the DocFields of the segments of an index, every document taking its fields from
+    the segment that owns it, see index_segments.IndexSegments
+
+        Parameters:
+            segment_fields: a list of the DocFields of every segment, oldest first
+            owners: a dictionary { docID : index of the segment owning the document }
+
+        Returns:
+            a DocFields of every document of owners
+    """
+    doc_ids = np.array(sorted(owners), dtype=np.int64)
+    court_names = sorted(set(court for fields in segment_fields for court in fields.courts))
+    court_codes = np.zeros(len(doc_ids), dtype=np.int64)
+    dates = np.full(len(doc_ids), NO_DATE, dtype=np.int64)
+    title_index = {}
+    for segment, fields in enumerate(segment_fields):
+        owned = np.array([owners.get(doc_id) == segment for doc_id in fields.doc_ids.tolist()], dtype=bool)
+        # index of every document of the segment in doc_ids, -1 for the documents it does not own
+        indices = np.full(len(fields.doc_ids), -1, dtype=np.int64)
+        indices[owned] = np.searchsorted(doc_ids, fields.doc_ids[owned])
+        code_map = np.array([court_names.index(court) for court in fields.courts], dtype=np.int64)
+        court_codes[indices[owned]] = code_map[fields.court_codes[owned]] if len(code_map) != 0 else 0
+        dates[indices[owned]] = fields.dates[owned]
+        for term, segment_indices in fields.title_index.items():
+            merged_indices = indices[segment_indices]
+            title_index.setdefault(term, []).extend(merged_indices[merged_indices != -1].tolist())
+    title_index = {term: sorted(indices) for term, indices in title_index.items() if len(indices) != 0}
+    return DocFields(doc_ids, court_names, court_codes, dates, title_index)
+
+def read_fields(index_dir='.'):
+    """
+    Method to read the fields.txt of the index of index_dir
+
+        Returns:
+            a DocFields, or None if the index has no fields.txt
+    """
+    fields_file = os.path.join(index_dir, "fields.txt")
+    if not os.path.exists(fields_file):
+        return None
+    with open(fields_file, "rb") as f:
+        return DocFields(*decode_fields(f.read()))
+
+def write_fields(fields, index_dir='.'):
+    """
+    Method to write a DocFields into the fields.txt of index_dir
+    """
+    with open(os.path.join(index_dir, "fields.txt"), "wb") as f:
+        f.write(encode_fields(fields.doc_ids.tolist(), fields.courts, fields.court_codes.tolist(), fields.dates.tolist(), fields.title_index))
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+import os
+os.environ['MKL_NUM_THREADS'] = '1'
+os.environ['NUMEXPR_NUM_THREADS'] = '1'
+os.environ['OMP_NUM_THREADS'] = '1'
+os.environ['OPENBLAS_NUM_THREADS'] = '1'
+
+import io
+import sys
+import time
+import getopt
+import contextlib
+from query_parser import QueryParser
+from query_cache import QueryCache
+
+# python3 evaluate.py -d dictionary.txt -p postings.txt -q queries
+#
+# Runs every query file of the queries directory with exhaustive ranking and with the champion lists
+# (QueryParser.process_query(..., tiered=True)), and compares both rankings with the relevant docIDs
+# listed after the query in the query file. The relevant docIDs are only used for the evaluation, not
+# as relevance feedback. Build the index with index.py -c champion-size, with a few champion sizes,
+# to measure the trade-off between latency and recall.
+
+def usage():
+    print("usage: " + sys.argv[0] + " -d dictionary-file -p postings-file -q directory-of-queries [-k K] [-a approach]")
+    print("  -k  number of documents used for relevance feedback, and cut-off of precision and recall (default 10)")
+    print("  -a  query expansion approach of QueryParser.process_query (default 1)")
+
+def read_queries(queries_dir):
+    """
+    Method to read the query files of a directory, sorted by name
+
+        Returns:
+            a list of (file name, query, set of relevant docIDs)
+    """
+    queries = []
+    for file_name in sorted(os.listdir(queries_dir)):
+        with open(os.path.join(queries_dir, file_name), 'r') as file:
+            lines = [line.strip() for line in file.read().split('\n')]
+        relevant_docs = set(int(line) for line in lines[1:] if len(line) != 0)
+        if 'AND' not in lines[0] and len(relevant_docs) != 0:
+            queries.append((file_name, lines[0], relevant_docs))
+    return queries
+
+def average_precision(results, relevant_docs):
+    """
+    Method to calculate the average precision of a ranking, over every relevant document
+    """
+    num_relevant = 0
+    precisions = 0
+    for rank, doc_id in enumerate(results, 1):
+        if doc_id in relevant_docs:
+            num_relevant += 1
+            precisions += num_relevant / rank
+    return precisions / len(relevant_docs)
+
+def evaluate(parser, queries, K, approach, tiered):
+    """
+    Method to run the queries and evaluate their rankings
+
+        Returns:
+            the rankings, and the mean average precision, mean recall at K, mean recall of the whole
+            ranking and mean latency in seconds over the queries
+    """
+    rankings = []
+    totals = [0, 0, 0, 0]
+    for _, query, relevant_docs in queries:
+        st = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = parser.process_query([query], K, approach, tiered=tiered)
+        latency = time.time() - st
+
+        rankings.append(results)
+        for i, value in enumerate((average_precision(results, relevant_docs),
+                                   len(relevant_docs.intersection(results[:K])) / len(relevant_docs),
+                                   len(relevant_docs.intersection(results)) / len(relevant_docs), latency)):
+            totals[i] += value
+    return rankings, [total / max(len(queries), 1) for total in totals]
+
+if __name__ == '__main__':
+    dictionary_file = postings_file = queries_dir = None
+    K = 10
+    approach = 1
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:p:q:k:a:')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-q':
+            queries_dir = a
+        elif o == '-k':
+            K = int(a)
+        elif o == '-a':
+            approach = int(a)
+        else:
+            assert False, "unhandled option"
+
+    if dictionary_file == None or postings_file == None or queries_dir == None:
+        usage()
+        sys.exit(2)
+
+    # Without a query cache, so that the latency of a query repeated in several query files is measured every time
+    parser = QueryParser(dictionary_file, postings_file, query_cache=QueryCache(max_entries=0))
+    queries = read_queries(queries_dir)
+    champion_size = parser.postings_reader.champion_size
+    print("{} free text queries with relevant documents, champion lists of {} documents".format(len(queries), champion_size))
+
+    exhaustive_rankings, exhaustive_metrics = evaluate(parser, queries, K, approach, False)
+    tiered_rankings, tiered_metrics = evaluate(parser, queries, K, approach, True)
+
+    print("{:<12} {:>8} {:>10} {:>10} {:>12}".format("ranking", "MAP", "R@{}".format(K), "recall", "latency ms"))
+    for name, (mean_ap, recall_at_K, recall, latency) in (("exhaustive", exhaustive_metrics), ("champions", tiered_metrics)):
+        print("{:<12} {:>8.4f} {:>10.4f} {:>10.4f} {:>12.1f}".format(name, mean_ap, recall_at_K, recall, latency * 1000))
+
+    # share of the exhaustive top K that the champion lists also rank in their top K
+    overlap = sum(len(set(a[:K]).intersection(b[:K])) / max(min(K, len(a)), 1) for a, b in zip(exhaustive_rankings, tiered_rankings))
+    print("top {} overlap with exhaustive ranking: {:.4f}".format(K, overlap / max(len(queries), 1)))
@@ -11,12 +11,24 @@ import sys
 import time
 
 from index_vector_space_model import VectorSpaceModel
+from index_segments import add_segment, merge_segments
+from index_files import switch_main_dir
 
 def usage():
     print("usage: " +
-          sys.argv[0] + " -i directory-of-documents -d dictionary-file -p postings-file")
+          sys.argv[0] + " -i directory-of-documents -d dictionary-file -p postings-file [-t] [-b block-size] [-j num-processes] [-m memory-limit-mb] [-f] [-c champion-size] [-w biword-min-df] [-u]")
+    print("       " + sys.argv[0] + " -M -d dictionary-file -p postings-file")
+    print("  -t  write the postings file in the text format (for debugging) instead of binary")
+    print("  -b  number of terms per block of the dictionary (default 4)")
+    print("  -j  number of processes used to tokenize the documents (default 1)")
+    print("  -m  build the index in blocks, flushing postings to disk once about this many MB are held in memory")
+    print("  -f  tokenize with the fast regex tokenizer instead of the NLTK tokenizer, see tokenizer.py")
+    print("  -c  also write the champion list of every term, its champion-size postings with the highest wt,d / doc_len")
+    print("  -w  also write the biword index of every pair of adjacent terms in at least biword-min-df documents")
+    print("  -u  index the documents (e.g. new or changed cases) into a new delta segment of the existing index")
+    print("  -M  merge every delta segment into the main index")
 
-def build_index(in_dir, out_dict, out_postings):
+def build_index(in_dir, out_dict, out_postings, postings_format, block_size, num_workers, memory_limit, tokenizer_mode, champion_size=None, biword_min_doc_freq=None):
     """
     build index from documents stored in the input directory,
     then output the dictionary file and postings file
@@ -25,32 +37,91 @@ def build_index(in_dir, out_dict, out_postings):
 
     # get the start time
     st = time.time()
-    VectorSpaceModel(in_dir, out_dict, out_postings).construct()
+    VectorSpaceModel(in_dir, out_dict, out_postings, postings_format, block_size, num_workers, memory_limit, tokenizer_mode=tokenizer_mode,
+                     champion_size=champion_size, biword_min_doc_freq=biword_min_doc_freq).construct()
+    # the new index replaces the main index of the last merge, if there was one
+    switch_main_dir('.')
     end = time.time()
 
     print("time taken: " + str(end - st))
 
-input_directory = output_file_dictionary = output_file_postings = None
-
-try:
-    opts, args = getopt.getopt(sys.argv[1:], 'i:d:p:')
-except getopt.GetoptError:
-    usage()
-    sys.exit(2)
-
-for o, a in opts:
-    if o == '-i':  # input directory
-        input_directory = a
-    elif o == '-d':  # dictionary file
-        output_file_dictionary = a
-    elif o == '-p':  # postings file
-        output_file_postings = a
-    else:
-        assert False, "unhandled option"
+def update_index(in_dir, out_dict, out_postings, postings_format, block_size, num_workers, memory_limit, tokenizer_mode):
+    """
+    index the documents stored in the input directory into a new delta segment,
+    leaving the main dictionary file and postings file untouched
+    """
+    print('indexing into a delta segment...')
+
+    st = time.time()
+    segment_dir = add_segment(in_dir, out_dict, out_postings, postings_format, block_size, num_workers, memory_limit, tokenizer_mode=tokenizer_mode)
+    end = time.time()
 
-if input_directory == None or output_file_postings == None or output_file_dictionary == None:
-    usage()
-    sys.exit(2)
+    print("added delta segment " + segment_dir)
+    print("time taken: " + str(end - st))
 
-# increaseRecursionLimit()
-build_index(input_directory, output_file_dictionary, output_file_postings)
+def merge_index(out_dict, out_postings):
+    """
+    merge the delta segments into the main dictionary file and postings file
+    """
+    st = time.time()
+    merge_segments(out_dict, out_postings)
+    end = time.time()
+
+    print("time taken: " + str(end - st))
+
+if __name__ == '__main__':
+    input_directory = output_file_dictionary = output_file_postings = None
+    postings_format = 'binary'
+    block_size = 4
+    num_workers = 1
+    memory_limit = None
+    mode = 'build'
+    tokenizer_mode = 'nltk'
+    champion_size = None
+    biword_min_doc_freq = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'i:d:p:tb:j:m:fc:w:uM')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-i':  # input directory
+            input_directory = a
+        elif o == '-d':  # dictionary file
+            output_file_dictionary = a
+        elif o == '-p':  # postings file
+            output_file_postings = a
+        elif o == '-t':  # text postings file
+            postings_format = 'text'
+        elif o == '-b':  # dictionary block size
+            block_size = int(a)
+        elif o == '-j':  # number of processes
+            num_workers = int(a)
+        elif o == '-m':  # memory limit in MB
+            memory_limit = int(float(a) * 1024 * 1024)
+        elif o == '-f':  # fast tokenizer
+            tokenizer_mode = 'fast'
+        elif o == '-c':  # champion list size
+            champion_size = int(a)
+        elif o == '-w':  # biword document frequency threshold
+            biword_min_doc_freq = int(a)
+        elif o == '-u':  # index into a delta segment
+            mode = 'update'
+        elif o == '-M':  # merge the delta segments
+            mode = 'merge'
+        else:
+            assert False, "unhandled option"
+
+    if (input_directory == None and mode != 'merge') or output_file_postings == None or output_file_dictionary == None:
+        usage()
+        sys.exit(2)
+
+    # increaseRecursionLimit()
+    if mode == 'merge':
+        merge_index(output_file_dictionary, output_file_postings)
+    elif mode == 'update':
+        update_index(input_directory, output_file_dictionary, output_file_postings, postings_format, block_size, num_workers, memory_limit, tokenizer_mode)
+    else:
+        build_index(input_directory, output_file_dictionary, output_file_postings, postings_format, block_size, num_workers, memory_limit, tokenizer_mode, champion_size, biword_min_doc_freq)
@@ -0,0 +1,127 @@
+import os
+
+# Fixed name output files, written into index_dir
+OUTPUT_FILES = ("all_doc_ids.txt", "document.txt", "pointers.txt", "positions.txt", "forward_index.txt", "term_stats.txt",
+                "champions.txt", "bitmaps.txt", "biwords.txt", "fields.txt", "index_version.txt")
+
+# Manifest of an index, one directory per line, relative to the index directory: "main <dir>" names the
+# generation directory holding the main index, written by index_segments.merge_segments, the index
+# directory itself if there is none; "retired <dir>" a previous main index or a merged delta segment,
+# still readable by the searches opened before the merge and deleted by the next merge (a retired "."
+# stands for the files of the main index in the index directory); and every other line a delta
+# segment, oldest first. The manifest is replaced in a single rename, so a search opening the index
+# sees either the index before a merge or the one after it.
+SEGMENTS_FILE = "segments.txt"
+
+def is_same_dir(dir1, dir2):
+    """
+    Method to check whether two paths name the same directory, without requiring it to exist
+    """
+    return os.path.abspath(dir1) == os.path.abspath(dir2)
+
+def read_manifest(index_dir='.'):
+    """
+    Method to read the manifest of an index
+
+        Returns:
+            a tuple (main_dir, delta_dirs, retired_dirs) of the directory of the main index, the directories
+            of the delta segments, oldest first, and the retired directories
+    """
+    main_dir, delta_dirs, retired_dirs = index_dir, [], []
+    manifest = os.path.join(index_dir, SEGMENTS_FILE)
+    if not os.path.exists(manifest):
+        return main_dir, delta_dirs, retired_dirs
+    with open(manifest, 'r') as f:
+        for line in f.read().splitlines():
+            kind, _, directory = line.strip().rpartition(' ')
+            if directory == '':
+                continue
+            if kind == 'main':
+                main_dir = os.path.normpath(os.path.join(index_dir, directory))
+            elif kind == 'retired':
+                retired_dirs.append(os.path.normpath(os.path.join(index_dir, directory)))
+            else:
+                delta_dirs.append(os.path.join(index_dir, directory))
+    return main_dir, delta_dirs, retired_dirs
+
+def write_manifest(main_dir, delta_dirs, retired_dirs=(), index_dir='.'):
+    """
+    Method to replace the manifest of an index, the new manifest is written into a temporary
+    file and renamed so that searches never read a partially written manifest. The manifest is
+    removed if the main index is in index_dir and there is nothing else to list.
+    """
+    manifest = os.path.join(index_dir, SEGMENTS_FILE)
+    lines = ([] if is_same_dir(main_dir, index_dir) else ["main " + os.path.relpath(main_dir, index_dir)]) + \
+            ["retired " + os.path.relpath(retired_dir, index_dir) for retired_dir in retired_dirs] + \
+            [os.path.relpath(segment, index_dir) for segment in delta_dirs]
+    if len(lines) == 0:
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        return
+
+    with open(manifest + ".tmp", 'w') as f:
+        f.write("\n".join(lines))
+    os.replace(manifest + ".tmp", manifest)
+
+def switch_main_dir(main_dir, merged_dirs=(), index_dir='.'):
+    """
+    Method to make main_dir the main index of an index, and drop the delta segments merged_dirs from
+    it, in a single replace of the manifest. The previous main index and the merged segments are
+    retired, delta segments added in the meantime are kept.
+    """
+    previous_main_dir, delta_dirs, retired_dirs = read_manifest(index_dir)
+    retired_dirs = [retired_dir for retired_dir in retired_dirs if not is_same_dir(retired_dir, main_dir)]
+    if not is_same_dir(previous_main_dir, main_dir):
+        retired_dirs.append(previous_main_dir)
+    write_manifest(main_dir, [segment for segment in delta_dirs if segment not in merged_dirs], retired_dirs + list(merged_dirs), index_dir)
+
+def read_segments(index_dir='.'):
+    """
+    Method to read the directories of the delta segments of an index from the manifest
+
+        Returns:
+            a list of directories, oldest segment first, empty if the index has no delta segments
+    """
+    return read_manifest(index_dir)[1]
+
+def write_segments(segment_dirs, index_dir='.'):
+    """
+    Method to replace the delta segments of the manifest of an index, keeping its main index and
+    its retired directories
+    """
+    main_dir, _, retired_dirs = read_manifest(index_dir)
+    write_manifest(main_dir, segment_dirs, retired_dirs, index_dir)
+
+def read_main_dir(index_dir='.'):
+    """
+    Method to read the directory of the main index of an index from the manifest
+
+        Returns:
+            the generation directory written by the last merge, or index_dir
+    """
+    return read_manifest(index_dir)[0]
+
+def get_main_file(file_name, main_dir, index_dir='.'):
+    """
+    Method to get the path of a file of the main index, e.g. the dictionary file, given as a path in
+    the index directory
+
+        Returns:
+            file_name if the main index is in index_dir, or else the file of the same name in main_dir
+    """
+    if is_same_dir(main_dir, index_dir):
+        return file_name
+    return os.path.join(main_dir, os.path.basename(file_name))
+
+def read_index_version(index_dir='.'):
+    """
+    Method to read the version of the index of index_dir, see VectorSpaceModel.write_index_version
+
+        Returns:
+            the version, or None if the index has no index_version.txt
+    """
+    version_file = os.path.join(index_dir, "index_version.txt")
+    if not os.path.exists(version_file):
+        return None
+    with open(version_file, 'r') as f:
+        return f.read().strip()
@@ -0,0 +1,382 @@
+import os
+import math
+import struct
+import heapq
+import shutil
+import tempfile
+
+from postings_codec import BIWORDS_MAGIC, CHAMPIONS_MAGIC, decode_champion_offsets, decode_text_postings
+from postings_reader import PostingsReader
+from index_writer import IndexWriter
+from index_vector_space_model import VectorSpaceModel
+from index_files import OUTPUT_FILES, get_main_file, is_same_dir, read_main_dir, read_manifest, read_segments, switch_main_dir, write_manifest, write_segments
+from doc_fields import merge_fields, read_fields, write_fields
+
+def read_documents(document_file):
+    """
+    Method to read document.txt
+
+        Returns:
+            a dictionary, { docID : (len_of_doc, forward_ptr) }, where forward_ptr is None
+            for document.txt files written before the forward index existed
+    """
+    documents = {}
+    with open(document_file, 'r') as f:
+        for docid_length in f.read().split()[1:]:
+            docid_length = docid_length.split(',')
+            forward_ptr = int(docid_length[2]) if len(docid_length) > 2 else None
+            documents[int(docid_length[0])] = (float(docid_length[1]), forward_ptr)
+    return documents
+
+def read_champion_size(index_dir='.'):
+    """
+    Method to read the size of the champion lists of the index of index_dir
+
+        Returns:
+            champion_size, or None if the index has no champions.txt
+    """
+    champions_file = os.path.join(index_dir, "champions.txt")
+    if not os.path.exists(champions_file):
+        return None
+    with open(champions_file, "rb") as f:
+        return decode_champion_offsets(f.read(len(CHAMPIONS_MAGIC) + 8))[0]
+
+def read_biword_min_doc_freq(index_dir='.'):
+    """
+    Method to read the lowest document frequency of the biwords of the index of index_dir
+
+        Returns:
+            biword_min_doc_freq, or None if the index has no biwords.txt
+    """
+    biwords_file = os.path.join(index_dir, "biwords.txt")
+    if not os.path.exists(biwords_file):
+        return None
+    with open(biwords_file, "rb") as f:
+        f.seek(len(BIWORDS_MAGIC))
+        return struct.unpack('<I', f.read(4))[0]
+
+def add_segment(in_dir, out_dict, out_postings, postings_format='binary', block_size=4, num_workers=1, memory_limit=None, index_dir='.', tokenizer_mode='nltk'):
+    """
+    Method to index the documents of in_dir, e.g. newly added or changed cases, into a new delta
+    segment of the index of out_dict and out_postings. The main index is left untouched, and the
+    segment is only added to the manifest once all of its files are written, so search keeps
+    running on the previous segments while the delta is built. The segment has champion lists of
+    the same size as the main index, if it has any.
+
+        Returns:
+            the directory of the new segment
+    """
+    segment_dir = tempfile.mkdtemp(prefix="delta-", dir=index_dir)
+    try:
+        VectorSpaceModel(in_dir, os.path.join(segment_dir, os.path.basename(out_dict)),
+                         os.path.join(segment_dir, os.path.basename(out_postings)),
+                         postings_format, block_size, num_workers, memory_limit, segment_dir, tokenizer_mode,
+                         read_champion_size(read_main_dir(index_dir))).construct()
+    except:
+        shutil.rmtree(segment_dir)
+        raise
+
+    write_segments(read_segments(index_dir) + [segment_dir], index_dir)
+    return segment_dir
+
+def remove_retired(retired_dirs, dict_file, postings_file, index_dir='.'):
+    """
+    Method to delete the retired directories of the manifest, see index_files.SEGMENTS_FILE. A retired
+    index directory only loses the files of the main index, not the manifest nor the delta segments.
+    """
+    for retired_dir in retired_dirs:
+        if is_same_dir(retired_dir, index_dir):
+            for file_name in [dict_file, postings_file] + [os.path.join(index_dir, name) for name in OUTPUT_FILES]:
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+        else:
+            shutil.rmtree(retired_dir, ignore_errors=True)
+
+def merge_segments(dict_file, postings_file, index_dir='.'):
+    """
+    Method to fold every delta segment into the main index. The merged index is written into a new
+    generation directory, and published with a single rename of the manifest naming it as the main
+    index and dropping the merged segments, so search keeps running during the merge: a QueryParser
+    opened before the rename reads the previous main index and the deltas, one opened after it reads
+    the merged index. Segments added while the merge runs are kept. The previous main index and the
+    merged segments are retired, and only deleted by the next merge, so that a QueryParser that read
+    the manifest just before the rename can still open them.
+    """
+    manifest = read_manifest(index_dir)
+    if len(manifest[1]) == 0:
+        print("no delta segments to merge")
+        return
+
+    # the directories retired by the previous merge
+    if len(manifest[2]) != 0:
+        remove_retired(manifest[2], dict_file, postings_file, index_dir)
+        main_dir, delta_dirs, _ = read_manifest(index_dir)
+        write_manifest(main_dir, delta_dirs, (), index_dir)
+        manifest = (main_dir, delta_dirs, [])
+
+    segments = IndexSegments(dict_file, postings_file, index_dir, manifest)
+    main_dir = manifest[0]
+    main_reader = segments.readers[0]
+    postings_format = 'binary' if main_reader.is_binary else 'text'
+    block_size = len(main_reader.lexicon.block_postings_ptrs[0]) if main_reader.lexicon.block_postings_ptrs else 4
+    all_doc_ids = sorted(segments.owners, key=str)
+
+    print("merging {} delta segments into the main index...".format(len(segments.delta_dirs)))
+    merge_dir = tempfile.mkdtemp(prefix="main-", dir=index_dir)
+    try:
+        merged_dict = os.path.join(merge_dir, os.path.basename(dict_file))
+        merged_postings = os.path.join(merge_dir, os.path.basename(postings_file))
+        writer = IndexWriter(merged_dict, merged_postings, postings_format, block_size, len(all_doc_ids), merge_dir,
+                             biword_min_doc_freq=read_biword_min_doc_freq(main_dir))
+
+        doc_term_tfs = {} # { docID : [(termID, tf)...] }
+        for doc_id in all_doc_ids:
+            doc_term_tfs[doc_id] = []
+        doc_ranks = {doc_id: rank for rank, doc_id in enumerate(all_doc_ids)}
+        first_occurrences = [] # (rank of the first document containing the term, first position in it) of each termID
+
+        for term, docs in segments.iter_merged_postings():
+            # docIDs in the same order as a full build, i.e. sorted as strings
+            posting = {}
+            for doc_id in sorted(docs, key=str):
+                posting[(str(doc_id), 1 + math.log(len(docs[doc_id]), 10))] = docs[doc_id]
+            term_id = writer.add_term(term, posting)
+            first_occurrences.append(min((doc_ranks[doc_id], positions[0]) for doc_id, positions in docs.items()))
+            for doc_id, positions in docs.items():
+                doc_term_tfs[doc_id].append((term_id, len(positions)))
+
+        # sum in the order of the first occurrence of each term, like construct_weighted_postings,
+        # so that the merged index is the same as a full build
+        doc_len = {}
+        for doc_id in all_doc_ids:
+            length = 0
+            for term_id, term_freq in sorted(doc_term_tfs[doc_id], key=lambda term_tf: first_occurrences[term_tf[0]]):
+                log_term_freq_weighted = 1 + math.log(term_freq, 10)
+                length += log_term_freq_weighted * log_term_freq_weighted
+            doc_len[str(doc_id)] = math.sqrt(length)
+
+        # the max_score of every term needs the length of the documents, known only once every term is merged
+        max_scores = [0.0] * len(first_occurrences)
+        for doc_id in all_doc_ids:
+            for term_id, term_freq in doc_term_tfs[doc_id]:
+                max_scores[term_id] = max(max_scores[term_id], (1 + math.log(term_freq, 10)) / doc_len[str(doc_id)])
+        writer.close(max_scores)
+
+        model = VectorSpaceModel(None, merged_dict, merged_postings, postings_format, block_size, index_dir=merge_dir,
+                                 champion_size=read_champion_size(main_dir))
+        forward_ptrs = model.write_forward_vectors((str(doc_id), doc_term_tfs[doc_id]) for doc_id in all_doc_ids)
+        model.write_output_document(len(all_doc_ids), doc_len, forward_ptrs)
+        model.write_bitmaps(doc_len, forward_ptrs)
+        if model.champion_size is not None:
+            model.write_champion_lists(doc_len, forward_ptrs)
+        with open(os.path.join(merge_dir, "all_doc_ids.txt"), "w") as file:
+            file.write(" ".join(map(str, all_doc_ids)))
+        fields = segments.get_fields()
+        if fields is not None:
+            write_fields(fields, merge_dir)
+        model.write_index_version()
+    except:
+        shutil.rmtree(merge_dir)
+        raise
+
+    switch_main_dir(merge_dir, segments.delta_dirs, index_dir)
+
+class IndexSegments:
+    """
+    Class that reads the main index and its delta segments as a single index. Every segment is
+    a complete index of its own, written by VectorSpaceModel into its own directory. A document
+    belongs to the newest segment that contains it, so a changed case in a delta overrides the
+    copy of the older segments. Global statistics only count the documents a segment owns:
+    N is the number of distinct documents, and the doc_freq of a term is the sum over the segments
+    of its doc_freq minus the overridden documents that contain it, found through the forward index.
+    """
+
+    def __init__(self, dict_file, postings_file, index_dir='.', manifest=None):
+        """
+        Open every segment of the index of dict_file and postings_file
+
+            Parameters:
+                dict_file: dictionary file of the main index, in index_dir
+                postings_file: postings file of the main index, in index_dir
+                index_dir: directory of the manifest, and of the main index unless the manifest names
+                           another one
+                manifest: the manifest already read with index_files.read_manifest, read from index_dir
+                          if None
+        """
+        main_dir, self.delta_dirs, _ = manifest if manifest is not None else read_manifest(index_dir)
+        self.main_dir = main_dir
+        self.readers = [PostingsReader(get_main_file(dict_file, main_dir, index_dir), get_main_file(postings_file, main_dir, index_dir),
+                                       main_dir)] # segment 0 is the main index
+        self.documents = [read_documents(os.path.join(main_dir, "document.txt"))] # { docID : (len_of_doc, forward_ptr) } of each segment
+        for segment_dir in self.delta_dirs:
+            self.readers.append(PostingsReader(os.path.join(segment_dir, os.path.basename(dict_file)),
+                                               os.path.join(segment_dir, os.path.basename(postings_file)), segment_dir))
+            self.documents.append(read_documents(os.path.join(segment_dir, "document.txt")))
+
+        # Positions of documents from a delta are read from the positional stream of the delta
+        self.positions_readers = [reader.read_positions for reader in self.readers]
+
+        self.owners = {} # { docID : the newest segment containing docID }
+        for segment, documents in enumerate(self.documents):
+            for doc_id in documents:
+                self.owners[doc_id] = segment
+
+        # { termID : number of overridden documents containing the term } of each segment,
+        # None if the segment has overridden documents but no forward index to find their terms
+        self.removed_doc_freqs = []
+        for segment, (reader, documents) in enumerate(zip(self.readers, self.documents)):
+            overridden = [doc_id for doc_id in documents if self.owners[doc_id] != segment]
+            removed = {}
+            if len(overridden) != 0 and reader.forward_buffer is None:
+                removed = None
+            else:
+                for doc_id in overridden:
+                    for term_id, _ in reader.read_doc_term_freqs(documents[doc_id][1]):
+                        removed[term_id] = removed.get(term_id, 0) + 1
+            self.removed_doc_freqs.append(removed)
+
+    '''
+    Returns the DocFields of the documents across the segments, each document taking the fields of
+    the segment owning it, or None if a segment has no fields.txt
+    '''
+    def get_fields(self):
+        segment_fields = [read_fields(reader.index_dir) for reader in self.readers]
+        if any(fields is None for fields in segment_fields):
+            return None
+        return merge_fields(segment_fields, self.owners)
+
+    '''
+    Returns True if the index has at least one delta segment
+    '''
+    def has_deltas(self):
+        return len(self.delta_dirs) != 0
+
+    '''
+    Returns N, the number of distinct documents across the segments
+    '''
+    def get_total_num_docs(self):
+        return len(self.owners)
+
+    '''
+    Returns the length of the document in the vector space, from the segment owning it
+    '''
+    def get_doc_length(self, doc_id):
+        return self.documents[self.owners[doc_id]][doc_id][0]
+
+    '''
+    Returns (reader, forward_ptr) of the term vector of the document, from the segment owning it
+    '''
+    def get_doc_vector_ref(self, doc_id):
+        segment = self.owners[doc_id]
+        return self.readers[segment], self.documents[segment][doc_id][1]
+
+    '''
+    Returns the postings of a segment as returned by PostingsReader.read_postings, decoded into
+    { docID : props } and restricted to the documents the segment owns
+    '''
+    def owned_postings(self, segment, postings):
+        if not isinstance(postings, dict):
+            postings = decode_text_postings(postings)
+
+        owned = {}
+        for doc_id, props in postings.items():
+            if self.owners.get(doc_id) != segment:
+                continue
+            if segment != 0 and 'positions_ptr' in props:
+                props['positions_reader'] = self.positions_readers[segment]
+            owned[doc_id] = props
+        return owned
+
+    '''
+    Returns the postings of the term across the segments, { docID : props }, where the props of
+    documents from a delta also hold the 'positions_reader' of the delta
+    '''
+    def get_postings(self, term):
+        postings = {}
+        for segment, reader in enumerate(self.readers):
+            postings_ptr = reader.get_postings_ptr(term)
+            if postings_ptr == -1:
+                continue
+            postings.update(self.owned_postings(segment, reader.read_postings(postings_ptr)[2]))
+        return postings
+
+    '''
+    Returns the global doc_freq of the term, or 0 if not found
+    '''
+    def get_doc_freq(self, term):
+        doc_freq = 0
+        for segment, reader in enumerate(self.readers):
+            removed = self.removed_doc_freqs[segment]
+            if removed is None:
+                # no forward index, count the owned documents in the postings instead
+                postings_ptr = reader.get_postings_ptr(term)
+                if postings_ptr != -1:
+                    doc_freq += len(self.owned_postings(segment, reader.read_postings(postings_ptr)[2]))
+                continue
+
+            segment_doc_freq = reader.get_doc_freq(term)
+            if segment_doc_freq != 0:
+                doc_freq += segment_doc_freq - removed.get(reader.get_term_id(term), 0)
+        return doc_freq
+
+    '''
+    Returns the idf = log(N/df) of the term over every segment, or 0 if not found
+    '''
+    def get_idf(self, term):
+        doc_freq = self.get_doc_freq(term)
+        if doc_freq == 0:
+            return 0
+        return math.log(self.get_total_num_docs()/doc_freq, 10)
+
+    '''
+    Returns the champion lists of the term across the segments as (docID, tf), restricted to the
+    documents each segment owns, or None if a segment has no champion lists
+    '''
+    def get_champions(self, term):
+        champions = []
+        for segment, reader in enumerate(self.readers):
+            segment_champions = reader.get_champions(term)
+            if segment_champions is None:
+                return None
+            champions += [(doc_id, term_freq) for doc_id, term_freq in segment_champions if self.owners.get(doc_id) == segment]
+        return champions
+
+    '''
+    Returns the highest wt,d / doc_len of the term over every segment, or None if a segment does not
+    store it. Overridden documents are not excluded, so this is an upper bound of the owned postings.
+    '''
+    def get_max_score(self, term):
+        max_scores = [reader.get_max_score(term) for reader in self.readers]
+        if None in max_scores:
+            return None
+        return max(max_scores)
+
+    '''
+    Yields (term, { docID : [position...] }) of every term across the segments, in ascending
+    order of term, restricted to the documents each segment owns. Terms left without any
+    document are skipped.
+    '''
+    def iter_merged_postings(self):
+        def iter_segment(segment):
+            for term, _, postings in self.readers[segment].iter_postings():
+                yield term, segment, postings
+
+        curr_term = None
+        curr_docs = {}
+        # heapq.merge keeps entries of the same term in segment order
+        for term, segment, postings in heapq.merge(*[iter_segment(segment) for segment in range(len(self.readers))],
+                                                   key=lambda entry: entry[0]):
+            if term != curr_term:
+                if len(curr_docs) != 0:
+                    yield curr_term, curr_docs
+                curr_term = term
+                curr_docs = {}
+
+            for doc_id, props in self.owned_postings(segment, postings).items():
+                if 'positions' in props:
+                    curr_docs[doc_id] = props['positions']
+                else:
+                    curr_docs[doc_id] = self.positions_readers[segment](props['positions_ptr'], props['tf'])
+
+        if len(curr_docs) != 0:
+            yield curr_term, curr_docs
@@ -3,9 +3,86 @@ import sys
 import csv
 import math
 import time
-from nltk.tokenize import word_tokenize
-from nltk.tokenize import sent_tokenize
-from nltk.stem.porter import PorterStemmer
+import heapq
+import pickle
+import hashlib
+import shutil
+import tempfile
+import functools
+import multiprocessing
+from tokenizer import NLTK_MODE, get_tokenizer
+from postings_codec import FORWARD_INDEX_MAGIC, encode_bitmaps, encode_champion_lists, encode_forward_vector, decode_forward_term_freqs, decode_term_stats
+from doc_bitmap import CONTAINER_SIZE, DENSE_TERM_RATIO, make_container
+from doc_fields import build_fields, write_fields
+from index_writer import IndexWriter
+from index_files import OUTPUT_FILES
+
+def index_documents(doc_contents, st=None, tokenizer_mode=NLTK_MODE):
+    """
+    Method to tokenize a list of documents and construct their positional index. It is 
+    a module level function so that it can run in worker processes of a parallel build.
+
+        Parameters:
+            doc_contents: a list of (docID, content), sorted in ascending docID
+            st: start time of the indexing, progress is printed every 100 documents if given
+            tokenizer_mode: mode of the Tokenizer, see tokenizer.py
+
+        Returns:
+            terms, term_doc_freq and term_id_pos, where terms and term_id_pos are in order of 
+            the first occurrence of each term, and the docIDs of term_id_pos are in the order of doc_contents
+    """
+    tokenizer = get_tokenizer(tokenizer_mode)
+    terms = {} # a list of terms
+    term_doc_freq = {} # { term : doc_freq }
+    term_id_pos = {} # { term : { docID : [position...] } }
+    count = 0
+
+    for doc_id, text in doc_contents:
+        if (st is not None and count % 100 == 0):
+            print("completed parsing {} number of documents. Parsing next 100 documents...".format(count))
+            end = time.time()
+            print("time taken: " + str(end - st))
+
+        terms_counted = {} # list of terms in doc_id already counted in doc_freq
+        position = 0 # positional index
+        # tokenize, stem and case-fold, skipping empty strings
+        for word_token in tokenizer.tokenize(text):
+            # first unique instance of term in all docs
+            # add word_token into list of terms
+            if word_token not in terms:
+                terms[word_token] = 1
+                term_doc_freq[word_token] = 1 # { term : doc_freq }
+                terms_counted[word_token] = 1
+
+            # check if doc_id is counted in doc_freq
+            if word_token not in terms_counted:
+                term_doc_freq[word_token] += 1 # { term : doc_freq }
+                terms_counted[word_token] = 1
+
+            # add word_token into posting list
+            # value as { term : docID : [position...]}
+            if word_token not in term_id_pos:
+                term_id_pos[word_token] = {}
+                term_id_pos[word_token][doc_id] = list()
+                term_id_pos[word_token][doc_id].append(position)
+            else :
+                if doc_id not in term_id_pos[word_token]:
+                    term_id_pos[word_token][doc_id] = list()
+                    term_id_pos[word_token][doc_id].append(position)
+                else:
+                    term_id_pos[word_token][doc_id].append(position)
+            position += 1
+        count += 1
+
+    return terms, term_doc_freq, term_id_pos
+
+# Estimated memory used by the in-memory index of a block, in bytes, see VectorSpaceModel.construct_blocked
+BLOCK_TERM_BYTES = 300 # a new term in the block: the dict entry, the term and its dict of docIDs
+BLOCK_POSTING_BYTES = 160 # a new docID of a term: the dict entry and the list of positions
+BLOCK_POSITION_BYTES = 36 # a position: the list slot and the int
+
+# Number of documents tokenized at a time by construct_blocked
+BLOCK_SHARD_SIZE = 100
 
 class VectorSpaceModel:
     """
@@ -13,7 +90,9 @@ class VectorSpaceModel:
 
     in_dir: input dataset file containing all documents for indexing
     out_dict: output file written in the form of 
-                    |term1_len|term1|term2_len|term2...
+                    #front-coded
+                    |term1_len|term1|prefix_len|suffix_len|suffix2...|term5_len|term5|prefix_len|suffix_len|suffix6...
+                    where every block of block_size terms is front coded, see postings_codec.encode_front_coded_block
     out_postings: output file written in the form of 
                     term documentFrequency
                     docID,wt,d:position1 position2... gapEncodedID,wt,d:position1 position2...
@@ -22,25 +101,66 @@ class VectorSpaceModel:
                     ...
                     where wt,f = (1 + log(tf)), 
                     where tf is the term frequency of the term t in docID
+                  or, by default, in the binary format written by postings_codec.encode_binary_postings,
+                  where the positions are written into positions.txt
     all_doc_ids.txt: output file containing the ID of all documents, separated by a single space
     document.txt: output file written in the form of 
-                    total_num_of_doc docID,len_of_doc docID,len_of_doc ...
+                    total_num_of_doc docID,len_of_doc,forward_ptr docID,len_of_doc,forward_ptr ...
                     where len_of_doc is the length of the document in vector space 
+                    and forward_ptr points to the term vector of the document in forward_index.txt
+    forward_index.txt: output file containing the term vector of every document, see 
+                    postings_codec.encode_forward_vector, where termID is the position of the term in the dictionary
+    term_stats.txt: output file containing doc_freq, idf, max wt,d, postings length and max score of every term, 
+                    indexed by termID, see postings_codec.encode_term_stats
+    champions.txt: output file containing the champion list of every term, i.e. its champion_size postings
+                    with the highest wt,d / len_of_doc, see postings_codec.encode_champion_lists. 
+                    Only written if champion_size is given.
+    bitmaps.txt: output file containing the documents of every term in more than 1 / DENSE_TERM_RATIO of the
+                    documents as a Roaring-style bitmap, see postings_codec.encode_bitmaps
+    biwords.txt: output file containing the documents of every pair of adjacent terms in at least 
+                    biword_min_doc_freq documents, see postings_codec.encode_biwords.
+                    Only written if biword_min_doc_freq is given.
+    fields.txt: output file containing the court, date and title index of every document, see 
+                    postings_codec.encode_fields
+    index_version.txt: output file containing a checksum of the other output files, written last, 
+                    so that query results cached for a previous index are never reused
     pointers.txt: output file written in the form of
-                    DictPtr,PostingPtr1,PostingPtr2,PostingPtr3,PostingPtr4
-                    DictPtr2,PostingPtr1,PostingPtr2,PostingPtr3,PostingPtr4
+                    DictPtr,PostingPtr1:df1,PostingPtr2:df2,PostingPtr3:df3,PostingPtr4:df4
+                    DictPtr2,PostingPtr1:df1,PostingPtr2:df2,PostingPtr3:df3,PostingPtr4:df4
                     ...
     """
 
-    def __init__(self, in_dir, out_dict, out_postings):
+    def __init__(self, in_dir, out_dict, out_postings, postings_format='binary', block_size=4, num_workers=1, memory_limit=None, index_dir='.', tokenizer_mode=NLTK_MODE, champion_size=None,
+                 biword_min_doc_freq=None):
         """
         Initialise input directory and output files
+
+            Parameters:
+                postings_format: 'binary' for the variable byte encoded postings file, 
+                                 or 'text' for the human readable postings file used for debugging
+                block_size: number of terms per block of the dictionary
+                num_workers: number of processes used to tokenize the documents
+                memory_limit: if given, the estimated number of bytes of postings held in memory before they are 
+                              flushed to disk as a sorted run, see construct_blocked
+                index_dir: directory of all_doc_ids.txt, document.txt, pointers.txt and the other fixed name 
+                           output files, e.g. the directory of a delta segment, see index_segments.py
+                tokenizer_mode: 'nltk', or 'fast' for the regex tokenizer, see tokenizer.py
+                champion_size: if given, the number of postings of every term written into champions.txt
+                biword_min_doc_freq: if given, the lowest document frequency of the biwords written into biwords.txt
         """
         print("initialising vector space model...")
 
         self.in_dir = in_dir
         self.out_dict = out_dict
         self.out_postings = out_postings
+        self.postings_format = postings_format
+        self.block_size = block_size
+        self.num_workers = num_workers
+        self.memory_limit = memory_limit
+        self.index_dir = index_dir
+        self.tokenizer_mode = tokenizer_mode
+        self.champion_size = champion_size
+        self.biword_min_doc_freq = biword_min_doc_freq
     
     def parse_data(self):
         """
@@ -73,10 +193,9 @@ class VectorSpaceModel:
                     break
                 if data[0] in all_doc:
                     prev_data = all_doc[data[0]]
+                    # a case keeps the date_posted and court of its first row
                     prev_data[0] += " " + data[1]
                     prev_data[1] += " " + data[2]
-                    prev_data[2] += " " + data[3]
-                    prev_data[3] += " " + data[4]
                     all_doc[data[0]] = prev_data
                 else:
                     all_doc[data[0]] = data[1:]
@@ -92,7 +211,7 @@ class VectorSpaceModel:
             court[key] = all_doc[key][3]
 
         # Write to a txt file for search to access all doc_ids 
-        with open("all_doc_ids.txt", "w") as file:
+        with open(self.index_file("all_doc_ids.txt"), "w") as file:
             file.write(" ".join(map(str, all_doc_ids)))
 
         print("completed parsing {} number of data".format(len(all_doc)))
@@ -110,14 +229,15 @@ class VectorSpaceModel:
         if os.path.exists(self.out_dict):
             os.remove(self.out_dict)
 
-        if os.path.exists("all_doc_ids.txt"):
-            os.remove("all_doc_ids.txt")
+        for file_name in OUTPUT_FILES:
+            if os.path.exists(self.index_file(file_name)):
+                os.remove(self.index_file(file_name))
 
-        if os.path.exists("document.txt"):
-            os.remove("document.txt")
-
-        if os.path.exists("pointers.txt"):
-            os.remove("pointers.txt")
+    def index_file(self, file_name):
+        """
+        Method to get the path of a fixed name output file, e.g. document.txt, in index_dir
+        """
+        return os.path.join(self.index_dir, file_name)
         
     def construct(self):
         """
@@ -127,64 +247,250 @@ class VectorSpaceModel:
         self.reset_files()
 
         print("constructing index...")
-        stemmer = PorterStemmer()
         all_doc_ids, title, content, date_posted, court = self.parse_data()
         total_num_docs = len(all_doc_ids)
+        doc_contents = [(str(doc_id), content[str(doc_id)]) for doc_id in all_doc_ids]
+        write_fields(build_fields(all_doc_ids, title, date_posted, court, get_tokenizer(self.tokenizer_mode).tokenize), self.index_dir)
+
+        if self.memory_limit is not None:
+            self.construct_blocked(doc_contents, st)
+            self.write_index_version()
+            return
+
+        if self.num_workers > 1:
+            terms, term_doc_freq, term_id_pos = self.construct_parallel(doc_contents, st)
+        else:
+            terms, term_doc_freq, term_id_pos = index_documents(doc_contents, st, self.tokenizer_mode)
+        
+        doc_len, postings = self.construct_weighted_postings(all_doc_ids, term_id_pos)
+        terms = dict(sorted(terms.items()))
+        self.write_output_files(terms, postings, total_num_docs, doc_len)
+        forward_ptrs = self.write_forward_index(all_doc_ids, terms, postings)
+        self.write_output_document(total_num_docs, doc_len, forward_ptrs)
+        self.write_bitmaps(doc_len, forward_ptrs)
+        if self.champion_size is not None:
+            self.write_champion_lists(doc_len, forward_ptrs)
+        self.write_index_version()
+
+    def construct_parallel(self, doc_contents, st):
+        """
+        Method to tokenize the documents with a pool of num_workers processes. The documents are 
+        split into contiguous shards in ascending docID, and the positional index of every shard 
+        is merged in shard order, so that the merged index is the same as the one of a serial build 
+        (down to the order of terms and docIDs) and the output files are identical.
+
+            Parameters:
+                doc_contents: a list of (docID, content), sorted in ascending docID
+                st: start time of the indexing
+
+            Returns:
+                terms, term_doc_freq and term_id_pos, as returned by index_documents
+        """
         terms = {} # a list of terms
         term_doc_freq = {} # { term : doc_freq }
         term_id_pos = {} # { term : { docID : [position...] } }
+
+        # Use a few shards per worker so that long documents do not leave workers idle
+        num_shards = self.num_workers * 4
+        shard_size = max(1, math.ceil(len(doc_contents) / num_shards))
+        shards = [doc_contents[i:i + shard_size] for i in range(0, len(doc_contents), shard_size)]
+
         count = 0
+        with multiprocessing.Pool(self.num_workers) as pool:
+            # imap returns the shards in order
+            for shard_terms, shard_doc_freq, shard_id_pos in pool.imap(functools.partial(index_documents, tokenizer_mode=self.tokenizer_mode), shards):
+                for term in shard_terms:
+                    if term not in terms:
+                        terms[term] = 1
+                        term_doc_freq[term] = shard_doc_freq[term]
+                        term_id_pos[term] = shard_id_pos[term]
+                    else:
+                        term_doc_freq[term] += shard_doc_freq[term]
+                        term_id_pos[term].update(shard_id_pos[term])
+
+                count += 1
+                print("completed parsing {} of {} shards of documents".format(count, len(shards)))
+                end = time.time()
+                print("time taken: " + str(end - st))
 
-        for doc_id in all_doc_ids:
-            if (count % 100 == 0):
-                print("completed parsing {} number of documents. Parsing next 100 documents...".format(count))
+        return terms, term_doc_freq, term_id_pos
+
+    def construct_blocked(self, doc_contents, st):
+        """
+        Method to construct the index within a bounded amount of memory (SPIMI). Documents are 
+        tokenized BLOCK_SHARD_SIZE at a time into an in-memory block, which is written to disk as a 
+        run sorted by term whenever its estimated size reaches memory_limit. The runs are then 
+        k-way merged term by term into an IndexWriter, so that postings, dictionary and pointers 
+        are written incrementally. Only per-term and per-document values (the rank and termID of 
+        every term, and the length of every document) are kept in memory for the whole build.
+
+        The output files are the same as the ones of construct.
+
+            Parameters:
+                doc_contents: a list of (docID, content), sorted in ascending docID
+                st: start time of the indexing
+        """
+        run_dir = tempfile.mkdtemp(prefix="spimi-", dir=self.index_dir)
+        try:
+            run_files, doc_len = self.invert_blocks(doc_contents, run_dir, st)
+            term_ids = self.merge_runs(run_files, len(doc_contents), doc_len)
+
+            # map the terms of every term vector to termIDs, sorted by termID
+            forward_ptrs = self.write_forward_vectors(
+                (doc_id, sorted((term_ids[term], term_freq) for term, term_freq in term_tfs))
+                for doc_id, term_tfs in self.read_run(os.path.join(run_dir, "forward")))
+        finally:
+            shutil.rmtree(run_dir)
+
+        self.write_output_document(len(doc_contents), doc_len, forward_ptrs)
+        self.write_bitmaps(doc_len, forward_ptrs)
+        if self.champion_size is not None:
+            self.write_champion_lists(doc_len, forward_ptrs)
+
+    def invert_blocks(self, doc_contents, run_dir, st):
+        """
+        Method to tokenize all documents into blocks and write every block as a sorted run into
+        run_dir, along with the term vector of every document
+
+            Parameters:
+                doc_contents: a list of (docID, content), sorted in ascending docID
+                run_dir: directory of the runs
+                st: start time of the indexing
+
+            Returns:
+                run_files, a list of the runs in document order, and doc_len, { docID : doc_len }
+        """
+        run_files = []
+        block = {} # { term : { docID : [position...] } }
+        block_bytes = 0 # estimated memory used by block
+        term_ranks = {} # { term : rank of the first occurrence of term in all docs }
+        doc_len = {} # { docID : doc_len, docID : doc_len ... }
+
+        shards = [doc_contents[i:i + BLOCK_SHARD_SIZE] for i in range(0, len(doc_contents), BLOCK_SHARD_SIZE)]
+        pool = multiprocessing.Pool(self.num_workers) if self.num_workers > 1 else None
+        index_shard = functools.partial(index_documents, tokenizer_mode=self.tokenizer_mode)
+        shard_results = pool.imap(index_shard, shards) if pool is not None else map(index_shard, shards)
+
+        with open(os.path.join(run_dir, "forward"), "wb") as forward_file:
+            for shard, (shard_terms, shard_doc_freq, shard_id_pos) in zip(shards, shard_results):
+                doc_term_tfs = {} # { docID : [(rank, term, tf)...] }
+                for doc_id, _ in shard:
+                    doc_term_tfs[doc_id] = []
+
+                for term in shard_terms:
+                    if term not in term_ranks:
+                        term_ranks[term] = len(term_ranks)
+                    if term not in block:
+                        block[term] = {}
+                        block_bytes += BLOCK_TERM_BYTES
+
+                    for doc_id, positions in shard_id_pos[term].items():
+                        doc_term_tfs[doc_id].append((term_ranks[term], term, len(positions)))
+                        block_bytes += BLOCK_POSTING_BYTES + BLOCK_POSITION_BYTES * len(positions)
+                    block[term].update(shard_id_pos[term])
+
+                for doc_id, _ in shard:
+                    # sum in the order of the first occurrence of each term, like construct_weighted_postings
+                    term_tfs = sorted(doc_term_tfs[doc_id])
+                    length = 0
+                    for _, _, term_freq in term_tfs:
+                        log_term_freq_weighted = 1 + math.log(term_freq, 10)
+                        length += log_term_freq_weighted * log_term_freq_weighted
+                    doc_len[doc_id] = math.sqrt(length)
+                    pickle.dump((doc_id, [(term, term_freq) for _, term, term_freq in term_tfs]), forward_file)
+
+                print("completed parsing {} number of documents".format(len(doc_len)))
                 end = time.time()
                 print("time taken: " + str(end - st))
 
-            doc_id = str(doc_id)
-            terms_counted = {} # list of terms in doc_id already counted in doc_freq
-            position = 0 # positional index
-            doc_content = content[doc_id].split("\n")
-            for line in doc_content:
-                for sentence_token in sent_tokenize(line):
-                    for word_token in word_tokenize(sentence_token):
-                        # stem and case-folding
-                        word_token = stemmer.stem(word_token).lower()
-                        # skip empty strings
-                        if len(word_token) == 0:
-                            continue
-                        else:
-                            # first unique instance of term in all docs
-                            # add word_token into list of terms
-                            if word_token not in terms:
-                                terms[word_token] = 1
-                                term_doc_freq[word_token] = 1 # { term : doc_freq }
-                                terms_counted[word_token] = 1
-
-                            # check if doc_id is counted in doc_freq
-                            if word_token not in terms_counted:
-                                term_doc_freq[word_token] += 1 # { term : doc_freq }
-                                terms_counted[word_token] = 1
-                            
-                            # add word_token into posting list
-                            # value as { term : docID : [position...]}
-                            if word_token not in term_id_pos:
-                                term_id_pos[word_token] = {}
-                                term_id_pos[word_token][doc_id] = list()
-                                term_id_pos[word_token][doc_id].append(position)
-                            else :
-                                if doc_id not in term_id_pos[word_token]:
-                                    term_id_pos[word_token][doc_id] = list()
-                                    term_id_pos[word_token][doc_id].append(position)
-                                else:
-                                    term_id_pos[word_token][doc_id].append(position)
-                            position += 1
-            count += 1
-        
-        doc_len, postings = self.construct_weighted_postings(all_doc_ids, term_id_pos)
-        terms = dict(sorted(terms.items()))
-        self.write_output_files(terms, term_doc_freq, postings)
-        self.write_output_document(total_num_docs, doc_len)
+                if block_bytes >= self.memory_limit:
+                    run_files.append(self.write_run(block, run_dir, len(run_files)))
+                    block = {}
+                    block_bytes = 0
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if len(block) != 0:
+            run_files.append(self.write_run(block, run_dir, len(run_files)))
+
+        return run_files, doc_len
+
+    def write_run(self, block, run_dir, run_num):
+        """
+        Method to write a block into run_dir as a run of (term, { docID : [position...] }), sorted by term
+
+            Returns:
+                the path of the run
+        """
+        run_file = os.path.join(run_dir, "run{}".format(run_num))
+        print("writing run {} with {} terms...".format(run_num, len(block)))
+        with open(run_file, "wb") as f:
+            for term in sorted(block):
+                pickle.dump((term, block[term]), f, pickle.HIGHEST_PROTOCOL)
+        return run_file
+
+    def read_run(self, run_file):
+        """
+        Method to read back the entries of a run, one at a time
+        """
+        with open(run_file, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def merge_runs(self, run_files, total_num_docs, doc_len):
+        """
+        Method to k-way merge the runs and write the postings of every term into the output files
+
+            Parameters:
+                run_files: a list of the runs in document order
+                total_num_docs: an int, N
+                doc_len: a dictionary { docID : doc_len }
+
+            Returns:
+                term_ids, a dictionary { term : termID }
+        """
+        print("merging {} runs...".format(len(run_files)))
+        writer = IndexWriter(self.out_dict, self.out_postings, self.postings_format, self.block_size, total_num_docs, self.index_dir, doc_len,
+                             self.biword_min_doc_freq)
+        term_ids = {}
+        curr_term = None
+        curr_docs = None # { docID : [position...] } of curr_term across runs
+
+        # heapq.merge keeps entries of the same term in run order, i.e. in ascending docID
+        for term, docs in heapq.merge(*[self.read_run(run_file) for run_file in run_files], key=lambda entry: entry[0]):
+            if term == curr_term:
+                curr_docs.update(docs)
+                continue
+            if curr_term is not None:
+                term_ids[curr_term] = writer.add_term(curr_term, self.weight_postings(curr_docs))
+            curr_term = term
+            curr_docs = docs
+
+        if curr_term is not None:
+            term_ids[curr_term] = writer.add_term(curr_term, self.weight_postings(curr_docs))
+        writer.close()
+
+        return term_ids
+
+    def weight_postings(self, docs):
+        """
+        Method to calculate the weighted tf = 1 + log(term_frequency) of the postings of a term
+
+            Parameter:
+                docs: a dictionary, { docID : [position...] }
+
+            Returns:
+                a dictionary, { (docID,weightedtf) : [position...] }
+        """
+        posting = {}
+        for doc_id, positions in docs.items():
+            posting[(doc_id, 1 + math.log(len(positions), 10))] = positions
+        return posting
 
     def construct_weighted_postings(self, all_doc_ids, term_id_pos):
         """
@@ -225,110 +531,163 @@ class VectorSpaceModel:
         
         return doc_len, postings
 
-    def write_output_files(self, terms, term_doc_freq, postings):
+    def write_output_files(self, terms, postings, total_num_docs, doc_len):
         """
-        Method to write into out_dict, out_postings and pointers.txt files
+        Method to write into out_dict, out_postings, positions.txt, pointers.txt and term_stats.txt files
 
             Parameters:
                 terms: a dictionary with key as string, sorted in ascending alphanumeric order
-                term_doc_freq: a dictionary with string as key and int as value, { term : doc_freq }
                 postings: a dictionary with string as key and dictionary as value, { term : (docID,weightedtf) : [position...] }
-                
+                total_num_docs: an int, N
+                doc_len: a dictionary { docID : doc_len }
         """
-        print("preapring content for dictionary, postings and documents output files...")
-
-        final_dictionary = "" # |term1_len|term1|term2_len|term2...
-        final_postings = "" # term documentFrequency docID,wt,d:position1 position2... gapEncodedID,wt,d:position1 position2...
-        final_pointers = "" # dict_ptr,posting_ptr1,posting_ptr2,posting_ptr3,posting_ptr4 ...
-        acc_dictionary_content = "" # accumulated temporary dictionary content for every 4 terms 
-        posting_ref = 0 # reference pointer pointing to postings file 
-        dictionary_ref = 0 # reference pointer pointing to dictionary file
-        block_size = 4 # index compression blocking size
-        posting_pointer = list()
+        print("writing to dictionary, postings and pointers output files...")
 
+        writer = IndexWriter(self.out_dict, self.out_postings, self.postings_format, self.block_size, total_num_docs, self.index_dir, doc_len,
+                             self.biword_min_doc_freq)
         for term in terms:
             # postings = { term : { (docID,weightedtf) : [position...] } }
-            posting = postings[term] # { (docID,weightedtf) : [position...] }
-            doc_freq = str(term_doc_freq[term]) # { term : doc_freq }
-            posting_content = ""
-            dictionary_content = ""
-            dict_post_pointer = ""
-            prev_id = 0
-
-            for docID_weighted, positions in posting.items():
-                doc_id = int(docID_weighted[0])
-                gap_encoded_id = doc_id - prev_id
-                weightedtf = str(docID_weighted[1])
-
-                position = ""
-                prev_pos = 0
-                for pos in positions:
-                    position += str(pos-prev_pos) + "," # gap encoded positions
-                    prev_pos = pos
-
-                position = position[:-1] # remove last comma
-                posting_content += " {},{}:{}".format(gap_encoded_id, weightedtf, position) 
-
-                prev_id = doc_id
-
-            # construct new posting content
-            new_posting = "{} {}{}\n".format(term, doc_freq, posting_content) 
-
-            # update posting pointers and final posting content
-            posting_pointer.append(posting_ref)
-            posting_ref += len(new_posting.encode('utf-8'))
-            final_postings += new_posting
-
-            # update temporary dictionary content
-            if (len(posting_pointer) < block_size):
-                dictionary_content = "|{}|{}".format(str(len(term.encode('utf-8'))), term)
-                acc_dictionary_content += dictionary_content
-            
-            # for every 4 terms, update final dictionary and pointers content
-            else:
-                # update temporary dictionary content
-                dictionary_content = "|{}|{}".format(str(len(term.encode('utf-8'))), term)
-                acc_dictionary_content += dictionary_content
-                final_dictionary += acc_dictionary_content
-
-                # construct pointers content and update final pointers content
-                posting_ref_content = ','.join(str(e) for e in posting_pointer)
-                dict_post_pointer = " {},{}".format(dictionary_ref, posting_ref_content)
-                dictionary_ref += len(acc_dictionary_content.encode('utf-8'))
-                final_pointers += dict_post_pointer
-
-                # reset values 
-                posting_pointer = list()
-                acc_dictionary_content = ""
-        
-        # add last few terms into output files content
-        if (len(posting_pointer) != 0):
-            posting_ref_content = ','.join(str(e) for e in posting_pointer)
-            dict_post_pointer = " {},{}".format(dictionary_ref, posting_ref_content)
-            dictionary_ref += len(final_dictionary.encode('utf-8'))
-            final_pointers += dict_post_pointer
-            posting_pointer = list()
-
-        # write out into final dictionary, postings and pointers files
-        print("writing to output files...")
-        self.write_content(self.out_dict, final_dictionary)
-        self.write_content(self.out_postings, final_postings)
-        self.write_content("pointers.txt", final_pointers)
-
-    def write_output_document(self, total_num_docs, doc_len):
+            writer.add_term(term, postings[term])
+        writer.close()
+
+    def write_forward_index(self, all_doc_ids, terms, postings):
+        """
+        Method to write the term vector of every document into forward_index.txt, so that 
+        pseudo relevance feedback only reads the vectors of the feedback documents
+
+            Parameters:
+                all_doc_ids: a list of all document ids sorted in ascending order
+                terms: a dictionary with key as string, sorted in ascending alphanumeric order
+                postings: a dictionary with string as key and dictionary as value, { term : (docID,weightedtf) : [position...] }
+
+            Returns:
+                forward_ptrs, a dictionary { docID : pointer to the term vector in forward_index.txt }
+        """
+        doc_term_tfs = {} # { docID : [(termID, tf)...] }
+        for doc_id in all_doc_ids:
+            doc_term_tfs[doc_id] = []
+
+        # termIDs are assigned in dictionary order, so every term vector is sorted by termID
+        for term_id, term in enumerate(terms):
+            for docID_weighted, positions in postings[term].items():
+                doc_term_tfs[docID_weighted[0]].append((term_id, len(positions)))
+
+        return self.write_forward_vectors((doc_id, doc_term_tfs[doc_id]) for doc_id in all_doc_ids)
+
+    def write_forward_vectors(self, doc_vectors):
+        """
+        Method to write term vectors into forward_index.txt, one document at a time
+
+            Parameters:
+                doc_vectors: an iterable of (docID, [(termID, tf)...]), with every term vector sorted by termID
+
+            Returns:
+                forward_ptrs, a dictionary { docID : pointer to the term vector in forward_index.txt }
+        """
+        print("writing to forward_index.txt file")
+        forward_ptrs = {}
+        with open(self.index_file("forward_index.txt"), "wb") as f:
+            f.write(FORWARD_INDEX_MAGIC)
+            forward_ref = len(FORWARD_INDEX_MAGIC) # reference pointer pointing to forward index file
+            for doc_id, term_tfs in doc_vectors:
+                forward_vector = encode_forward_vector(term_tfs)
+                forward_ptrs[doc_id] = forward_ref
+                forward_ref += len(forward_vector)
+                f.write(forward_vector)
+
+        return forward_ptrs
+
+    def write_output_document(self, total_num_docs, doc_len, forward_ptrs):
         """
         Method to write to document.txt file
         """
-        final_document = "" # totalNumDocs docID,lenOfDoc docID,lenOfDoc ...
+        final_document = "" # totalNumDocs docID,lenOfDoc,forwardPtr docID,lenOfDoc,forwardPtr ...
         final_document += str(total_num_docs)
 
         for doc_id in doc_len:
-            final_document += " {},{}".format(str(doc_id), str(doc_len[doc_id]))
+            final_document += " {},{},{}".format(str(doc_id), str(doc_len[doc_id]), forward_ptrs[doc_id])
 
         # write out into final document file
         print("writing to document.txt file")
-        self.write_content("document.txt", final_document)
+        self.write_content(self.index_file("document.txt"), final_document)
         
+    def write_bitmaps(self, doc_len, forward_ptrs):
+        """
+        Method to write the documents of the dense terms, i.e. the terms in more than 1 / DENSE_TERM_RATIO
+        of the documents, into bitmaps.txt. Documents are numbered by their index in the docIDs sorted in
+        ascending order, the document table of QueryParser, and gathered from the term vectors of
+        forward_index.txt like the champion lists.
+
+            Parameters:
+                doc_len: a dictionary { docID : doc_len }
+                forward_ptrs: a dictionary { docID : pointer to the term vector in forward_index.txt }
+        """
+        print("writing to bitmaps.txt file")
+        with open(self.index_file("term_stats.txt"), "rb") as f:
+            doc_freqs = decode_term_stats(f.read())[0]
+        with open(self.index_file("forward_index.txt"), "rb") as f:
+            forward_index = f.read()
+
+        dense_indices = {term_id: [] for term_id, doc_freq in enumerate(doc_freqs) if doc_freq * DENSE_TERM_RATIO > len(doc_len)}
+        for index, doc_id in enumerate(sorted(doc_len, key=int)):
+            for term_id, _ in decode_forward_term_freqs(forward_index, forward_ptrs[doc_id]):
+                if term_id in dense_indices:
+                    dense_indices[term_id].append(index)
+
+        bitmaps = []
+        for term_id, indices in dense_indices.items():
+            containers = {}
+            for index in indices:
+                containers.setdefault(index // CONTAINER_SIZE, []).append(index % CONTAINER_SIZE)
+            bitmaps.append((term_id, {key: make_container(values) for key, values in containers.items()}))
+        with open(self.index_file("bitmaps.txt"), "wb") as f:
+            f.write(encode_bitmaps(len(doc_len), bitmaps))
+
+    def write_champion_lists(self, doc_len, forward_ptrs):
+        """
+        Method to write the champion list of every term into champions.txt, i.e. the champion_size
+        documents of its postings with the highest wt,d / len_of_doc, ties going to the lower docID. 
+        The champion lists are gathered from the term vectors of forward_index.txt, one document at 
+        a time, so that every build (and the merge of delta segments) writes them the same way.
+
+            Parameters:
+                doc_len: a dictionary { docID : doc_len }
+                forward_ptrs: a dictionary { docID : pointer to the term vector in forward_index.txt }
+        """
+        print("writing to champions.txt file")
+        with open(self.index_file("forward_index.txt"), "rb") as f:
+            forward_index = f.read()
+
+        champions = [] # min-heap of (wt,d / len_of_doc, -docID, tf) of every termID
+        for doc_id in doc_len:
+            for term_id, term_freq in decode_forward_term_freqs(forward_index, forward_ptrs[doc_id]):
+                while len(champions) <= term_id:
+                    champions.append([])
+                entry = ((1 + math.log(term_freq, 10)) / doc_len[doc_id], -int(doc_id), term_freq)
+                if len(champions[term_id]) < self.champion_size:
+                    heapq.heappush(champions[term_id], entry)
+                elif entry > champions[term_id][0]:
+                    heapq.heapreplace(champions[term_id], entry)
+
+        champion_lists = [sorted((-neg_doc_id, term_freq) for _, neg_doc_id, term_freq in entries) for entries in champions]
+        with open(self.index_file("champions.txt"), "wb") as f:
+            f.write(encode_champion_lists(self.champion_size, champion_lists))
+
+    def write_index_version(self):
+        """
+        Method to write index_version.txt, the SHA-1 checksum of the dictionary, the postings and the
+        other output files, so that an index rebuilt from the same documents keeps its version
+        """
+        checksum = hashlib.sha1()
+        for file_name in [self.out_dict, self.out_postings] + [self.index_file(name) for name in OUTPUT_FILES if name != "index_version.txt"]:
+            if not os.path.exists(file_name):
+                continue
+            checksum.update(os.path.basename(file_name).encode('utf-8'))
+            with open(file_name, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    checksum.update(chunk)
+        self.write_content(self.index_file("index_version.txt"), checksum.hexdigest())
+
     def write_content(self, out_file, content):
         """
         Method to write content into file
@@ -340,4 +699,3 @@ class VectorSpaceModel:
         f = open(out_file, "w")
         f.write(content)
         f.close()
-
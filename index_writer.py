@@ -0,0 +1,196 @@
+import math
+import os
+from array import array
+
+import numpy as np
+
+from postings_codec import BINARY_POSTINGS_MAGIC, BINARY_POSITIONS_MAGIC, FRONT_CODED_DICTIONARY_HEADER
+from postings_codec import encode_binary_postings, encode_biwords, encode_front_coded_block, encode_term_stats, encode_text_postings
+
+class IndexWriter:
+    """
+    Class that writes the dictionary, postings, positions.txt, pointers.txt and term_stats.txt
+    files incrementally, one term at a time, so that the output never has to be held in memory.
+    Terms must be added in ascending alphanumeric order, and the termID of a term is the
+    number of terms added before it.
+
+    With biword_min_doc_freq, the writer also writes biwords.txt, the documents of every pair of
+    adjacent terms in at least biword_min_doc_freq documents. The terms of a biword are in at least
+    as many documents, so only the positions of those terms are kept until close, one int per position.
+    """
+
+    def __init__(self, out_dict, out_postings, postings_format, block_size, total_num_docs, index_dir='.', doc_len=None,
+                 biword_min_doc_freq=None):
+        """
+        Initialise the output files
+
+            Parameters:
+                out_dict: dictionary file
+                out_postings: postings file
+                postings_format: 'binary' or 'text'
+                block_size: number of terms per block of the dictionary
+                total_num_docs: an int, N, used for the idf of each term
+                index_dir: directory of positions.txt, pointers.txt and term_stats.txt
+                doc_len: a dictionary { docID : doc_len }, used for the max_score of each term. 
+                         Without it the max_scores must be given to close.
+                biword_min_doc_freq: if given, the lowest document frequency of the biwords written into biwords.txt
+        """
+        self.block_size = block_size
+        self.total_num_docs = total_num_docs
+        self.is_binary = postings_format == 'binary'
+        self.index_dir = index_dir
+        self.doc_len = doc_len
+        self.biword_min_doc_freq = biword_min_doc_freq
+
+        self.dict_file = open(out_dict, "wb")
+        self.postings_file = open(out_postings, "wb")
+        self.pointers_file = open(os.path.join(index_dir, "pointers.txt"), "w")
+        self.positions_file = open(os.path.join(index_dir, "positions.txt"), "wb") if self.is_binary else None
+
+        self.dict_file.write(FRONT_CODED_DICTIONARY_HEADER)
+        self.dictionary_ref = len(FRONT_CODED_DICTIONARY_HEADER) # reference pointer pointing to dictionary file
+        self.posting_ref = 0 # reference pointer pointing to postings file
+        self.positions_ref = 0 # reference pointer pointing to positions file
+        if self.is_binary:
+            self.postings_file.write(BINARY_POSTINGS_MAGIC)
+            self.positions_file.write(BINARY_POSITIONS_MAGIC)
+            self.posting_ref = len(BINARY_POSTINGS_MAGIC)
+            self.positions_ref = len(BINARY_POSITIONS_MAGIC)
+
+        self.block_terms = list() # terms of the current block
+        self.posting_pointer = list() # posting_ptr:doc_freq of the current block
+
+        # per-term statistics indexed by termID, for term_stats.txt
+        self.doc_freqs = []
+        self.idfs = []
+        self.max_weights = []
+        self.postings_lengths = []
+        self.max_scores = []
+
+        # { docID : array of the termID at every position, -1 for terms in fewer than biword_min_doc_freq documents }
+        self.doc_term_ids = {}
+
+    def add_term(self, term, posting):
+        """
+        Method to write the postings of the next term, and its dictionary and pointers
+        content once its block is complete
+
+            Parameters:
+                term: a string
+                posting: a dictionary, { (docID,weightedtf) : [position...] }
+
+            Returns:
+                the termID of the term
+        """
+        doc_freq = len(posting)
+
+        # construct new posting content
+        if self.is_binary:
+            new_posting, new_positions = encode_binary_postings(term, doc_freq, posting, self.positions_ref)
+            self.positions_file.write(new_positions)
+            self.positions_ref += len(new_positions)
+        else:
+            new_posting = encode_text_postings(term, str(doc_freq), posting).encode('utf-8')
+
+        # update posting pointers and write posting content
+        self.posting_pointer.append("{}:{}".format(self.posting_ref, doc_freq))
+        self.postings_file.write(new_posting)
+        self.posting_ref += len(new_posting)
+        self.block_terms.append(term)
+
+        self.doc_freqs.append(doc_freq)
+        self.idfs.append(math.log(self.total_num_docs/doc_freq, 10))
+        self.max_weights.append(max(docID_weighted[1] for docID_weighted in posting))
+        self.postings_lengths.append(len(new_posting))
+        if self.doc_len is not None:
+            self.max_scores.append(max(docID_weighted[1] / self.doc_len[docID_weighted[0]] for docID_weighted in posting))
+        if self.biword_min_doc_freq is not None and doc_freq >= self.biword_min_doc_freq:
+            self.add_biword_positions(len(self.doc_freqs) - 1, posting)
+
+        # for every block_size terms, write dictionary and pointers content
+        if (len(self.block_terms) == self.block_size):
+            self.write_block()
+
+        return len(self.doc_freqs) - 1
+
+    def add_biword_positions(self, term_id, posting):
+        """
+        Method to record the termID at the positions of a term in every document of its postings
+        """
+        for docID_weighted, positions in posting.items():
+            term_ids = self.doc_term_ids.get(docID_weighted[0])
+            if term_ids is None:
+                term_ids = self.doc_term_ids[docID_weighted[0]] = array('i')
+            if len(term_ids) <= positions[-1]:
+                term_ids.extend([-1] * (positions[-1] + 1 - len(term_ids)))
+            for position in positions:
+                term_ids[position] = term_id
+
+    def write_biwords(self):
+        """
+        Method to write biwords.txt: the pairs of termIDs at consecutive positions of every document
+        are counted once per document, and the pairs in at least biword_min_doc_freq documents are
+        written with their documents, see postings_codec.encode_biwords
+        """
+        num_terms = len(self.doc_freqs)
+        doc_keys = [] # distinct termID1 * num_terms + termID2 of every document
+        doc_ids = []
+        for doc_id in sorted(self.doc_term_ids, key=int):
+            term_ids = np.frombuffer(self.doc_term_ids[doc_id], dtype=np.int32).astype(np.int64)
+            adjacent = (term_ids[:-1] >= 0) & (term_ids[1:] >= 0)
+            keys = np.unique(term_ids[:-1][adjacent] * num_terms + term_ids[1:][adjacent])
+            doc_keys.append(keys)
+            doc_ids.append(np.full(len(keys), int(doc_id), dtype=np.int64))
+        self.doc_term_ids = {}
+
+        biwords = []
+        if len(doc_keys) != 0:
+            keys, doc_ids = np.concatenate(doc_keys), np.concatenate(doc_ids)
+            unique_keys, doc_freqs = np.unique(keys, return_counts=True)
+            frequent = np.isin(keys, unique_keys[doc_freqs >= self.biword_min_doc_freq])
+            keys, doc_ids = keys[frequent], doc_ids[frequent]
+            # documents were added in increasing docID, so a stable sort keeps them in order within a biword
+            order = np.argsort(keys, kind='stable')
+            keys, doc_ids = keys[order], doc_ids[order]
+            starts = np.flatnonzero(np.diff(keys, prepend=-1))
+            for start, end in zip(starts.tolist(), np.append(starts[1:], len(keys)).tolist()):
+                key = int(keys[start])
+                biwords.append((key // num_terms, key % num_terms, doc_ids[start:end].tolist()))
+
+        with open(os.path.join(self.index_dir, "biwords.txt"), "wb") as f:
+            f.write(encode_biwords(self.biword_min_doc_freq, biwords))
+
+    def write_block(self):
+        """
+        Method to write the front coded dictionary content and the pointers of the current block
+        """
+        dictionary_content = encode_front_coded_block(self.block_terms)
+        self.dict_file.write(dictionary_content)
+        self.pointers_file.write(" {},{}".format(self.dictionary_ref, ','.join(self.posting_pointer)))
+        self.dictionary_ref += len(dictionary_content)
+
+        # reset values
+        self.block_terms = list()
+        self.posting_pointer = list()
+
+    def close(self, max_scores=None):
+        """
+        Method to write the last few terms, term_stats.txt and biwords.txt, and close all output files
+
+            Parameters:
+                max_scores: a list of float, the highest wt,d / doc_len of each term, for writers
+                            created without doc_len
+        """
+        if (len(self.block_terms) != 0):
+            self.write_block()
+
+        for f in (self.dict_file, self.postings_file, self.pointers_file, self.positions_file):
+            if f is not None:
+                f.close()
+
+        with open(os.path.join(self.index_dir, "term_stats.txt"), "wb") as f:
+            f.write(encode_term_stats(self.doc_freqs, self.idfs, self.max_weights, self.postings_lengths,
+                                      max_scores if max_scores is not None else self.max_scores))
+
+        if self.biword_min_doc_freq is not None:
+            self.write_biwords()
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+import sys
+import time
+import random
+import bisect
+import getopt
+
+# python3 phrase_matcher.py -d dictionary.txt -p postings.txt -i dataset.csv
+#
+# Matches phrases against a positional index: the documents of a phrase are found by intersecting the
+# postings of its terms from the rarest term, and in every common document the candidate starts of the
+# phrase, taken from the positions of its rarest term, are checked against the positions of the other
+# terms, rarest first. The __main__ of this module benchmarks the matching against checking every pair
+# of adjacent terms on its own.
+
+def term_freq(props):
+    """
+    Method to get the number of positions of a posting, without decoding them
+    """
+    return props['tf'] if 'tf' in props else len(props['positions'])
+
+def contains_all(positions, targets):
+    """
+    Method to check which of an ascending list of targets are in an ascending list of positions, with a
+    binary search of the positions after the previous target
+
+        Returns:
+            a generator of bool, one per target
+    """
+    lo = 0
+    for target in targets:
+        lo = bisect.bisect_left(positions, target, lo)
+        yield lo < len(positions) and positions[lo] == target
+
+def first_match(offsets, get_positions):
+    """
+    Method to find the first occurrence of a phrase in a document
+
+        Parameters:
+            offsets: a list of (term, offsets of the term in the phrase), one per distinct term of the
+                     phrase, rarest term in the document first
+            get_positions: a function returning the ascending list of positions of a term in the document
+
+        Returns:
+            the position of the first term of the phrase, or -1 if the phrase is not in the document
+    """
+    # The phrase starts at s if s + i is a position of the i-th term of the phrase for every i. The
+    # candidate starts come from the rarest term, and every other offset of a term keeps the candidates
+    # it confirms, so the positions of common terms are only decoded while there are candidates left.
+    term, term_offsets = offsets[0]
+    decoded = {term: get_positions(term)}
+    starts = [position - term_offsets[0] for position in decoded[term]]
+    checks = [(term, i) for i in term_offsets[1:]] + [(term, i) for term, term_offsets in offsets[1:] for i in term_offsets]
+
+    for k, (term, i) in enumerate(checks, 1):
+        if term not in decoded:
+            decoded[term] = get_positions(term)
+        found = contains_all(decoded[term], [start + i for start in starts])
+        if k == len(checks):
+            # the last check stops at the first start it confirms
+            return next((start for start, is_found in zip(starts, found) if is_found), -1)
+        starts = [start for start, is_found in zip(starts, found) if is_found]
+        if len(starts) == 0:
+            return -1
+    return starts[0] if len(starts) != 0 else -1
+
+def match_phrase(phrase, get_postings_list, candidates=None):
+    """
+    Method to find the documents containing the terms of a phrase at consecutive positions
+
+        Parameters:
+            phrase: a list of terms
+            get_postings_list: a function returning the Posting of a term, e.g. QueryParser.get_postings_list
+            candidates: if given, the only docIDs to check, e.g. the documents of the other operands of
+                        a boolean query
+
+        Returns:
+            a set of docIDs
+    """
+    postings = {}
+    offsets = {}
+    for i, term in enumerate(phrase):
+        if term not in postings:
+            postings[term] = get_postings_list(term)
+            offsets[term] = []
+            if len(postings[term].postings) == 0:
+                return set()
+        offsets[term].append(i)
+
+    # Check the documents of the rarest term against the postings of the other terms, rarest first
+    rarest = sorted(postings, key=lambda term: len(postings[term].postings))
+    others = [postings[term].postings for term in rarest[1:]]
+    if candidates is None:
+        candidates = postings[rarest[0]].postings
+    else:
+        others.insert(0, postings[rarest[0]].postings)
+    valid_docs = set()
+    for doc_id in candidates:
+        if not all(doc_id in other for other in others):
+            continue
+        if len(phrase) == 1:
+            valid_docs.add(doc_id)
+            continue
+
+        # Order the terms by their number of positions in the document, known without decoding them
+        doc_offsets = sorted(offsets.items(), key=lambda item: term_freq(postings[item[0]].postings[doc_id]))
+        if first_match(doc_offsets, lambda term: postings[term].get_positions(doc_id)) != -1:
+            valid_docs.add(doc_id)
+    return valid_docs
+
+def match_phrase_at(phrase, cursors, read_positions, candidates):
+    """
+    Method to find the documents of candidates containing the terms of a phrase at consecutive
+    positions, reading the tf and the positions of every term in a candidate through a cursor over
+    its postings instead of decoding its postings list
+
+        Parameters:
+            phrase: a list of terms
+            cursors: a dictionary { term : SkipCursor } of every distinct term of the phrase
+            read_positions: a function returning the positions of a posting given its positions_ptr and
+                            tf, e.g. PostingsReader.read_positions
+            candidates: an ascending list of docIDs
+
+        Returns:
+            a set of docIDs
+    """
+    offsets = {}
+    for i, term in enumerate(phrase):
+        offsets.setdefault(term, []).append(i)
+
+    valid_docs = set()
+    for doc_id in candidates:
+        if not all(cursor.advance(doc_id) == doc_id for cursor in cursors.values()):
+            continue
+        if len(phrase) == 1:
+            valid_docs.add(doc_id)
+            continue
+
+        doc_offsets = sorted(offsets.items(), key=lambda item: cursors[item[0]].term_freq)
+        if first_match(doc_offsets, lambda term: read_positions(cursors[term].positions_ptr, cursors[term].term_freq)) != -1:
+            valid_docs.add(doc_id)
+    return valid_docs
+
+def match_adjacent_pairs(phrase, get_postings_list):
+    """
+    Method to find the documents where every pair of adjacent terms of a phrase is adjacent somewhere
+    in the document, the check made by QueryParser.process_phrase before match_phrase. It matches every
+    document that match_phrase matches, and more for phrases of 3 or more terms, as the adjacent pairs
+    do not have to form a single run. Only kept as the baseline of the benchmark.
+    """
+    postings = [get_postings_list(term) for term in phrase]
+    if any(len(posting.postings) == 0 for posting in postings):
+        return set()
+
+    common_docs = set(postings[0].postings)
+    for posting in postings[1:]:
+        common_docs &= set(posting.postings)
+
+    valid_docs = set()
+    for doc_id in common_docs:
+        for i in range(len(phrase) - 1):
+            positions1 = set(postings[i].get_positions(doc_id))
+            if not any(position - 1 in positions1 for position in postings[i + 1].get_positions(doc_id)):
+                break
+        else:
+            valid_docs.add(doc_id)
+    return valid_docs
+
+def sample_phrases(texts, length, num_phrases, tokenizer, seed=0):
+    """
+    Method to sample phrases of length terms from texts, half of them as they appear in a text, and
+    half of them with their terms reversed, which are mostly absent and stress the false matches of
+    match_adjacent_pairs
+
+        Returns:
+            a list of phrases, every phrase a list of terms
+    """
+    rng = random.Random(seed)
+    documents = [terms for terms in (tokenizer.tokenize(text) for text in texts) if len(terms) >= length]
+    phrases = []
+    for i in range(num_phrases):
+        terms = rng.choice(documents)
+        start = rng.randrange(len(terms) - length + 1)
+        phrase = terms[start:start + length]
+        phrases.append(phrase if i % 2 == 0 else phrase[::-1])
+    return phrases
+
+def benchmark(phrases, match, get_postings_list):
+    """
+    Method to time a phrase matcher, with the postings already decoded
+
+        Returns:
+            the number of matched documents, and the mean time per phrase in milliseconds
+    """
+    for phrase in phrases:
+        for term in phrase:
+            get_postings_list(term)
+    st = time.time()
+    num_docs = sum(len(match(phrase, get_postings_list)) for phrase in phrases)
+    return num_docs, (time.time() - st) * 1000 / max(len(phrases), 1)
+
+def usage():
+    print("usage: " + sys.argv[0] + " -d dictionary-file -p postings-file -i dataset-file [-n number-of-phrases] [-f]")
+    print("  samples phrases of 2, 3 and 5 terms from the first 200 documents of dataset-file (the dataset the")
+    print("  index was built from), and compares match_phrase with checking every pair of adjacent terms")
+    print("  -f  tokenize with the fast regex tokenizer, for indexes built with index.py -f")
+
+if __name__ == '__main__':
+    dictionary_file = postings_file = dataset_file = None
+    num_phrases = 200
+    tokenizer_mode = 'nltk'
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:p:i:n:f')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-i':
+            dataset_file = a
+        elif o == '-n':
+            num_phrases = int(a)
+        elif o == '-f':
+            tokenizer_mode = 'fast'
+        else:
+            assert False, "unhandled option"
+
+    if dictionary_file == None or postings_file == None or dataset_file == None:
+        usage()
+        sys.exit(2)
+
+    from query_parser import QueryParser
+    from tokenizer import get_tokenizer, read_contents
+
+    parser = QueryParser(dictionary_file, postings_file, tokenizer_mode=tokenizer_mode)
+    texts = read_contents(dataset_file, 200)
+    print("{:<8} {:<14} {:>8} {:>10}".format("terms", "matcher", "docs", "ms/phrase"))
+    for length in (2, 3, 5):
+        phrases = sample_phrases(texts, length, num_phrases, get_tokenizer(tokenizer_mode))
+        for name, match in (("adjacent pairs", match_adjacent_pairs), ("merge", match_phrase)):
+            num_docs, latency = benchmark(phrases, match, parser.get_postings_list)
+            print("{:<8} {:<14} {:>8} {:>10.3f}".format(length, name, num_docs, latency))
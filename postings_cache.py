@@ -0,0 +1,79 @@
+import collections
+
+def estimate_doc_ids_size(doc_ids):
+    """
+    Method to estimate the bytes held by a list or tuple of docIDs in a cache: the container, and
+    the list slot and the int of every document
+    """
+    return 100 + 36 * len(doc_ids)
+
+class PostingsCache:
+    '''
+    LRU cache of decoded postings lists keyed by term, bounded by an estimated
+    number of bytes. A single cache can be shared by every query (and every
+    QueryParser) in a process so that a term is only decoded once.
+    '''
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.curr_bytes = 0
+        self.entries = collections.OrderedDict() # { term : (value, size) }, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    '''
+    Returns the cached value of the term and marks it as most recently used,
+    or None if the term is not cached
+    '''
+    def get(self, term):
+        entry = self.entries.get(term)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(term)
+        self.hits += 1
+        return entry[0]
+
+    '''
+    Caches the value of the term, evicting the least recently used terms until it
+    fits in max_bytes. Values larger than max_bytes are not cached.
+    '''
+    def put(self, term, value, size):
+        if term in self.entries:
+            self.curr_bytes -= self.entries.pop(term)[1]
+        if size > self.max_bytes:
+            return
+
+        while self.curr_bytes + size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.curr_bytes -= evicted_size
+            self.evictions += 1
+
+        self.entries[term] = (value, size)
+        self.curr_bytes += size
+
+    '''
+    Returns True if the term is cached, without marking it as used or counting a lookup
+    '''
+    def __contains__(self, term):
+        return term in self.entries
+
+    def clear(self):
+        self.entries.clear()
+        self.curr_bytes = 0
+
+    '''
+    Returns the hit/miss statistics of the cache
+    '''
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.curr_bytes,
+            'max_bytes': self.max_bytes,
+        }
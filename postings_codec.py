@@ -0,0 +1,881 @@
+import math
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+from doc_bitmap import ARRAY_CONTAINER_MAX, CONTAINER_SIZE, is_bitmap
+
+# Magic headers written at the start of the binary postings (doc stream) and 
+# positions (positional stream) files, so that the reader can tell the binary 
+# postings file apart from the text (debugging) format.
+BINARY_POSTINGS_MAGIC = b'LCRPOST4'
+# Magic headers of binary postings files written before skip pointers held the offset of the
+# positions (LCRPOST3), and before skip pointers existed (LCRPOST2)
+BINARY_POSTINGS_MAGIC_V3 = b'LCRPOST3'
+BINARY_POSTINGS_MAGIC_V2 = b'LCRPOST2'
+BINARY_POSITIONS_MAGIC = b'LCRPOSI1'
+
+# Magic header written at the start of the forward index file
+FORWARD_INDEX_MAGIC = b'LCRFWD01'
+
+# Magic header written at the start of the term statistics file. Files of the first version
+# (LCRSTAT1) do not have the max_score column.
+TERM_STATS_MAGIC = b'LCRSTAT2'
+TERM_STATS_MAGIC_V1 = b'LCRSTAT1'
+
+# Magic header written at the start of the champion lists file
+CHAMPIONS_MAGIC = b'LCRCHMP1'
+
+# Magic header written at the start of the bitmaps file of the dense terms
+BITMAPS_MAGIC = b'LCRBMAP1'
+
+# Magic header written at the start of the biword index file
+BIWORDS_MAGIC = b'LCRBIWD1'
+
+# Magic header written at the start of the document fields file
+FIELDS_MAGIC = b'LCRFLDS1'
+
+# Magic header written at the start of the synonym table of the query expansion
+SYNONYMS_MAGIC = b'LCRSYN01'
+
+# Header written at the start of a front coded dictionary file. Dictionary files
+# without it store every term in full as |term_len|term.
+FRONT_CODED_DICTIONARY_HEADER = b'#front-coded\n'
+
+# Number of postings between two skip pointers of the doc stream, terms with at most this many
+# documents have no skip pointers
+SKIP_INTERVAL = 64
+
+# Number of uint32 fields of a skip pointer: docID, offset in the doc stream and offset in the positional stream
+SKIP_FIELDS = 3
+
+# Minimum number of positions decoded with NumPy by decode_positions, fewer are decoded in Python
+VECTORIZED_POSITIONS_MIN = 64
+
+def vb_encode_number(n):
+    """
+    Method to variable byte encode a non-negative integer, with the continuation
+    bit set on the last byte
+
+        Parameters:
+            n: a non-negative int
+
+        Returns:
+            a bytearray
+    """
+    encoded = bytearray()
+    while True:
+        encoded.insert(0, n % 128)
+        if n < 128:
+            break
+        n //= 128
+    encoded[-1] += 128
+    return encoded
+
+def vb_encode(numbers):
+    """
+    Method to variable byte encode a list of non-negative integers
+
+        Parameters:
+            numbers: a list of int
+
+        Returns:
+            a bytearray
+    """
+    encoded = bytearray()
+    for n in numbers:
+        encoded += vb_encode_number(n)
+    return encoded
+
+def vb_decode_number(buf, offset):
+    """
+    Method to decode a single variable byte encoded integer from buf
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+            offset: the position in buf to start decoding from
+
+        Returns:
+            the decoded int and the offset right after it
+    """
+    n = 0
+    while True:
+        byte = buf[offset]
+        offset += 1
+        if byte < 128:
+            n = 128 * n + byte
+        else:
+            return 128 * n + byte - 128, offset
+
+def encode_front_coded_block(terms):
+    """
+    Method to front code a block of sorted terms for the dictionary file. The first
+    term is stored in full, every other term stores the length of the prefix it
+    shares with the previous term followed by the rest of the term, e.g.
+        |8|automata|7|1|e|7|2|ic|8|2|on
+    Lengths are in utf-8 bytes.
+
+        Parameters:
+            terms: a list of string, sorted in ascending order
+
+        Returns:
+            a bytes object
+    """
+    encoded = bytearray()
+    prev_term = b''
+    for i, term in enumerate(terms):
+        term = term.encode('utf-8')
+        if i == 0:
+            encoded += b'|%d|' % len(term) + term
+        else:
+            prefix_len = 0
+            max_len = min(len(prev_term), len(term))
+            while prefix_len < max_len and prev_term[prefix_len] == term[prefix_len]:
+                prefix_len += 1
+            suffix = term[prefix_len:]
+            encoded += b'|%d|%d|' % (prefix_len, len(suffix)) + suffix
+        prev_term = term
+    return bytes(encoded)
+
+def weighted_tf(term_freq):
+    """
+    Method to calculate the weighted term frequency, wt,d = 1 + log(tf)
+    """
+    return 1 + math.log(term_freq, 10)
+
+def encode_text_postings(term, doc_freq, posting):
+    """
+    Method to encode the postings of a term into a line of the text postings format
+
+        Parameters:
+            term: a string
+            doc_freq: a string
+            posting: a dictionary, { (docID,weightedtf) : [position...] }
+
+        Returns:
+            a string, term documentFrequency docID,wt,d:position1 position2... gapEncodedID,wt,d:position1 position2...
+    """
+    posting_content = ""
+    prev_id = 0
+
+    for docID_weighted, positions in posting.items():
+        doc_id = int(docID_weighted[0])
+        gap_encoded_id = doc_id - prev_id
+        weightedtf = str(docID_weighted[1])
+
+        position = ""
+        prev_pos = 0
+        for pos in positions:
+            position += str(pos-prev_pos) + "," # gap encoded positions
+            prev_pos = pos
+
+        position = position[:-1] # remove last comma
+        posting_content += " {},{}:{}".format(gap_encoded_id, weightedtf, position) 
+
+        prev_id = doc_id
+
+    return "{} {}{}\n".format(term, doc_freq, posting_content)
+
+def decode_text_postings(postings):
+    """
+    Method to decode the postings of a term written by encode_text_postings
+
+        Parameters:
+            postings: a string, docID,wt,d:position1,position2... gapEncodedID,wt,d:position1,position2...
+                      i.e. a line of the text postings format without the term and documentFrequency
+
+        Returns:
+            postings = { docID : { 'weight' : wt,d, 'positions' : [position...] } }, in the order of the line
+    """
+    decoded = {}
+    last_doc_id = 0 # keep track of the last processed doc_id
+    for posting in postings.split(' '):
+        parts = posting.split(':')
+        doc_id_increment, weight = parts[0].split(',')
+        doc_id = last_doc_id + int(doc_id_increment)
+        positions = []
+        last_position = 0
+        for p in parts[1].split(','):
+            position = last_position + int(p)
+            positions.append(position)
+            last_position = position
+        decoded[doc_id] = {'weight': float(weight), 'positions': positions}
+        last_doc_id = doc_id # update the last processed doc_id
+    return decoded
+
+def encode_binary_postings(term, doc_freq, posting, positions_ref):
+    """
+    Method to encode the postings of a term into the two parallel streams of the 
+    binary format. The postings file holds the doc stream, written in the form of
+        term_len term doc_freq positionsPtr numSkips skips docGap tf positionsLen docGap tf positionsLen...
+    and the positions file holds the positional stream, written in the form of
+        posGap1 posGap2... posGap1 posGap2...
+    with the positions of every document of the term in the same order as the doc stream. 
+    positionsPtr points to the start of the positions of the term in the positions file, 
+    and positionsLen is the number of bytes of the positions of the document so that 
+    ranked retrieval never has to touch the positional stream. Every number is variable 
+    byte encoded, but for skips. wt,d is not stored as it is recomputed from tf when decoding.
+
+    skips is a table of numSkips skip pointers, one every SKIP_INTERVAL postings, as little-endian
+    uint32 triples (docID, offset, positionsOffset) where offset is the number of bytes from the
+    first docGap to the posting of docID, and positionsOffset the number of bytes from positionsPtr
+    to the positions of docID, see decode_skips.
+
+        Parameters:
+            term: a string
+            doc_freq: an int
+            posting: a dictionary, { (docID,weightedtf) : [position...] }
+            positions_ref: pointer to the positions file where the positions of the term will be written
+
+        Returns:
+            a bytearray for the postings file and a bytearray for the positions file
+    """
+    term_bytes = term.encode('utf-8')
+    encoded = vb_encode_number(len(term_bytes))
+    encoded += term_bytes
+    encoded += vb_encode_number(doc_freq)
+    encoded += vb_encode_number(positions_ref)
+    encoded_entries = bytearray()
+    encoded_positions = bytearray()
+    skips = array('I')
+
+    # docIDs must be increasing for the gaps to be non-negative
+    prev_id = 0
+    for i, (docID_weighted, positions) in enumerate(sorted(posting.items(), key=lambda item: int(item[0][0]))):
+        doc_id = int(docID_weighted[0])
+        if i != 0 and i % SKIP_INTERVAL == 0:
+            skips.extend((doc_id, len(encoded_entries), len(encoded_positions)))
+
+        doc_positions = bytearray()
+        prev_pos = 0
+        for pos in positions:
+            doc_positions += vb_encode_number(pos - prev_pos)
+            prev_pos = pos
+
+        encoded_entries += vb_encode_number(doc_id - prev_id)
+        encoded_entries += vb_encode_number(len(positions))
+        encoded_entries += vb_encode_number(len(doc_positions))
+        encoded_positions += doc_positions
+
+        prev_id = doc_id
+
+    if sys.byteorder != 'little':
+        skips.byteswap()
+    encoded += vb_encode_number(len(skips) // SKIP_FIELDS)
+    encoded += skips.tobytes()
+    encoded += encoded_entries
+    return encoded, encoded_positions
+
+def decode_binary_postings(buf, offset, skip_fields=SKIP_FIELDS):
+    """
+    Method to decode the doc stream of a term written by encode_binary_postings, 
+    without touching the positional stream
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+            offset: the position in buf where the postings of the term starts
+            skip_fields: the number of fields of a skip pointer, 2 for postings files with the
+                         BINARY_POSTINGS_MAGIC_V3 header and 0 for BINARY_POSTINGS_MAGIC_V2
+
+        Returns:
+            term, doc_freq, postings and the offset right after the postings, where
+            postings = { docID : { 'weight' : wt,d, 'tf' : tf, 'positions_ptr' : positionsPtr } }
+            and positionsPtr points to the positions of docID in the positions file
+    """
+    term_len, offset = vb_decode_number(buf, offset)
+    term = bytes(buf[offset:offset + term_len]).decode('utf-8')
+    offset += term_len
+    doc_freq, offset = vb_decode_number(buf, offset)
+    positions_ptr, offset = vb_decode_number(buf, offset)
+    if skip_fields != 0:
+        num_skips, offset = vb_decode_number(buf, offset)
+        offset += 4 * skip_fields * num_skips
+
+    postings = {}
+    doc_id = 0
+    for _ in range(doc_freq):
+        doc_gap, offset = vb_decode_number(buf, offset)
+        term_freq, offset = vb_decode_number(buf, offset)
+        positions_len, offset = vb_decode_number(buf, offset)
+        doc_id += doc_gap
+
+        postings[doc_id] = {'weight': weighted_tf(term_freq), 'tf': term_freq, 'positions_ptr': positions_ptr}
+        positions_ptr += positions_len
+
+    return term, doc_freq, postings, offset
+
+def decode_skips(buf, offset, skip_fields=SKIP_FIELDS):
+    """
+    Method to decode the header of the doc stream of a term written by encode_binary_postings,
+    and map its skip pointers without copying them
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+            offset: the position in buf where the postings of the term starts
+            skip_fields: the number of fields of a skip pointer, see decode_binary_postings
+
+        Returns:
+            doc_freq, positionsPtr, the offset of the first docGap, and the docIDs, offsets and
+            positionsOffsets of the skip pointers as NumPy arrays, where every offset is relative to
+            the first docGap. positionsOffsets is None for skip pointers without it.
+    """
+    term_len, offset = vb_decode_number(buf, offset)
+    offset += term_len
+    doc_freq, offset = vb_decode_number(buf, offset)
+    positions_ptr, offset = vb_decode_number(buf, offset)
+    if skip_fields == 0:
+        no_skips = np.zeros(0, dtype='<u4')
+        return doc_freq, positions_ptr, offset, no_skips, no_skips, no_skips
+
+    num_skips, offset = vb_decode_number(buf, offset)
+    skips = np.frombuffer(buf, dtype='<u4', count=skip_fields * num_skips, offset=offset).reshape(num_skips, skip_fields)
+    skip_positions = skips[:, 2] if skip_fields > 2 else None
+    return doc_freq, positions_ptr, offset + 4 * skip_fields * num_skips, skips[:, 0], skips[:, 1], skip_positions
+
+def decode_doc_id_gaps(buf, offset, count):
+    """
+    Method to decode count docGaps of the doc stream of a term, skipping their tf and positionsLen
+
+        Returns:
+            a list of docID gaps and the offset right after the last posting
+    """
+    gaps = []
+    for _ in range(count):
+        doc_gap, offset = vb_decode_number(buf, offset)
+        # skip tf and positionsLen, the last byte of every number has its high bit set
+        while buf[offset] < 128:
+            offset += 1
+        offset += 1
+        while buf[offset] < 128:
+            offset += 1
+        offset += 1
+        gaps.append(doc_gap)
+    return gaps, offset
+
+def decode_positions(buf, offset, term_freq):
+    """
+    Method to decode the gap encoded positions of a term in a document from the 
+    positional stream
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+            offset: the position in buf where the positions of the document starts
+            term_freq: the number of positions to decode
+
+        Returns:
+            a list of positions in increasing order
+    """
+    # A gap takes at most 5 bytes, as positions are below 2^35
+    encoded = buf[offset:offset + 5 * term_freq]
+    if term_freq >= VECTORIZED_POSITIONS_MIN:
+        return decode_positions_array(encoded, term_freq).tolist()
+
+    positions = []
+    position = 0
+    n = 0
+    for byte in encoded:
+        if byte < 128:
+            n = 128 * n + byte
+        else:
+            position += 128 * n + byte - 128
+            positions.append(position)
+            term_freq -= 1
+            if term_freq == 0:
+                break
+            n = 0
+    return positions
+
+def decode_positions_array(encoded, term_freq):
+    """
+    Method to decode the first term_freq gap encoded positions of encoded with NumPy, for the
+    positions of frequent terms in long judgments
+
+        Returns:
+            a NumPy array of positions in increasing order
+    """
+    data = np.frombuffer(encoded, dtype=np.uint8)
+    # the last byte of every gap has its high bit set
+    ends = np.flatnonzero(data >= 128)[:term_freq]
+    data = data[:ends[-1] + 1]
+    if len(data) == term_freq:
+        # every gap takes a single byte
+        gaps = data.astype(np.int64) - 128
+    else:
+        starts = np.empty(term_freq, dtype=np.int64)
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+        # shift every byte of a gap by 7 bits per byte after it in the gap, and add up the bytes of every gap
+        gap_ends = np.repeat(ends, ends - starts + 1)
+        payload = (data & 127).astype(np.int64) << (7 * (gap_ends - np.arange(len(data))))
+        gaps = np.add.reduceat(payload, starts)
+    return np.cumsum(gaps)
+
+def encode_forward_vector(term_tfs):
+    """
+    Method to encode the term vector of a document for the forward index, written
+    in the form of
+        num_terms termIDGap tf termIDGap tf...
+    where every number is variable byte encoded
+
+        Parameters:
+            term_tfs: a list of (termID, tf), sorted in increasing termID
+
+        Returns:
+            a bytearray
+    """
+    encoded = vb_encode_number(len(term_tfs))
+    prev_term_id = 0
+    for term_id, term_freq in term_tfs:
+        encoded += vb_encode_number(term_id - prev_term_id)
+        encoded += vb_encode_number(term_freq)
+        prev_term_id = term_id
+    return encoded
+
+def decode_forward_vector(buf, offset):
+    """
+    Method to decode the term vector of a document written by encode_forward_vector
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+            offset: the position in buf where the term vector of the document starts
+
+        Returns:
+            a list of (termID, wt,d), sorted in increasing termID
+    """
+    return [(term_id, weighted_tf(term_freq)) for term_id, term_freq in decode_forward_term_freqs(buf, offset)]
+
+def decode_forward_term_freqs(buf, offset):
+    """
+    Method to decode the term vector of a document written by encode_forward_vector, 
+    keeping the raw term frequencies
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+            offset: the position in buf where the term vector of the document starts
+
+        Returns:
+            a list of (termID, tf), sorted in increasing termID
+    """
+    num_terms, offset = vb_decode_number(buf, offset)
+    term_tfs = []
+    term_id = 0
+    for _ in range(num_terms):
+        term_id_gap, offset = vb_decode_number(buf, offset)
+        term_freq, offset = vb_decode_number(buf, offset)
+        term_id += term_id_gap
+        term_tfs.append((term_id, term_freq))
+    return term_tfs
+
+def encode_term_stats(doc_freqs, idfs, max_weights, postings_lengths, max_scores):
+    """
+    Method to encode the per-term statistics table, written in the form of
+        magic num_terms doc_freq... idf... max_weight... postings_length... max_score...
+    where every column is a little-endian array indexed by termID, of uint32 for
+    doc_freq and postings_length and of float64 for idf, max_weight and max_score
+
+        Parameters:
+            doc_freqs: a list of int, the doc_freq of each term
+            idfs: a list of float, log(N/doc_freq) of each term
+            max_weights: a list of float, the highest wt,d in the postings of each term
+            postings_lengths: a list of int, the number of bytes of the postings of each term
+            max_scores: a list of float, the highest wt,d / doc_len in the postings of each term,
+                        i.e. the upper bound of the cosine score of a document per unit of wt,q
+
+        Returns:
+            a bytes object
+    """
+    columns = [array('I', doc_freqs), array('d', idfs), array('d', max_weights), array('I', postings_lengths),
+               array('d', max_scores)]
+    encoded = bytearray(TERM_STATS_MAGIC)
+    encoded += struct.pack('<I', len(doc_freqs))
+    for column in columns:
+        if sys.byteorder == 'big':
+            column.byteswap()
+        encoded += column.tobytes()
+    return bytes(encoded)
+
+def decode_term_stats(buf):
+    """
+    Method to decode the per-term statistics table written by encode_term_stats
+
+        Parameters:
+            buf: a bytes-like object
+
+        Returns:
+            doc_freqs, idfs, max_weights, postings_lengths and max_scores, each an array indexed 
+            by termID, max_scores is None for files of the first version
+    """
+    offset = len(TERM_STATS_MAGIC)
+    num_terms = struct.unpack_from('<I', buf, offset)[0]
+    offset += 4
+
+    typecodes = ('I', 'd', 'd', 'I') if buf[:len(TERM_STATS_MAGIC_V1)] == TERM_STATS_MAGIC_V1 else ('I', 'd', 'd', 'I', 'd')
+    columns = []
+    for typecode in typecodes:
+        column = array(typecode)
+        end = offset + num_terms * column.itemsize
+        column.frombytes(buf[offset:end])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns.append(column)
+        offset = end
+    if len(columns) == 4:
+        columns.append(None)
+    return tuple(columns)
+
+def encode_champion_lists(champion_size, champion_lists):
+    """
+    Method to encode the champion list of every term, i.e. its champion_size postings with the
+    highest wt,d / doc_len, written in the form of
+        magic champion_size num_terms offset... num_docs docGap tf docGap tf... 
+    where champion_size, num_terms and the offset of the champion list of every termID are 
+    little-endian uint32, and every champion list is variable byte encoded like a term vector
+    of the forward index, in increasing docID
+
+        Parameters:
+            champion_size: an int, the maximum number of documents of a champion list
+            champion_lists: a list of the champion list of every termID, each a list of (docID, tf)
+                            sorted in increasing docID
+
+        Returns:
+            a bytes object
+    """
+    offsets = array('I')
+    encoded_lists = bytearray()
+    data_offset = len(CHAMPIONS_MAGIC) + 8 + 4 * len(champion_lists)
+    for champion_list in champion_lists:
+        offsets.append(data_offset + len(encoded_lists))
+        encoded_lists += encode_forward_vector(champion_list)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+
+    encoded = bytearray(CHAMPIONS_MAGIC)
+    encoded += struct.pack('<II', champion_size, len(champion_lists))
+    encoded += offsets.tobytes()
+    encoded += encoded_lists
+    return bytes(encoded)
+
+def decode_champion_offsets(buf):
+    """
+    Method to decode the header of the champion lists file written by encode_champion_lists
+
+        Parameters:
+            buf: a bytes-like object (bytes, bytearray or mmap)
+
+        Returns:
+            champion_size, and the offset of the champion list of every termID as an array
+    """
+    offset = len(CHAMPIONS_MAGIC)
+    champion_size, num_terms = struct.unpack_from('<II', buf, offset)
+    offset += 8
+    offsets = array('I')
+    offsets.frombytes(buf[offset:offset + 4 * num_terms])
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return champion_size, offsets
+
+def decode_champion_list(buf, offset):
+    """
+    Method to decode a champion list written by encode_champion_lists
+
+        Returns:
+            a list of (docID, tf), sorted in increasing docID
+    """
+    return decode_forward_term_freqs(buf, offset)
+
+def encode_bitmaps(num_docs, bitmaps):
+    """
+    Method to encode the DocBitmaps of the dense terms, written in the form of
+        magic num_docs num_terms termID offset termID offset... num_containers key cardinality container...
+    where num_docs is the number of documents of the document table the bitmaps index into, and
+    every number is a little-endian uint32. termIDs are in increasing order, and every container
+    is either a bitmap of CONTAINER_SIZE bits as uint64 words, if its cardinality is above
+    ARRAY_CONTAINER_MAX, or its cardinality sorted uint16 offsets, see doc_bitmap.make_container
+
+        Parameters:
+            num_docs: an int
+            bitmaps: a list of (termID, { container key : container }) in increasing termID
+
+        Returns:
+            a bytes object
+    """
+    offsets = array('I')
+    encoded_bitmaps = bytearray()
+    data_offset = len(BITMAPS_MAGIC) + 8 + 8 * len(bitmaps)
+    for term_id, containers in bitmaps:
+        offsets.extend((term_id, data_offset + len(encoded_bitmaps)))
+        encoded_bitmaps += struct.pack('<I', len(containers))
+        for key, container in containers.items():
+            cardinality = int(np.unpackbits(container.view(np.uint8)).sum()) if is_bitmap(container) else len(container)
+            encoded_bitmaps += struct.pack('<II', key, cardinality)
+            encoded_bitmaps += container.astype(container.dtype.newbyteorder('<')).tobytes()
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+
+    encoded = bytearray(BITMAPS_MAGIC)
+    encoded += struct.pack('<II', num_docs, len(bitmaps))
+    encoded += offsets.tobytes()
+    encoded += encoded_bitmaps
+    return bytes(encoded)
+
+def decode_bitmap_offsets(buf):
+    """
+    Method to decode the header of the bitmaps file written by encode_bitmaps
+
+        Returns:
+            num_docs, and a dictionary { termID : offset of its containers }
+    """
+    offset = len(BITMAPS_MAGIC)
+    num_docs, num_terms = struct.unpack_from('<II', buf, offset)
+    offset += 8
+    entries = array('I')
+    entries.frombytes(buf[offset:offset + 8 * num_terms])
+    if sys.byteorder == 'big':
+        entries.byteswap()
+    return num_docs, dict(zip(entries[0::2], entries[1::2]))
+
+def decode_bitmap_containers(buf, offset):
+    """
+    Method to map the containers of a term written by encode_bitmaps, without copying them
+
+        Returns:
+            a dictionary { container key : NumPy array of uint16 offsets, or of uint64 words for a bitmap }
+    """
+    num_containers = struct.unpack_from('<I', buf, offset)[0]
+    offset += 4
+    containers = {}
+    for _ in range(num_containers):
+        key, cardinality = struct.unpack_from('<II', buf, offset)
+        offset += 8
+        if cardinality > ARRAY_CONTAINER_MAX:
+            containers[key] = np.frombuffer(buf, dtype='<u8', count=CONTAINER_SIZE // 64, offset=offset)
+            offset += CONTAINER_SIZE // 8
+        else:
+            containers[key] = np.frombuffer(buf, dtype='<u2', count=cardinality, offset=offset)
+            offset += 2 * cardinality
+    return containers
+
+def encode_biwords(min_doc_freq, biwords):
+    """
+    Method to encode the biword index, i.e. the documents of every pair of adjacent terms in at
+    least min_doc_freq documents, written in the form of
+        magic min_doc_freq num_biwords termID1 termID2 offset... num_docs docGap docGap...
+    where min_doc_freq, num_biwords and every (termID1, termID2, offset) entry are little-endian
+    uint32, and every list of documents is variable byte encoded, in increasing docID
+
+        Parameters:
+            min_doc_freq: an int, the lowest document frequency of the biwords
+            biwords: a list of (termID1, termID2, [docID...]) in increasing (termID1, termID2)
+
+        Returns:
+            a bytes object
+    """
+    entries = array('I')
+    encoded_lists = bytearray()
+    data_offset = len(BIWORDS_MAGIC) + 8 + 12 * len(biwords)
+    for term_id1, term_id2, doc_ids in biwords:
+        entries.extend((term_id1, term_id2, data_offset + len(encoded_lists)))
+        encoded_lists += vb_encode_number(len(doc_ids))
+        encoded_lists += vb_encode(doc_id - prev_doc_id for doc_id, prev_doc_id in zip(doc_ids, [0] + doc_ids[:-1]))
+    if sys.byteorder == 'big':
+        entries.byteswap()
+
+    encoded = bytearray(BIWORDS_MAGIC)
+    encoded += struct.pack('<II', min_doc_freq, len(biwords))
+    encoded += entries.tobytes()
+    encoded += encoded_lists
+    return bytes(encoded)
+
+def decode_biword_offsets(buf):
+    """
+    Method to decode the header of the biword index file written by encode_biwords
+
+        Returns:
+            min_doc_freq, the biwords as a sorted NumPy array of termID1 << 32 | termID2, and the
+            offset of the documents of every biword as a NumPy array
+    """
+    offset = len(BIWORDS_MAGIC)
+    min_doc_freq, num_biwords = struct.unpack_from('<II', buf, offset)
+    offset += 8
+    entries = np.frombuffer(buf, dtype='<u4', count=3 * num_biwords, offset=offset).reshape(-1, 3).astype(np.uint64)
+    keys = (entries[:, 0] << np.uint64(32)) | entries[:, 1]
+    return min_doc_freq, keys, entries[:, 2]
+
+def decode_biword_doc_ids(buf, offset):
+    """
+    Method to decode the documents of a biword written by encode_biwords
+
+        Returns:
+            a list of docIDs, sorted in increasing docID
+    """
+    num_docs, offset = vb_decode_number(buf, offset)
+    doc_ids = []
+    doc_id = 0
+    for _ in range(num_docs):
+        doc_gap, offset = vb_decode_number(buf, offset)
+        doc_id += doc_gap
+        doc_ids.append(doc_id)
+    return doc_ids
+
+def encode_fields(doc_ids, courts, court_codes, dates, title_index):
+    """
+    Method to encode the fields of every document, i.e. its court, date and title, written in the form of
+        magic num_docs num_courts num_title_terms courts_len title_terms_len docIDs courtCodes dates
+        courts titleTerms num_docs docIndexGap docIndexGap...
+    where the header numbers and courtCodes are little-endian uint32, docIDs and dates
+    are little-endian int64 columns in the order of docIDs, courts and titleTerms are the names of the
+    courts and the terms of the title index joined by newlines, and every list of the title index
+    holds the indices in docIDs of the documents whose title has the term, variable byte encoded, in
+    the order of titleTerms
+
+        Parameters:
+            doc_ids: a list of docIDs in increasing order
+            courts: a list of the names of the courts, courtCode being the index of the court of a document
+            court_codes: a list of the courtCode of every document
+            dates: a list of the date of every document, in seconds since the epoch
+            title_index: a dictionary { term : [index of document...] }, every list in increasing order
+
+        Returns:
+            a bytes object
+    """
+    encoded_courts = '\n'.join(courts).encode('utf-8')
+    title_terms = sorted(title_index)
+    encoded_terms = '\n'.join(title_terms).encode('utf-8')
+
+    encoded_lists = bytearray()
+    for term in title_terms:
+        indices = title_index[term]
+        encoded_lists += vb_encode_number(len(indices))
+        encoded_lists += vb_encode(index - prev_index for index, prev_index in zip(indices, [0] + indices[:-1]))
+
+    encoded = bytearray(FIELDS_MAGIC)
+    encoded += struct.pack('<IIIII', len(doc_ids), len(courts), len(title_terms), len(encoded_courts), len(encoded_terms))
+    encoded += np.asarray(doc_ids, dtype='<i8').tobytes()
+    encoded += np.asarray(court_codes, dtype='<u4').tobytes()
+    encoded += np.asarray(dates, dtype='<i8').tobytes()
+    encoded += encoded_courts
+    encoded += encoded_terms
+    encoded += encoded_lists
+    return bytes(encoded)
+
+def decode_fields(buf):
+    """
+    Method to decode the fields file written by encode_fields
+
+        Returns:
+            doc_ids, courts, court_codes, dates and title_index, where doc_ids, court_codes and dates are
+            NumPy arrays, and title_index is a dictionary { term : [index of document...] }
+    """
+    offset = len(FIELDS_MAGIC)
+    num_docs, num_courts, num_title_terms, courts_len, title_terms_len = struct.unpack_from('<IIIII', buf, offset)
+    offset += 20
+    doc_ids = np.frombuffer(buf, dtype='<i8', count=num_docs, offset=offset).astype(np.int64)
+    offset += 8 * num_docs
+    court_codes = np.frombuffer(buf, dtype='<u4', count=num_docs, offset=offset).astype(np.int64)
+    offset += 4 * num_docs
+    dates = np.frombuffer(buf, dtype='<i8', count=num_docs, offset=offset).astype(np.int64)
+    offset += 8 * num_docs
+    courts = bytes(buf[offset:offset + courts_len]).decode('utf-8').split('\n') if num_courts != 0 else []
+    offset += courts_len
+    title_terms = bytes(buf[offset:offset + title_terms_len]).decode('utf-8').split('\n') if num_title_terms != 0 else []
+    offset += title_terms_len
+
+    title_index = {}
+    for term in title_terms:
+        num_indices, offset = vb_decode_number(buf, offset)
+        indices = []
+        index = 0
+        for _ in range(num_indices):
+            gap, offset = vb_decode_number(buf, offset)
+            index += gap
+            indices.append(index)
+        title_index[term] = indices
+    return doc_ids, courts, court_codes, dates, title_index
+
+def encode_synonyms(index_version, min_doc_freq, max_doc_freq, words, synonyms):
+    """
+    Method to encode the synonym table of the query expansion, written in the form of
+        magic version_len index_version min_doc_freq max_doc_freq num_terms num_words
+        termID... offset... wordOffset... words num_synonyms wordIndex count wordIndex count...
+    where the header numbers, termIDs, offsets and wordOffsets are little-endian uint32, index_version
+    is the version of the index the table was built for, words are the synonyms of every term
+    concatenated in utf-8, wordOffsets the start of every word in words followed by the end of the
+    last one, and the synonyms of every term, at its offset in the file, are variable byte encoded
+    as the index of the word and its WordNet count
+
+        Parameters:
+            index_version: the string in index_version.txt
+            min_doc_freq, max_doc_freq: the range of document frequency of the terms of the synonyms
+            words: a list of the distinct synonyms
+            synonyms: a list of (termID, [(index of the word in words, count)...]) in increasing termID
+
+        Returns:
+            a bytes object
+    """
+    encoded_version = index_version.encode('utf-8')
+    encoded_words = [word.encode('utf-8') for word in words]
+    word_offsets = [0]
+    for word in encoded_words:
+        word_offsets.append(word_offsets[-1] + len(word))
+
+    data_offset = len(SYNONYMS_MAGIC) + 4 + len(encoded_version) + 16 + 8 * len(synonyms) + 4 * len(word_offsets) + word_offsets[-1]
+    offsets = []
+    encoded_lists = bytearray()
+    for _, word_counts in synonyms:
+        offsets.append(data_offset + len(encoded_lists))
+        encoded_lists += vb_encode_number(len(word_counts))
+        encoded_lists += vb_encode(number for word_count in word_counts for number in word_count)
+
+    encoded = bytearray(SYNONYMS_MAGIC)
+    encoded += struct.pack('<I', len(encoded_version))
+    encoded += encoded_version
+    encoded += struct.pack('<IIII', min_doc_freq, max_doc_freq, len(synonyms), len(words))
+    encoded += np.asarray([term_id for term_id, _ in synonyms], dtype='<u4').tobytes()
+    encoded += np.asarray(offsets, dtype='<u4').tobytes()
+    encoded += np.asarray(word_offsets, dtype='<u4').tobytes()
+    encoded += b''.join(encoded_words)
+    encoded += encoded_lists
+    return bytes(encoded)
+
+def decode_synonym_offsets(buf):
+    """
+    Method to decode the header of the synonym table written by encode_synonyms, without copying
+    its arrays out of buf
+
+        Returns:
+            index_version, min_doc_freq, max_doc_freq, the termIDs as a sorted NumPy array, the offset
+            of the synonyms of every term and the wordOffsets as NumPy arrays, and the offset of words
+    """
+    offset = len(SYNONYMS_MAGIC)
+    version_len, = struct.unpack_from('<I', buf, offset)
+    offset += 4
+    index_version = bytes(buf[offset:offset + version_len]).decode('utf-8')
+    offset += version_len
+    min_doc_freq, max_doc_freq, num_terms, num_words = struct.unpack_from('<IIII', buf, offset)
+    offset += 16
+    term_ids = np.frombuffer(buf, dtype='<u4', count=num_terms, offset=offset)
+    offset += 4 * num_terms
+    offsets = np.frombuffer(buf, dtype='<u4', count=num_terms, offset=offset)
+    offset += 4 * num_terms
+    word_offsets = np.frombuffer(buf, dtype='<u4', count=num_words + 1, offset=offset)
+    offset += 4 * (num_words + 1)
+    return index_version, min_doc_freq, max_doc_freq, term_ids, offsets, word_offsets, offset
+
+def decode_synonyms(buf, offset, word_offsets, words_offset):
+    """
+    Method to decode the synonyms of a term written by encode_synonyms
+
+        Returns:
+            a list of (word, count), by decreasing count
+    """
+    num_synonyms, offset = vb_decode_number(buf, offset)
+    synonyms = []
+    for _ in range(num_synonyms):
+        word_index, offset = vb_decode_number(buf, offset)
+        count, offset = vb_decode_number(buf, offset)
+        start = words_offset + int(word_offsets[word_index])
+        end = words_offset + int(word_offsets[word_index + 1])
+        synonyms.append((bytes(buf[start:end]).decode('utf-8'), count))
+    return synonyms
@@ -0,0 +1,163 @@
+import bisect
+
+import numpy as np
+
+from doc_bitmap import DocBitmap
+from postings_codec import SKIP_FIELDS, SKIP_INTERVAL, decode_doc_id_gaps, decode_skips, vb_decode_number
+
+class ListCursor:
+    '''
+    Cursor over an ascending list of docIDs, e.g. the documents of a phrase or of a term
+    whose postings are already decoded
+    '''
+
+    def __init__(self, doc_ids):
+        self.doc_ids = doc_ids
+        self.index = 0
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    '''
+    Moves the cursor to the first docID at or after target, and returns it, or None if
+    every docID left is smaller than target
+    '''
+    def advance(self, target):
+        self.index = bisect.bisect_left(self.doc_ids, target, self.index)
+        return self.doc_ids[self.index] if self.index < len(self.doc_ids) else None
+
+    '''
+    Returns the docIDs from the cursor to the end
+    '''
+    def remaining(self):
+        return self.doc_ids[self.index:]
+
+class SkipCursor:
+    '''
+    Cursor over the doc stream of a term in a memory-mapped binary postings file. advance jumps
+    over whole blocks of SKIP_INTERVAL postings with the skip pointers written by
+    postings_codec.encode_binary_postings, so that moving to a document decodes at most
+    SKIP_INTERVAL postings after a binary search of the skips. The tf and the pointer to the
+    positions of the posting at the cursor are kept, so that phrases can read the positions of
+    a few documents without decoding the whole postings list.
+    '''
+
+    def __init__(self, buf, postings_ptr, skip_fields=SKIP_FIELDS):
+        self.buf = buf
+        self.doc_freq, self.term_positions_ptr, self.start, self.skip_doc_ids, self.skip_offsets, self.skip_positions = \
+            decode_skips(buf, postings_ptr, skip_fields)
+        # Skip pointers of older postings files do not locate the positions of their posting
+        self.has_positions = self.skip_positions is not None or len(self.skip_doc_ids) == 0
+        self.index = 0 # index of the next posting to decode
+        self.offset = self.start # offset of the next posting to decode
+        self.doc_id = 0 # docID of the last decoded posting, 0 before the first one
+        self.term_freq = 0 # tf of the last decoded posting
+        self.positions_ptr = None # pointer to the positions of the last decoded posting in positions.txt
+        self.next_positions_ptr = self.term_positions_ptr
+        self.num_decoded = 0 # number of postings decoded so far
+        self.num_bytes = 0 # number of bytes of postings decoded so far
+
+    def __len__(self):
+        return self.doc_freq
+
+    '''
+    Decodes the next posting
+    '''
+    def next_posting(self):
+        start = self.offset
+        doc_gap, self.offset = vb_decode_number(self.buf, self.offset)
+        self.term_freq, self.offset = vb_decode_number(self.buf, self.offset)
+        positions_len, self.offset = vb_decode_number(self.buf, self.offset)
+        self.doc_id += doc_gap
+        self.positions_ptr = self.next_positions_ptr
+        self.next_positions_ptr += positions_len
+        self.index += 1
+        self.num_decoded += 1
+        self.num_bytes += self.offset - start
+
+    '''
+    Moves the cursor to the first docID at or after target, and returns it, or None if
+    every docID left is smaller than target
+    '''
+    def advance(self, target):
+        if self.index != 0 and self.doc_id >= target:
+            return self.doc_id
+
+        # Jump to the last skip pointer at or before target, if it is ahead of the cursor
+        skip = int(np.searchsorted(self.skip_doc_ids, target, side='right')) - 1
+        if skip >= 0 and (skip + 1) * SKIP_INTERVAL > self.index:
+            self.index = (skip + 1) * SKIP_INTERVAL
+            self.offset = self.start + int(self.skip_offsets[skip])
+            if self.skip_positions is not None:
+                self.next_positions_ptr = self.term_positions_ptr + int(self.skip_positions[skip])
+            # the gap of the posting the skip points to is replaced by the docID of the skip
+            self.next_posting()
+            self.doc_id = int(self.skip_doc_ids[skip])
+            if self.doc_id >= target:
+                return self.doc_id
+
+        while self.index < self.doc_freq:
+            self.next_posting()
+            if self.doc_id >= target:
+                return self.doc_id
+        return None
+
+    '''
+    Returns the docIDs from the cursor to the end
+    '''
+    def remaining(self):
+        doc_ids = [self.doc_id] if self.index != 0 else []
+        start = self.offset
+        gaps, self.offset = decode_doc_id_gaps(self.buf, self.offset, self.doc_freq - self.index)
+        self.num_decoded += self.doc_freq - self.index
+        self.num_bytes += self.offset - start
+        self.index = self.doc_freq
+        doc_id = self.doc_id
+        for gap in gaps:
+            doc_id += gap
+            doc_ids.append(doc_id)
+        self.doc_id = doc_id
+        return doc_ids
+
+def intersect(cursors):
+    """
+    Method to intersect the docIDs of cursors and DocBitmaps. The documents of the rarest cursor
+    are checked against the DocBitmaps, and then against the other cursors, rarest first, each one
+    advancing to the next candidate, and the intersection stops as soon as no candidate is left, so
+    its cost is about the doc_freq of the rarest cursor times the cost of a skip in the others.
+    DocBitmaps alone are intersected container by container.
+
+        Returns:
+            an ascending list of docIDs
+    """
+    if len(cursors) == 0 or any(len(cursor) == 0 for cursor in cursors):
+        return []
+    bitmaps = sorted((cursor for cursor in cursors if isinstance(cursor, DocBitmap)), key=len)
+    cursors = sorted((cursor for cursor in cursors if not isinstance(cursor, DocBitmap)), key=len)
+
+    if len(cursors) == 0:
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result = result.intersect(bitmap)
+            if len(result.containers) == 0:
+                return []
+        return result.to_doc_ids()
+
+    candidates = cursors[0].remaining()
+    for bitmap in bitmaps:
+        candidates = bitmap.filter(candidates)
+        if len(candidates) == 0:
+            return []
+    for cursor in cursors[1:]:
+        matches = []
+        for doc_id in candidates:
+            next_doc_id = cursor.advance(doc_id)
+            # no candidate left after an exhausted cursor
+            if next_doc_id is None:
+                break
+            if next_doc_id == doc_id:
+                matches.append(doc_id)
+        candidates = matches
+        if len(candidates) == 0:
+            break
+    return candidates
@@ -1,14 +1,152 @@
+import bisect
 import io
+import mmap
+import os
+
+import numpy as np
+
+from postings_codec import BINARY_POSTINGS_MAGIC, BINARY_POSTINGS_MAGIC_V2, BINARY_POSTINGS_MAGIC_V3, FRONT_CODED_DICTIONARY_HEADER
+from postings_codec import SKIP_FIELDS
+from postings_codec import decode_binary_postings, decode_forward_term_freqs, decode_forward_vector, decode_positions
+from postings_codec import decode_term_stats, decode_champion_list, decode_champion_offsets, decode_bitmap_containers, decode_bitmap_offsets
+from postings_codec import decode_biword_doc_ids, decode_biword_offsets, decode_synonym_offsets, decode_synonyms
+from postings_cursor import SkipCursor
+
+'''
+Returns a read-only memory map of the file, or an empty bytes object if the file is empty
+'''
+def map_file(file_name):
+    with open(file_name, 'rb') as f:
+        if f.seek(0, io.SEEK_END) == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
 class PostingsReader:
 
-    def __init__(self, dict_file, postings_file):
+    def __init__(self, dict_file, postings_file, index_dir='.'):
         self.dict_file = dict_file
         self.postings_file = postings_file
-        # Load all of the pointers from pointers.txt into memory
-        self.pointer_data = []
-        with open('pointers.txt', 'r') as f:
-            self.pointer_data = f.read().split()
+        # Directory of the other files of the index, i.e. pointers.txt, positions.txt... 
+        self.index_dir = index_dir
+        # Load the dictionary and all of the pointers from pointers.txt into memory
+        self.lexicon = Lexicon(dict_file, os.path.join(index_dir, 'pointers.txt'))
+
+        # Memory-map the postings file once, postings lists are decoded straight from the mapped buffer
+        self.postings_buffer = map_file(postings_file)
+        # Postings lists read by read_postings, the positions read by read_positions and the document vectors
+        # read from forward_index.txt, traced by QueryParser
+        self.postings_bytes = 0
+        self.postings_decoded = 0
+        self.positions_decoded = 0
+        self.doc_vectors_read = 0
+        magic = self.postings_buffer[:len(BINARY_POSTINGS_MAGIC)]
+        self.is_binary = magic in (BINARY_POSTINGS_MAGIC, BINARY_POSTINGS_MAGIC_V3, BINARY_POSTINGS_MAGIC_V2)
+        # Number of fields of the skip pointers of the doc stream, older binary postings files have
+        # skip pointers without the offset of the positions, or no skip pointers
+        self.skip_fields = {BINARY_POSTINGS_MAGIC: SKIP_FIELDS, BINARY_POSTINGS_MAGIC_V3: 2}.get(magic, 0)
+
+        # The binary format keeps the positions in a separate positional stream
+        self.positions_buffer = map_file(os.path.join(index_dir, 'positions.txt')) if self.is_binary else b''
+
+        # Term vectors of every document, missing for indexes built before the forward index existed
+        forward_file = os.path.join(index_dir, 'forward_index.txt')
+        self.forward_buffer = map_file(forward_file) if os.path.exists(forward_file) else None
+
+        # Per-term statistics indexed by termID, missing for indexes built before term_stats.txt existed
+        stats_file = os.path.join(index_dir, 'term_stats.txt')
+        self.term_stats = TermStatistics(stats_file) if os.path.exists(stats_file) else None
+
+        # Champion lists of every term, missing unless the index was built with a champion size
+        champions_file = os.path.join(index_dir, 'champions.txt')
+        self.champions_buffer = map_file(champions_file) if os.path.exists(champions_file) else None
+        self.champion_size, self.champion_offsets = decode_champion_offsets(self.champions_buffer) if self.champions_buffer is not None else (None, None)
+
+        # Bitmaps of the dense terms, missing for indexes built before bitmaps.txt existed
+        bitmaps_file = os.path.join(index_dir, 'bitmaps.txt')
+        self.bitmaps_buffer = map_file(bitmaps_file) if os.path.exists(bitmaps_file) else None
+        self.bitmap_num_docs, self.bitmap_offsets = decode_bitmap_offsets(self.bitmaps_buffer) if self.bitmaps_buffer is not None else (None, {})
+
+        # Biword index of the frequent pairs of adjacent terms, missing unless the index was built with a biword threshold
+        biwords_file = os.path.join(index_dir, 'biwords.txt')
+        self.biwords_buffer = map_file(biwords_file) if os.path.exists(biwords_file) else None
+        self.biword_min_doc_freq, self.biword_keys, self.biword_offsets = decode_biword_offsets(self.biwords_buffer) \
+            if self.biwords_buffer is not None else (None, None, None)
+
+        # Synonym table of the query expansion, missing unless synonym_table.py was run on the index
+        synonyms_file = os.path.join(index_dir, 'synonyms.txt')
+        self.synonyms_buffer = map_file(synonyms_file) if os.path.exists(synonyms_file) else None
+        self.synonym_version, self.synonym_min_doc_freq, self.synonym_max_doc_freq, self.synonym_keys, self.synonym_offsets, \
+            self.synonym_word_offsets, self.synonym_words_offset = decode_synonym_offsets(self.synonyms_buffer) \
+            if self.synonyms_buffer is not None else (None, None, None, None, None, None, None)
+
+    '''
+    Returns the postings of the term at postings_ptr as a tuple (term, doc_freq, postings).
+    postings is a decoded dict { docID : { 'weight' : wt,d, 'tf' : tf, 'positions_ptr' : positionsPtr } } 
+    for the binary format, or the raw postings string for the text format. 
+    '''
+    def read_postings(self, postings_ptr):
+        if self.is_binary:
+            term, doc_freq, postings, end = decode_binary_postings(self.postings_buffer, postings_ptr, self.skip_fields)
+            self.postings_bytes += end - postings_ptr
+            self.postings_decoded += doc_freq
+            return term, doc_freq, postings
+
+        line_end = self.postings_buffer.find(b'\n', postings_ptr)
+        if line_end == -1:
+            line_end = len(self.postings_buffer)
+        line = self.postings_buffer[postings_ptr:line_end].decode('utf-8').strip()
+        term, doc_freq, postings = line.split(' ', 2)
+        self.postings_bytes += line_end - postings_ptr
+        self.postings_decoded += int(doc_freq)
+        return term, int(doc_freq), postings
+
+    '''
+    Returns the positions of a document from the positional stream, given the 'positions_ptr' 
+    and 'tf' of the document returned by read_postings
+    '''
+    def read_positions(self, positions_ptr, term_freq):
+        self.positions_decoded += term_freq
+        return decode_positions(self.positions_buffer, positions_ptr, term_freq)
+
+    '''
+    Returns a SkipCursor over the docIDs of the postings at postings_ptr, for the binary format
+    '''
+    def get_cursor(self, postings_ptr):
+        return SkipCursor(self.postings_buffer, postings_ptr, self.skip_fields)
+
+    '''
+    Returns the term vector of a document from forward_index.txt as a list of (termID, wt,d), 
+    given the forward_ptr of the document in document.txt
+    '''
+    def read_doc_vector(self, forward_ptr):
+        self.doc_vectors_read += 1
+        return decode_forward_vector(self.forward_buffer, forward_ptr)
+
+    '''
+    Returns the term vector of a document from forward_index.txt as a list of (termID, tf)
+    '''
+    def read_doc_term_freqs(self, forward_ptr):
+        self.doc_vectors_read += 1
+        return decode_forward_term_freqs(self.forward_buffer, forward_ptr)
+
+    '''
+    Yields the postings of every term in the postings file, in the same form as read_postings
+    '''
+    def iter_postings(self):
+        if self.is_binary:
+            offset = len(BINARY_POSTINGS_MAGIC)
+            while offset < len(self.postings_buffer):
+                term, doc_freq, postings, offset = decode_binary_postings(self.postings_buffer, offset, self.skip_fields)
+                yield term, doc_freq, postings
+            return
+
+        offset = 0
+        while offset < len(self.postings_buffer):
+            yield self.read_postings(offset)
+            offset = self.postings_buffer.find(b'\n', offset)
+            if offset == -1:
+                break
+            offset += 1
 
     '''
     Returns the pointer to the position of the term in postings.txt
@@ -16,83 +154,218 @@ class PostingsReader:
     def get_postings_ptr(self, query_term):
         # print(query_term)
         postings_ptr = self.binary_search(query_term)
+        return postings_ptr
 
-        # Prints the postings list of the term
-        if postings_ptr != -1: 
-            with open(self.postings_file, 'r') as f:
-                f.seek(postings_ptr, 0)
-                # print("postings list retrieved:", f.readline())
+    '''
+    Returns the doc_freq of the term, or 0 if not found
+    '''
+    def get_doc_freq(self, query_term):
+        postings_ptr, doc_freq, _ = self.lexicon.lookup(query_term)
+        if postings_ptr == -1:
+            return 0
+        if doc_freq is None:
+            # Older pointers.txt files do not store the doc_freq next to the pointer
+            doc_freq = self.read_postings(postings_ptr)[1]
+        return int(doc_freq)
 
-        return postings_ptr
+    '''
+    Returns the champion list of the term, i.e. (docID, tf) of its documents with the highest
+    wt,d / doc_len in increasing docID, an empty list if not found, or None if the index has no
+    champion lists
+    '''
+    def get_champions(self, query_term):
+        if self.champions_buffer is None:
+            return None
+        term_id = self.get_term_id(query_term)
+        if term_id == -1:
+            return []
+        return decode_champion_list(self.champions_buffer, self.champion_offsets[term_id])
+
+    '''
+    Returns the containers of the bitmap of the term, see postings_codec.decode_bitmap_containers,
+    or None if the term is not dense or the index has no bitmaps
+    '''
+    def get_bitmap_containers(self, query_term):
+        term_id = self.get_term_id(query_term)
+        if term_id not in self.bitmap_offsets:
+            return None
+        return decode_bitmap_containers(self.bitmaps_buffer, self.bitmap_offsets[term_id])
 
     '''
-    Returns the doc_freq of the term from postings.txt
+    Returns the docIDs of the documents where term2 follows term1, or None if the pair is not
+    in the biword index, i.e. it is in fewer than biword_min_doc_freq documents, or the index has
+    no biword index
     '''
-    def get_doc_freq(self, postings_ptr):
-        with open(self.postings_file, 'r') as f: 
-            line = f.readline()
-            values = line.split()
-            # print("doc_freq for term ", values[0], "is ", values[1])
-            return values[1]
+    def get_biword_doc_ids(self, term1, term2):
+        if self.biwords_buffer is None:
+            return None
+        term_id1, term_id2 = self.get_term_id(term1), self.get_term_id(term2)
+        if term_id1 == -1 or term_id2 == -1:
+            return None
+        key = np.uint64(term_id1 << 32 | term_id2)
+        index = int(np.searchsorted(self.biword_keys, key))
+        if index == len(self.biword_keys) or self.biword_keys[index] != key:
+            return None
+        return decode_biword_doc_ids(self.biwords_buffer, int(self.biword_offsets[index]))
+
+    '''
+    Returns the synonyms of the term in the synonym table as a list of (word, count) by decreasing
+    WordNet count, [] if the term has no synonym in the dictionary or the index has no synonym table
+    '''
+    def get_synonyms(self, query_term):
+        if self.synonyms_buffer is None:
+            return []
+        term_id = self.get_term_id(query_term)
+        index = int(np.searchsorted(self.synonym_keys, term_id))
+        if term_id == -1 or index == len(self.synonym_keys) or self.synonym_keys[index] != term_id:
+            return []
+        return decode_synonyms(self.synonyms_buffer, int(self.synonym_offsets[index]), self.synonym_word_offsets, self.synonym_words_offset)
+
+    '''
+    Returns the highest wt,d / doc_len in the postings of the term, 0 if not found, or None if
+    term_stats.txt is missing or does not store it
+    '''
+    def get_max_score(self, query_term):
+        if self.term_stats is None or self.term_stats.max_scores is None:
+            return None
+        term_id = self.get_term_id(query_term)
+        return self.term_stats.max_scores[term_id] if term_id != -1 else 0.0
 
     '''
     Returns the integer pointer to the postings list, or -1 if not found. 
     '''
     def binary_search(self, query_term):
+        return self.lexicon.lookup(query_term)[0]
 
-        # print("running binary search...")
-        # Binary search through the DictPtrs 
-        left = 0 
-        right = len(self.pointer_data) - 1
+    '''
+    Returns the termID of the term, i.e. its position in the dictionary, or -1 if not found
+    '''
+    def get_term_id(self, query_term):
+        return self.lexicon.lookup(query_term)[2]
+
+    '''
+    Returns (term, doc_freq) of the termID, i.e. the term at position termID in the dictionary
+    '''
+    def get_term(self, term_id):
+        return self.lexicon.get_term(term_id)
 
-        while left <= right:
-            mid = (left + right) // 2
-            curr_block = self.pointer_data[mid].split(',') # E.g. 12,24968,41204,66916,209555
-            # print(curr_block)
+class TermStatistics:
+    '''
+    Per-term statistics written by VectorSpaceModel.write_term_stats, loaded once into 
+    arrays indexed by termID so that every statistic is an O(1) lookup without I/O
+    '''
+    def __init__(self, stats_file):
+        with open(stats_file, 'rb') as f:
+            self.doc_freqs, self.idfs, self.max_weights, self.postings_lengths, self.max_scores = decode_term_stats(f.read())
+
+class Lexicon:
+    '''
+    In-memory view of the dictionary file and pointers.txt, loaded once. The dictionary
+    is kept as a single string with its blocking layout, only the first term of every 
+    block is decoded up front so that lookups binary search over the blocks and then 
+    decode a single block from memory.
+    '''
+    def __init__(self, dict_file, pointers_file='pointers.txt'):
+        with open(dict_file, 'rb') as f:
+            self.dictionary = f.read()
+        self.front_coded = self.dictionary.startswith(FRONT_CODED_DICTIONARY_HEADER)
+
+        self.block_dict_ptrs = [] # dictionary pointer of each block
+        self.block_postings_ptrs = [] # postings pointers of the terms in each block
+        self.block_doc_freqs = [] # doc_freq of the terms in each block, None if not stored
+        self.block_first_terms = [] # first term of each block, in utf-8 bytes
+        self.decoded_terms = {} # { termID : (term, doc_freq) } of the terms decoded by get_term
+        self.num_lookups = 0 # number of terms looked up, traced by QueryParser
+
+        with open(pointers_file, 'r') as f:
+            pointer_data = f.read().split()
+
+        for block in pointer_data:
+            curr_block = block.split(',') # E.g. 12,24968:3,41204:1,66916:10,209555:2
             dict_ptr = int(curr_block[0])
-            f = open(self.dict_file, 'rb')
-            f.seek(dict_ptr, 0) # Points to |7|carrara|7|carrati|8|carratti|5|carri...
-
-            # Linear search through each block
-            # E.g. |7|claim55|7|claim62|8|claimabl|8|claimant
-            num_of_terms = len(curr_block) - 1
-            first_term = ""
-            last_term = ""
-            for i in range(num_of_terms):
-                count = 0 
-                length_of_term = b''
-
-                while count < 2: 
-                    next_char = f.read(1)
-                    if next_char == b'|':
-                        count += 1
-                    else: 
-                        length_of_term += next_char
-
-                # print('hello', length_of_term)
-                term = f.read(int(length_of_term.decode('utf-8')))
-                term = term.decode('utf-8')
-
-                if i == 0:
-                    first_term = term
-                if i == num_of_terms - 1:
-                    last_term = term
-
-                # Return if matching 
-                if query_term == term:
-                    # print('postings list pointer:', int(curr_block[i + 1]) )
-                    return int(curr_block[i + 1]) 
-                
-            # Terms did not match
-            if query_term < first_term: 
-                right = mid - 1
-
-            elif query_term > last_term:
-                left = mid + 1
-
-            # Terminating clause when term is not found...
-            else: 
+            # Dictionaries written before the last block was flushed do not contain it
+            if dict_ptr >= len(self.dictionary):
                 break
-        
+
+            postings_ptrs = []
+            doc_freqs = []
+            for pointer in curr_block[1:]:
+                postings_ptr, _, doc_freq = pointer.partition(':')
+                postings_ptrs.append(int(postings_ptr))
+                doc_freqs.append(int(doc_freq) if doc_freq else None)
+
+            self.block_dict_ptrs.append(dict_ptr)
+            self.block_postings_ptrs.append(postings_ptrs)
+            self.block_doc_freqs.append(doc_freqs)
+            self.block_first_terms.append(self.read_term(dict_ptr, b'', True)[0])
+
+    '''
+    Returns the number (e.g. the term length) between the two '|' at offset in the 
+    dictionary, and the offset right after it
+    '''
+    def read_number(self, offset):
+        end = self.dictionary.index(b'|', offset + 1)
+        return int(self.dictionary[offset + 1:end]), end
+
+    '''
+    Returns the term at offset in the dictionary in utf-8 bytes, and the offset right 
+    after it. prev_term is the previous term in the block, used to undo front coding.
+    '''
+    def read_term(self, offset, prev_term, is_first):
+        prefix_len = 0
+        term_len, offset = self.read_number(offset)
+        if self.front_coded and not is_first:
+            prefix_len = term_len
+            term_len, offset = self.read_number(offset)
+        offset += 1
+        term = prev_term[:prefix_len] + self.dictionary[offset:offset + term_len]
+        return term, offset + term_len
+
+    '''
+    Returns (postings_ptr, doc_freq, termID) of the term, or (-1, 0, -1) if not found. 
+    doc_freq is None if it is not stored in pointers.txt.
+    '''
+    def lookup(self, query_term):
+        self.num_lookups += 1
+        query_term = query_term.encode('utf-8')
+
+        # Binary search through the first term of each block
+        block = bisect.bisect_right(self.block_first_terms, query_term) - 1
+        if block < 0:
+            return -1, 0, -1
+
+        # Linear search through the block
+        # E.g. |7|claim55|6|1|2|62|5|3|abl|6|2|nt
+        offset = self.block_dict_ptrs[block]
+        term = b''
+        for i in range(len(self.block_postings_ptrs[block])):
+            if offset >= len(self.dictionary):
+                break
+            term, offset = self.read_term(offset, term, i == 0)
+            if query_term == term:
+                term_id = block * len(self.block_postings_ptrs[0]) + i
+                return self.block_postings_ptrs[block][i], self.block_doc_freqs[block][i], term_id
+            if query_term < term:
+                break
+
         # print("Term not found in dictionary...")
-        return -1 
\ No newline at end of file
+        return -1, 0, -1
+
+    '''
+    Returns (term, doc_freq) of the term at position term_id in the dictionary. Every block
+    but the last holds the same number of terms, so the block is found by division.
+    '''
+    def get_term(self, term_id):
+        if term_id in self.decoded_terms:
+            return self.decoded_terms[term_id]
+
+        block_size = len(self.block_postings_ptrs[0])
+        block, index = divmod(term_id, block_size)
+
+        offset = self.block_dict_ptrs[block]
+        term = b''
+        for i in range(index + 1):
+            term, offset = self.read_term(offset, term, i == 0)
+
+        self.decoded_terms[term_id] = (term.decode('utf-8'), self.block_doc_freqs[block][index])
+        return self.decoded_terms[term_id]
@@ -0,0 +1,69 @@
+import os
+import pickle
+
+from postings_cache import PostingsCache
+
+class QueryCache(PostingsCache):
+    '''
+    LRU cache of the results of process_query and of their intermediate term vectors (the WordNet
+    expansion and the Rocchio term vectors), bounded by a number of entries as well as an estimated
+    number of bytes. Keys are (kind, index version, ...), see QueryParser.get_query_key, where the
+    index version is None for entries that do not depend on the index, so that the entries of a
+    previous index are never hit and are dropped by retain_version. With a cache_file, the cache
+    is loaded from it and save writes it back, so that it is kept between runs.
+    '''
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, cache_file=None):
+        super().__init__(max_bytes)
+        self.max_entries = max_entries
+        self.cache_file = cache_file
+        if cache_file is not None and os.path.exists(cache_file):
+            self.load()
+
+    '''
+    Caches the value of the key, evicting the least recently used entries until it fits in
+    max_entries and max_bytes. A cache of 0 entries caches nothing.
+    '''
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.curr_bytes -= self.entries.pop(key)[1]
+        if self.max_entries == 0 or size > self.max_bytes:
+            return
+
+        while len(self.entries) >= self.max_entries:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.curr_bytes -= evicted_size
+            self.evictions += 1
+        super().put(key, value, size)
+
+    '''
+    Drops the entries of every other index version, keeping the ones that do not depend on the index
+    '''
+    def retain_version(self, index_version):
+        for key in [key for key in self.entries if key[1] is not None and key[1] != index_version]:
+            self.curr_bytes -= self.entries.pop(key)[1]
+
+    '''
+    Loads the entries saved into cache_file, least recently used first. A cache_file that cannot
+    be read is ignored.
+    '''
+    def load(self):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                entries = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            print("ignoring unreadable query cache", self.cache_file)
+            return
+        for key, (value, size) in entries:
+            self.put(key, value, size)
+
+    '''
+    Writes the entries into cache_file. The cache is written into a temporary file and renamed, so
+    that a run never loads a partially written cache.
+    '''
+    def save(self):
+        if self.cache_file is None:
+            return
+        with open(self.cache_file + ".tmp", 'wb') as f:
+            pickle.dump(list(self.entries.items()), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.cache_file + ".tmp", self.cache_file)
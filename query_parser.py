@@ -1,149 +1,498 @@
-from stack import Stack
 import math
 import heapq
 import collections
-import nltk
+import functools
+import contextlib
 import numpy as np
 import os
-import time
-
-import multiprocessing
-import threading
-import queue
+import sys
+import getopt
+import subprocess
 
-from nltk.stem.porter import PorterStemmer
 from postings_reader import PostingsReader
-
-import ssl
-ssl._create_default_https_context = ssl._create_unverified_context
-
-nltk.download('wordnet')
-nltk.download('stopwords')
-
-from nltk.corpus import wordnet
-from nltk.corpus import stopwords
+from index_files import get_main_file, read_index_version, read_manifest
+from doc_fields import read_fields
+from postings_cache import PostingsCache, estimate_doc_ids_size
+from query_cache import QueryCache
+from query_trace import QueryTrace
+from postings_cursor import ListCursor, SkipCursor, intersect
+from doc_bitmap import DocBitmap
+from phrase_matcher import match_phrase, match_phrase_at
+from tokenizer import NLTK_MODE, get_tokenizer
+from postings_codec import decode_text_postings, weighted_tf
 from string import punctuation
 
+# The WordNet and stopwords corpora are only needed for query expansion (approach 2), so they are
+# loaded on first use and never downloaded at startup. Install them once with
+#   python3 -m nltk.downloader wordnet stopwords
+
+@functools.lru_cache(maxsize=None)
+def load_wordnet():
+    """
+    Method to load the WordNet corpus, on the first query expanded with WordNet
+    """
+    from nltk.corpus import wordnet
+    wordnet.ensure_loaded()
+    return wordnet
+
+@functools.lru_cache(maxsize=None)
+def load_stop_words():
+    """
+    Method to load the set of English stopwords, on the first query whose expansion is filtered
+    """
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+# Number of WordNet synonyms, by decreasing count, added to a query expanded with approach 2
+MAX_EXPANSION_WORDS = 50
+
+# Relative margin added to the score upper bounds of MaxScore, so that rounding differences between a
+# bound and the score it bounds never prune a document of the top K
+MAX_SCORE_TOLERANCE = 1e-9
+
+# A filtered query reads the postings of a term through its skip pointers, for the documents that pass
+# the filters only, if the term is in more than FILTER_CURSOR_RATIO times as many documents
+FILTER_CURSOR_RATIO = 4
+
+# Stage of a query that is not traced, see QueryParser.stage
+NO_TRACE = contextlib.nullcontext()
+
+# Maximum time in milliseconds to import this module in a fresh interpreter, checked by the __main__
+# of this module. Most of it is the import of nltk by tokenizer.py.
+IMPORT_TIME_BUDGET_MS = 1000
+
+# Modules of the indexer, which searching an index without delta segments never needs
+INDEXER_MODULES = ('index_vector_space_model', 'index_writer', 'index_segments')
+
+# Run in a fresh interpreter by measure_import_time: prints the import time in milliseconds, whether
+# the import loaded the WordNet corpus (a LazyCorpusLoader replaces itself once loaded), and whether
+# it imported the indexer
+IMPORT_TIME_SCRIPT = """
+import sys
+import time
+st = time.perf_counter()
+import query_parser
+elapsed = (time.perf_counter() - st) * 1000
+from nltk.corpus import wordnet
+print(elapsed, type(wordnet).__name__ != 'LazyCorpusLoader', any(module in sys.modules for module in query_parser.INDEXER_MODULES))
+"""
+
+def measure_import_time(num_runs=5):
+    """
+    Method to measure the time to import this module, in fresh interpreters so that nothing is cached
+
+        Returns:
+            the fastest import time of num_runs runs in milliseconds, and whether any import loaded WordNet
+            or the indexer
+    """
+    times = []
+    loaded_wordnet = loaded_indexer = False
+    for _ in range(num_runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_TIME_SCRIPT], check=True, capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        times.append(float(output[-3]))
+        loaded_wordnet = loaded_wordnet or output[-2] == 'True'
+        loaded_indexer = loaded_indexer or output[-1] == 'True'
+    return min(times), loaded_wordnet, loaded_indexer
 
-class FileReaderThread(threading.Thread):
-    def __init__(self, file, chunk_size, output_queue):
-        threading.Thread.__init__(self)
-        self.file = file
-        self.chunk_size = chunk_size
-        self.output_queue = output_queue
-
-    def run(self):
-        chunk = self.file.read(self.chunk_size)
-        while chunk:
-            doc_weights_dic = collections.defaultdict()
-            for line in chunk.strip().split('\n'):
-                context = ''
-                try:
-                    context, occurrences, postings = line.split(' ', 2)
-                    posting = Posting(context, occurrences, postings)
-                    doc_weights_dic[context] = posting
-                except:
-                    print("An error occurred", context)
-            self.output_queue.put(doc_weights_dic)
-            chunk = self.file.read(self.chunk_size)
-        self.output_queue.put(None)
 
 class Posting:
 
-    def __init__(self, context = "", occurrences = 0, postings = {}):
+    def __init__(self, context = "", occurrences = 0, postings = {}, positions_reader = None):
         self.context = context
         self.occurrences = occurrences
         self.postings = {}
-        if self.occurrences != 0:
+        # docIDs of the postings in ascending order, sorted on first use by get_doc_ids
+        self.doc_ids = None
+        # (doc indices, wt,d) arrays of the postings, built on first use by get_arrays
+        self.arrays = None
+        # Reads the positions of a document from the positional stream of the binary postings file
+        self.positions_reader = positions_reader
+        if isinstance(postings, dict):
+            # Postings already decoded from the binary postings file, without positions
+            self.postings = postings
+        elif self.occurrences != 0:
             self.parse_postings(postings)
         
 
     def parse_postings(self, postings):
         try:
-            postings_list = postings.split(' ')
-            last_doc_id = 0  # keep track of the last processed doc_id
-            for posting in postings_list:
-                parts = posting.split(':')
-                doc_id_increment, weight = parts[0].split(',')
-                doc_id = last_doc_id + int(doc_id_increment)
-                positions = []
-                last_position = 0
-                for p in parts[1].split(','):
-                    position = last_position + int(p)
-                    positions.append(position)
-                    last_position = position
-                self.postings[doc_id] = {'weight': float(weight), 'positions': positions}
-                last_doc_id = doc_id  # update the last processed doc_id
+            self.postings = decode_text_postings(postings)
         except:
             print('issue with parsing with term', self.context)
+
+    '''
+    Returns the positions of the term in doc_id. Positions of the binary postings file
+    are only decoded here, so that ranked retrieval never decodes them.
+    '''
+    def get_positions(self, doc_id):
+        props = self.postings[doc_id]
+        if 'positions' in props:
+            return props['positions']
+        # Documents merged in from a delta segment carry the positions reader of their segment
+        positions_reader = props.get('positions_reader', self.positions_reader)
+        return positions_reader(props['positions_ptr'], props['tf'])
+
+    '''
+    Returns the docIDs of the postings in ascending order
+    '''
+    def get_doc_ids(self):
+        if self.doc_ids is None:
+            self.doc_ids = sorted(self.postings)
+        return self.doc_ids
+
+    '''
+    Returns the postings as two arrays, the index of every document in doc_index and its wt,d
+    '''
+    def get_arrays(self, doc_index):
+        if self.arrays is None:
+            indices = np.fromiter((doc_index[doc_id] for doc_id in self.postings), dtype=np.int64, count=len(self.postings))
+            weights = np.fromiter((props['weight'] for props in self.postings.values()), dtype=np.float64, count=len(self.postings))
+            self.arrays = (indices, weights)
+        return self.arrays
+
+    '''
+    Returns an estimate of the memory used by the decoded postings, in bytes
+    '''
+    def estimate_size(self):
+        # Per document: the dict entry, its props dict and values, its slot in doc_ids and in arrays
+        # Per position: the list slot and the int
+        size = 100 + len(self.context)
+        for props in self.postings.values():
+            size += 344 + 36 * len(props.get('positions', ()))
+        return size
+
+class DenseScores:
+    '''
+    Scores of a query in a dense vector indexed like QueryParser.doc_id_array, along with the
+    documents that have a score, i.e. that contain at least one query term. Reads like the
+    { docID : score } dictionary of the documents that have a score.
+    '''
+    def __init__(self, doc_id_array, scores, scored):
+        self.doc_id_array = doc_id_array
+        self.scores = scores
+        self.scored = scored
+
+    def items(self):
+        indices = np.flatnonzero(self.scored)
+        return zip(self.doc_id_array[indices].tolist(), self.scores[indices].tolist())
+
+    def __getitem__(self, doc_id):
+        index = np.searchsorted(self.doc_id_array, doc_id)
+        if index == len(self.doc_id_array) or self.doc_id_array[index] != doc_id or not self.scored[index]:
+            raise KeyError(doc_id)
+        return float(self.scores[index])
+
+    def __len__(self):
+        return int(np.count_nonzero(self.scored))
+
+    '''
+    Returns the docIDs of the K highest scores, ties going to the lower docID like
+    QueryParser.get_top_K_components. argpartition finds the K-th highest score, and only the
+    documents scoring at least as high are sorted.
+    '''
+    def top_K(self, K):
+        if K <= 0:
+            return []
+        indices = np.flatnonzero(self.scored)
+        scores = self.scores[indices]
+        if K < len(indices):
+            kth_score = scores[np.argpartition(scores, len(scores) - K)[len(scores) - K]]
+            candidates = scores >= kth_score
+            indices, scores = indices[candidates], scores[candidates]
+        # sort by decreasing score, then by increasing docID
+        order = np.lexsort((indices, -scores))[:K]
+        return self.doc_id_array[indices[order]].tolist()
+
 class QueryParser:
 
-    def __init__(self, dict_file, postings_file):
+    def __init__(self, dict_file, postings_file, postings_cache=None, tokenizer_mode=NLTK_MODE, vectorized=True, query_cache=None, tracing=False):
         # N represents the total number of articles in the dataset.
         self.N = 0
         self.K = 10
         self.dict_file = dict_file
         self.postings_file = postings_file
         self.doc_lengths = dict()
-        self.postings_reader = PostingsReader(dict_file, postings_file)
-        self.stemmer = PorterStemmer()
+        self.forward_ptrs = dict()
+        # The manifest is read once, so that the main index and the delta segments are the ones of the same
+        # generation even if a merge publishes a new one meanwhile, see index_segments.merge_segments
+        manifest = read_manifest()
+        # Directory of the main index, the current directory unless it was merged with delta segments
+        self.main_dir = manifest[0]
+        # The main index and its delta segments, None if the index has no delta segments
+        self.segments = None
+        if len(manifest[1]) != 0:
+            # the segments need the indexer to merge them, only imported for indexes with delta segments
+            from index_segments import IndexSegments
+            self.segments = IndexSegments(dict_file, postings_file, manifest=manifest)
+        self.postings_reader = self.segments.readers[0] if self.segments is not None else \
+            PostingsReader(get_main_file(dict_file, self.main_dir), get_main_file(postings_file, self.main_dir), self.main_dir)
+        # Decoded postings lists, pass the same PostingsCache to share it between QueryParsers
+        self.postings_cache = postings_cache if postings_cache is not None else PostingsCache()
+        # Version of the index and of its delta segments, None if one of them was built before index_version.txt existed
+        versions = [read_index_version(self.main_dir)] + ([read_index_version(segment) for segment in self.segments.delta_dirs] if self.segments is not None else [])
+        self.index_version = '+'.join(versions) if None not in versions else None
+        # Results and term vectors of previous queries, pass a QueryCache with a cache file to keep them between runs
+        self.query_cache = query_cache if query_cache is not None else QueryCache()
+        self.query_cache.retain_version(self.index_version)
+        # Expand the queries with the synonym table of synonym_table.py rather than WordNet, unless the
+        # table is missing, was built for another version of the index, or the index has delta segments
+        self.use_synonym_table = self.segments is None and self.index_version is not None \
+            and self.postings_reader.synonym_version == self.index_version
+        # Same tokenizer as the one used to build the index, its stem cache is shared by the whole process
+        self.tokenizer = get_tokenizer(tokenizer_mode)
         self.term_weights_dict = collections.defaultdict()
-        
+        # Postings of the last query scored with MaxScore, see score_top_K
+        self.pruning_stats = {'postings': 0, 'scored': 0, 'skipped': 0}
+        # Candidates of the last query scored against the champion lists, see score_champions
+        self.tier_stats = {'candidates': 0, 'fallback': False}
+        # Postings read by the last filtered query, see score_terms
+        self.filter_stats = {'candidates': 0, 'postings': 0, 'total_postings': 0}
+        # Court, date and title of every document, loaded by the first filtered query
+        self.fields = None
+        # With tracing, every query records the wall time and the postings read of its stages into a
+        # QueryTrace, the one of the query running and the one of the last query
+        self.tracing = tracing
+        self.trace = None
+        self.last_trace = None
+        # The document table is loaded once and reused by every query
+        self.doc_lengths = self.get_document(os.path.join(self.main_dir, "document.txt"))
+        self.vectorized = vectorized
+
+    # Dense view of the document table for vectorized scoring and filters: the docIDs in ascending order,
+    # the index of every docID in it, and the length of every document at the same index. Built on first
+    # use, so that boolean queries without filters never build it.
+
+    @functools.cached_property
+    def doc_id_array(self):
+        return np.array(sorted(self.doc_lengths), dtype=np.int64)
+
+    @functools.cached_property
+    def doc_index(self):
+        return {doc_id: index for index, doc_id in enumerate(self.doc_id_array.tolist())}
+
+    @functools.cached_property
+    def doc_length_array(self):
+        return np.array([self.doc_lengths[doc_id] for doc_id in self.doc_id_array.tolist()], dtype=np.float64)
+
+
+    def process_query(self, query, K, approach=1, pruning=False, tiered=False, filters=None):
+        if not self.tracing:
+            return self.execute_query(query, K, approach, pruning, tiered, filters)
+
+        self.trace = QueryTrace(self.get_trace_counters)
+        try:
+            with self.stage('query', query=query[0], K=K, approach=approach, pruning=pruning, tiered=tiered, filters=filters):
+                return self.execute_query(query, K, approach, pruning, tiered, filters)
+        finally:
+            self.last_trace = self.trace
+            self.trace = None
 
-    def process_query(self, query, K, approach=1):
+    def execute_query(self, query, K, approach, pruning, tiered, filters):
         self.K = K
         
         print("processing query...")
-        self.doc_lengths = self.get_document("document.txt")
+
+        # Documents that pass the filters, as a mask over the document table, applied before scoring
+        filter_mask = None
+        if filters:
+            with self.stage('filters'):
+                filter_mask = self.get_filter_mask(filters)
+        filters_key = self.get_filters_key(filters)
 
         if 'AND' in query[0]:
-            results = self.process_boolean_query(query)
+            result_key = self.get_query_key('boolean', query, filters_key)
+            results = self.get_cached_results(result_key)
+            if results is not None:
+                return results
+            with self.stage('boolean'):
+                results = self.process_boolean_query(query, filter_mask)
         else:
             if approach == 2:
                 # Second optimization: Perform filtering and query optimzation with WordNet
-                new_query_terms = self.filter_relevant_words(query[0], self.tokenize_query(query[0]))
+                # The WordNet expansion only depends on the words of the query, the synonym table on the index too
+                with self.stage('expansion'):
+                    expansion_key = ('expansion', self.index_version if self.use_synonym_table else None, ' '.join(query[0].split()))
+                    new_query_terms = self.query_cache.get(expansion_key)
+                    if new_query_terms is None:
+                        new_query_terms = self.filter_relevant_words(query[0], self.tokenize_query(query[0]))
+                        self.query_cache.put(expansion_key, new_query_terms, 100 + sum(60 + len(term) for term in new_query_terms))
                 query[0] = query[0] + ' ' + ' '.join(new_query_terms)
 
-            normalization_query_vectors, score_dict = self.process_freetext_query(query)
-            # Get top K documents
-            top_documents = self.get_top_K_components(score_dict, self.K)
-            # TESTING
-            # top_documents = []    
-            if len(query) > 1:
-                other_relevant_docs = [doc_id for doc_id in query[1:]]
-                for doc_id in other_relevant_docs:
-                    top_documents.append(int(doc_id))
-                    
-            # First optimization: Start of Pseudo Relevance Feedback (RF)
-            
-            # print("doing rocchio")
-            new_query_vectors = self.rocchio(normalization_query_vectors, top_documents)
-            # print("finished rocchio")
-            top_term_vectors = self.get_top_K_word_vectors(new_query_vectors, 100)
-            # new_query_terms = self.filter_relevant_words(self.tokenize_query(query[0]), top_term_vectors, False)
-            
-            if approach == 1:
-                # First optimization: Start of Pseudo Relevance Feedback (RF)
-                # Get top K documents
-                top_documents = self.get_top_K_components(score_dict, self.K)
-                if len(query) > 1:
-                    other_relevant_docs = [doc_id for doc_id in query[1:]]
-                    for doc_id in other_relevant_docs:
-                        top_documents.append(int(doc_id))
-                new_query_vectors = self.rocchio(normalization_query_vectors, top_documents)
-                top_term_vectors = self.get_top_K_word_vectors(new_query_vectors, 100)
+            result_key = self.get_query_key('results', query, K, approach, tiered, filters_key)
+            results = self.get_cached_results(result_key)
+            if results is not None:
+                return results
+
+            # The Rocchio term vectors only need the top K documents of the first pass, and are cached
+            # apart from the results, which are much larger and evicted first
+            rocchio_key = self.get_query_key('rocchio', query, K, approach, tiered, filters_key)
+            top_term_vectors = self.query_cache.get(rocchio_key) if rocchio_key is not None else None
+            if top_term_vectors is not None:
+                normalization_query_vectors = self.get_query_normalization_vectors(collections.Counter(self.tokenize_query(query[0])))
+            else:
+                with self.stage('feedback'):
+                    normalization_query_vectors, top_term_vectors = self.process_feedback(query, approach, pruning, tiered, filter_mask)
+                if rocchio_key is not None:
+                    self.query_cache.put(rocchio_key, top_term_vectors, 100 + sum(100 + len(term) for _, term in top_term_vectors))
 
             # Update query terms into normalization_query_vectors
             for term in top_term_vectors:
                 normalization_query_vectors[term[1]] = term[0]
 
-            normalization_query_vectors, score_dict = self.process_freetext_query(query, normalization_query_vectors)
+            with self.stage('freetext', final=True):
+                normalization_query_vectors, score_dict = self.process_freetext_query(query, normalization_query_vectors, tiered=tiered,
+                                                                                      filter_mask=filter_mask)
             
-            top_documents = self.get_top_K_components(score_dict, self.N)
+            with self.stage('top_k'):
+                top_documents = self.get_top_K_components(score_dict, self.N)
             results = top_documents
 
+        if result_key is not None:
+            self.query_cache.put(result_key, tuple(results), estimate_doc_ids_size(results))
         return results
 
+    '''
+    Runs the first free text pass of the query and pseudo relevance feedback on its top K documents.
+    Returns the normalized query vectors of the query and the top term vectors of Rocchio
+    '''
+    def process_feedback(self, query, approach, pruning, tiered, filter_mask=None):
+        # Only the top K documents of the first pass are used, MaxScore can skip the others
+        with self.stage('freetext', final=False):
+            normalization_query_vectors, score_dict = self.process_freetext_query(query, K=self.K if pruning else None, tiered=tiered,
+                                                                                  filter_mask=filter_mask)
+        # Get top K documents
+        with self.stage('top_k'):
+            top_documents = self.get_top_K_components(score_dict, self.K)
+        if len(query) > 1:
+            other_relevant_docs = [doc_id for doc_id in query[1:]]
+            for doc_id in other_relevant_docs:
+                top_documents.append(int(doc_id))
+                
+        # First optimization: Start of Pseudo Relevance Feedback (RF)
+        with self.stage('rocchio', docs=len(top_documents)):
+            new_query_vectors = self.rocchio(normalization_query_vectors, top_documents)
+        top_term_vectors = self.get_top_K_word_vectors(new_query_vectors, 100)
+        
+        if approach == 1:
+            # First optimization: Start of Pseudo Relevance Feedback (RF)
+            # Get top K documents
+            with self.stage('top_k'):
+                top_documents = self.get_top_K_components(score_dict, self.K)
+            if len(query) > 1:
+                other_relevant_docs = [doc_id for doc_id in query[1:]]
+                for doc_id in other_relevant_docs:
+                    top_documents.append(int(doc_id))
+            with self.stage('rocchio', docs=len(top_documents)):
+                new_query_vectors = self.rocchio(normalization_query_vectors, top_documents)
+            top_term_vectors = self.get_top_K_word_vectors(new_query_vectors, 100)
+
+        return normalization_query_vectors, top_term_vectors
+
+    '''
+    Returns the key of the query in the query cache: the kind of the entry, the index version and
+    the normalized query, i.e. the stemmed terms of a free text query, or the sorted operands of a
+    boolean query, along with the other lines of the query file (the relevant docIDs) and the
+    parameters the entry depends on. MaxScore returns the same top K, so pruning is not part of it.
+    Returns None if the index has no version, as entries could not be invalidated.
+    '''
+    def get_query_key(self, kind, query, *parameters):
+        if self.index_version is None:
+            return None
+        if kind == 'boolean':
+            operands = [t.strip('"') for t in query[0].split(' AND ')]
+            normalized = tuple(sorted((self.is_phrase(t), tuple(self.tokenize_boolean_query(t))) for t in operands))
+        else:
+            normalized = tuple(self.tokenize_query(query[0]))
+        return (kind, self.index_version, normalized, tuple(query[1:])) + parameters
+
+    '''
+    Returns a copy of the cached results of the key, or None if they are not cached
+    '''
+    def get_cached_results(self, result_key):
+        if result_key is None:
+            return None
+        with self.stage('query_cache'):
+            results = self.query_cache.get(result_key)
+        if results is None:
+            return None
+        print("results found in the query cache")
+        self.pruning_stats = {'postings': 0, 'scored': 0, 'skipped': 0}
+        self.tier_stats = {'candidates': 0, 'fallback': False}
+        self.filter_stats = {'candidates': 0, 'postings': 0, 'total_postings': 0}
+        return list(results)
+
+    '''
+    Returns a context manager recording a stage of the query running into its QueryTrace when
+    the query is traced, and doing nothing otherwise
+    '''
+    def stage(self, name, **args):
+        return self.trace.stage(name, **args) if self.trace is not None else NO_TRACE
+
+    '''
+    Returns the counters recorded by every stage of a traced query: the terms looked up in the
+    dictionary, the bytes and postings of the postings lists decoded and of the postings read
+    through cursors, the positions decoded, the document vectors read for Rocchio, and the hits
+    and misses of the caches
+    '''
+    def get_trace_counters(self):
+        readers = self.segments.readers if self.segments is not None else [self.postings_reader]
+        cursors = self.trace.cursors if self.trace is not None else []
+        return {'dictionary_lookups': sum(reader.lexicon.num_lookups for reader in readers),
+                'postings_bytes': sum(reader.postings_bytes for reader in readers) + sum(cursor.num_bytes for cursor in cursors),
+                'postings_decoded': sum(reader.postings_decoded for reader in readers) + sum(cursor.num_decoded for cursor in cursors),
+                'positions_decoded': sum(reader.positions_decoded for reader in readers),
+                'doc_vectors_read': sum(reader.doc_vectors_read for reader in readers),
+                'postings_cache_hits': self.postings_cache.hits, 'postings_cache_misses': self.postings_cache.misses,
+                'query_cache_hits': self.query_cache.hits, 'query_cache_misses': self.query_cache.misses}
+
+    '''
+    Returns the filters as a key of the query cache, None without filters
+    '''
+    def get_filters_key(self, filters):
+        if not filters:
+            return None
+        return tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in filters.items()))
+
+    '''
+    Returns a NumPy array of bool indexed like doc_id_array, True for the documents that pass the
+    filters, see doc_fields.DocFields.filter_mask. Raises ValueError if the index has no fields.txt.
+    '''
+    def get_filter_mask(self, filters):
+        if self.fields is None:
+            self.fields = self.segments.get_fields() if self.segments is not None else read_fields(self.main_dir)
+            if self.fields is None or not np.array_equal(self.fields.doc_ids, self.doc_id_array):
+                self.fields = None
+                raise ValueError("the index has no fields.txt matching its documents, rebuild it with index.py to filter queries")
+        return self.fields.filter_mask(filters, self.tokenize_query)
+
+    '''
+    Returns the terms of a query, i.e. of the first line of a query file
+    '''
+    def get_query_terms(self, query):
+        if 'AND' not in query:
+            return self.tokenize_query(query)
+
+        terms = []
+        for t in query.split(' AND '):
+            terms += self.tokenize_boolean_query(t.strip('"'))
+        return terms
+
+    '''
+    Fetches the postings of the terms shared by several queries of a batch once, in the order of 
+    the postings file, so that the following queries find them in the postings cache. 
+    Returns the prefetched terms.
+    '''
+    def prefetch_postings(self, queries):
+        term_counts = collections.Counter()
+        for query in queries:
+            term_counts.update(set(self.get_query_terms(query)))
+
+        shared_terms = [term for term, count in term_counts.items() if count > 1]
+        shared_terms.sort(key=self.postings_reader.get_postings_ptr)
+        for term in shared_terms:
+            self.get_postings_list(term)
+        return shared_terms
 
     # ==========================================================================
     # ====================== BOOLEAN QUERY PROCESSING ==========================
@@ -153,59 +502,61 @@ class QueryParser:
     - "fertility treatment" AND "sus words" AND chicken AND nuggets
     - chicken AND nuggets 
     '''
-    def process_boolean_query(self, query):
+    def process_boolean_query(self, query, filter_mask=None):
         print("processing boolean query...")
 
         # Split the query string into terms using 'AND' as the delimiter
         terms = query[0].split(' AND ')
-        # print(terms)
 
-        # 1. Go through the entire query and put it into a py dict.
-        # Put phrasal queries in a separate dictionary, where the key is the phrasal query and the value is the postings list. 
-        terms_postings_list = {} # Key: term, Value: postings list
-        terms_doc_freq = {} # Key: term, Value: doc_freq
-        
-        # Process phrasal queries
+        # 1. Put every single term, and every term of the phrasal queries, into a DocBitmap if it is dense
+        # or else a cursor over its postings, without decoding them. The pairs of adjacent terms of a
+        # phrase that are in the biword index are put in as the cursor over their documents instead of
+        # their terms, and a phrase of two such terms needs no positions. A term without any document
+        # empties the whole query.
+        operands = {}
+        phrases = []
         for t in terms:
             t = t.strip('"')
-            postings_result_set = set()
             if self.is_phrase(t):
-                phrasal_terms = self.tokenize_boolean_query(t) # Returns a list of up to 3 terms (phrase)
-                # print(phrasal_terms)
-                postings_result_set = self.process_phrase(phrasal_terms)
-                # print("These are the results:", postings_result_set)
-                
-                # Add to temp dictionaries to do AND operations
-                # print(t, postings_result_set)
-                terms_postings_list[t] = postings_result_set
-                terms_doc_freq[t] = len(postings_result_set)
-
-            else: 
-                # Put the term's doc_feq in the query_terms dict
-                term = self.tokenize_boolean_query(t)
-                postings_list = self.get_postings_list(term[0]).postings
-                terms_postings_list[t] = set(postings_list.keys())
-                terms_doc_freq[t] = len(set(postings_list.keys()))
-        
-        # print(terms_postings_list)
-        # print(terms_doc_freq)
-
-        # 2. Loop, maintaining a stack of size 2 to operate 'AND' on.
-        self_combining_stack = Stack()
-        while terms_doc_freq: 
-            
-            # 2a. Pop the smallest value in the dictionary, get the postings list of the key, and add it to the stack. 
-            min_key = min(terms_doc_freq, key=terms_doc_freq.get)
-            # print(min_key)
-            postings_list = terms_postings_list[min_key]
-            # print(postings_list)
-            terms_doc_freq.pop(min_key)
-
-            # 2b. Add to operator stack
-            self_combining_stack.push(postings_list)
-            
-        common_docs = self_combining_stack.pop()
-        return list(common_docs)
+                phrase = self.tokenize_boolean_query(t)
+                biword_terms = set()
+                for term1, term2 in zip(phrase, phrase[1:]):
+                    doc_ids = self.get_biword_doc_ids(term1, term2)
+                    if doc_ids is not None:
+                        operands[(term1, term2)] = ListCursor(doc_ids)
+                        biword_terms.update((term1, term2))
+                if len(phrase) != 2 or len(biword_terms) == 0:
+                    phrases.append(phrase)
+                operand_terms = [term for term in phrase if term not in biword_terms]
+            else:
+                operand_terms = [self.tokenize_boolean_query(t)[0]]
+            for term in operand_terms:
+                if term not in operands:
+                    operands[term] = self.get_postings_bitmap(term)
+                    if operands[term] is None:
+                        operands[term] = self.get_postings_cursor(term)
+                    if len(operands[term]) == 0:
+                        return []
+
+        # The documents that pass the filters are one more operand
+        if filter_mask is not None:
+            operands[('filters',)] = ListCursor(self.doc_id_array[filter_mask].tolist())
+            if len(operands[('filters',)]) == 0:
+                return []
+
+        # 2. Intersect them from the one with the fewest documents, see postings_cursor.intersect. Every
+        # document of the query is in the candidates, so phrases are only matched against them.
+        with self.stage('intersect', operands=len(operands)):
+            candidates = intersect(list(operands.values()))
+
+        # 3. Match the phrases in the candidates, stopping as soon as no candidate is left
+        for phrase in phrases:
+            if len(candidates) == 0:
+                break
+            with self.stage('phrase', terms=phrase, candidates=len(candidates)):
+                postings_result_set = self.process_phrase(phrase, candidates)
+            candidates = [doc_id for doc_id in candidates if doc_id in postings_result_set]
+        return candidates
 
     # ======================================================================
     # ====================== FREE TEXT PROCESSING ==========================
@@ -215,12 +566,10 @@ class QueryParser:
     - quiet phone call
     - good grades exchange scandal
     '''
-    def process_freetext_query(self, query, normalization_query_vectors = []):
+    def process_freetext_query(self, query, normalization_query_vectors = [], K = None, tiered = False, filter_mask = None):
         # Collection to count the occurences of a term in a query
         query_count_dict = collections.defaultdict(lambda: 0)
 
-        score_dict = collections.defaultdict(float)
-
         terms = self.tokenize_query(query[0])
 
         for term in terms:
@@ -228,7 +577,33 @@ class QueryParser:
 
         if len(normalization_query_vectors) == 0:
             # Get normalization query vectors
-            normalization_query_vectors = self.get_query_normalization_vectors(query_count_dict)
+            with self.stage('query_vector'):
+                normalization_query_vectors = self.get_query_normalization_vectors(query_count_dict)
+
+        with self.stage('scoring', terms=len(terms)):
+            return self.score_freetext_query(terms, normalization_query_vectors, K, tiered, filter_mask)
+
+    '''
+    Scores the documents of the terms of a free text query, returning the normalized query vectors
+    and the scores like process_freetext_query
+    '''
+    def score_freetext_query(self, terms, normalization_query_vectors, K, tiered, filter_mask):
+        score_dict = collections.defaultdict(float)
+
+        if tiered:
+            # Only score the documents of the champion lists, if there are at least K of them
+            champion_scores = self.score_champions(terms, normalization_query_vectors, self.K, filter_mask)
+            if champion_scores is not None:
+                return normalization_query_vectors, champion_scores
+
+        if K is not None and filter_mask is None:
+            # Only score the documents that can be in the top K
+            top_K_scores = self.score_top_K(terms, normalization_query_vectors, K)
+            if top_K_scores is not None:
+                return normalization_query_vectors, top_K_scores
+
+        if self.vectorized:
+            return normalization_query_vectors, self.score_terms(terms, normalization_query_vectors, filter_mask=filter_mask)
 
         # Calculate the scores of each term w.r.t document
         for term in terms:
@@ -238,6 +613,8 @@ class QueryParser:
             postings_list = posting_obj.postings
 
             for document_id, props in postings_list.items():
+                if filter_mask is not None and not filter_mask[self.doc_index[document_id]]:
+                    continue
                 w_td = props['weight']
 
                 score_dict[document_id] += w_tq * w_td
@@ -248,6 +625,190 @@ class QueryParser:
 
         return normalization_query_vectors, score_dict
     
+    '''
+    Scores the query against the champion lists of its terms (tier 1) instead of their full postings:
+    a document only gets the score of the terms where it is one of the documents with the highest
+    wt,d / doc_len, and documents in no champion list are left out. The ranking is approximate, but
+    a query only reads a few postings per term, however long its postings are.
+
+    Returns the scores as DenseScores, or None to fall back to the full postings if fewer than K
+    documents are in the champion lists, or if the index has no champion lists
+    '''
+    def score_champions(self, terms, normalization_query_vectors, K, filter_mask=None):
+        champion_postings = {}
+        for term in terms:
+            champion_postings[term] = self.get_champion_postings(term)
+            if champion_postings[term] is None:
+                return None
+
+        candidates = set()
+        for posting in champion_postings.values():
+            candidates.update(doc_id for doc_id in posting.postings if filter_mask is None or filter_mask[self.doc_index[doc_id]])
+        fallback = len(candidates) < K
+        self.tier_stats = {'candidates': len(candidates), 'fallback': fallback}
+        print("champion lists: {} candidates{}".format(len(candidates), ", falling back to the full postings" if fallback else ""))
+        if fallback:
+            return None
+        return self.score_terms(terms, normalization_query_vectors, champion_postings, filter_mask)
+
+    '''
+    Scores the documents of the terms into a dense vector, one vectorized update per term.
+    Every document gets the same additions in the same order as the loop of
+    process_freetext_query, so the scores are the same.
+
+    With filter_mask, only the documents that pass the filters are scored, and the postings of the
+    terms in many more documents than pass the filters are read through their skip pointers for
+    those documents only, instead of being decoded in full.
+
+    Returns the scores as DenseScores
+    '''
+    def score_terms(self, terms, normalization_query_vectors, postings=None, filter_mask=None):
+        scores = np.zeros(len(self.doc_id_array), dtype=np.float64)
+        scored = np.zeros(len(self.doc_id_array), dtype=bool)
+        if filter_mask is not None:
+            candidate_indices = np.flatnonzero(filter_mask)
+            candidates = (candidate_indices.tolist(), self.doc_id_array[candidate_indices].tolist())
+            self.filter_stats = {'candidates': len(candidate_indices), 'postings': 0, 'total_postings': 0}
+        for term in terms:
+            if filter_mask is not None and postings is None:
+                indices, weights = self.get_filtered_arrays(term, filter_mask, candidates)
+                scores[indices] += normalization_query_vectors[term] * weights
+                scored[indices] = True
+                continue
+
+            # the Posting of each term is given for champion lists, see score_champions
+            posting = postings[term] if postings is not None else self.get_postings_list(term)
+            indices, weights = posting.get_arrays(self.doc_index)
+            if filter_mask is not None:
+                keep = filter_mask[indices]
+                indices, weights = indices[keep], weights[keep]
+            # docIDs are unique within postings, so the fancy-indexed += adds once per document
+            scores[indices] += normalization_query_vectors[term] * weights
+            scored[indices] = True
+
+        # Normalize score with document vector length
+        scores[scored] /= self.doc_length_array[scored]
+        if filter_mask is not None and postings is None:
+            print("filters: {} candidates, read {} of {} postings".format(
+                self.filter_stats['candidates'], self.filter_stats['postings'], self.filter_stats['total_postings']))
+        return DenseScores(self.doc_id_array, scores, scored)
+
+    '''
+    Returns the postings of the term in the documents that pass the filters as two arrays, the index
+    of every document in doc_index and its wt,d, like Posting.get_arrays. candidates holds the indices
+    and the docIDs of the documents that pass the filters, in ascending docID.
+    '''
+    def get_filtered_arrays(self, term, filter_mask, candidates):
+        cursor = self.get_postings_cursor(term)
+        self.filter_stats['total_postings'] += len(cursor)
+        if not isinstance(cursor, SkipCursor) or len(cursor) <= FILTER_CURSOR_RATIO * len(candidates[0]):
+            self.filter_stats['postings'] += len(cursor)
+            indices, weights = self.get_postings_list(term).get_arrays(self.doc_index)
+            keep = filter_mask[indices]
+            return indices[keep], weights[keep]
+
+        indices = []
+        weights = []
+        for index, doc_id in zip(*candidates):
+            found = cursor.advance(doc_id)
+            if found is None:
+                break
+            if found == doc_id:
+                indices.append(index)
+                weights.append(weighted_tf(cursor.term_freq))
+        self.filter_stats['postings'] += cursor.num_decoded
+        return np.array(indices, dtype=np.int64), np.array(weights, dtype=np.float64)
+
+    '''
+    Scores the documents of the terms document at a time with MaxScore, keeping only the top K.
+    Terms are sorted by the upper bound of their contribution, w_tq * max_score of the term where
+    max_score is the highest wt,d / doc_len of its postings, computed at index time. Once K documents
+    are scored, the terms whose bounds add up to at most the K-th score are non-essential: documents
+    in none of the other terms are never visited, and the other documents are only scored if the
+    bounds of their terms can beat the K-th score. Scores are summed in the same order as
+    process_freetext_query, so the top K (and their scores) are the same as exhaustive scoring.
+
+    Returns { docID : score } of the top K documents, or None if the index has no max_score
+    '''
+    def score_top_K(self, terms, normalization_query_vectors, K):
+        query_count_dict = collections.Counter(terms)
+        postings = {}
+        upper_bounds = {}
+        for term, count in query_count_dict.items():
+            max_score = self.get_max_score(term)
+            if max_score is None:
+                return None
+            postings[term] = self.get_postings_list(term).postings
+            # documents only gain score from terms with a positive weight
+            upper_bounds[term] = max(0.0, count * normalization_query_vectors[term] * max_score) * (1 + MAX_SCORE_TOLERANCE)
+
+        ordered_terms = sorted(query_count_dict, key=lambda term: upper_bounds[term])
+        doc_ids = [self.get_postings_list(term).get_doc_ids() for term in ordered_terms]
+        bounds = [upper_bounds[term] for term in ordered_terms]
+        # cumulative_bounds[i] is the sum of the bounds of the first i terms
+        cumulative_bounds = [0.0]
+        for bound in bounds:
+            cumulative_bounds.append(cumulative_bounds[-1] + bound)
+        # postings and w_tq of every term of the query in order, counting a repeated term once in num_scored
+        scoring_terms = []
+        for i, term in enumerate(terms):
+            scoring_terms.append((postings[term], normalization_query_vectors[term], term not in terms[:i]))
+
+        top_K = [] # min-heap of (score, -docID), ties go to the lower docID like get_top_K_components
+        threshold = -math.inf
+        first_essential = 0
+        num_scored = 0
+        # (docID, i) of the next document of every term i, the candidates come in ascending docID
+        cursors = [0] * len(ordered_terms)
+        next_docs = [(doc_ids[i][0], i) for i in range(len(ordered_terms)) if len(doc_ids[i]) != 0]
+        heapq.heapify(next_docs)
+
+        while next_docs:
+            doc_id, i = next_docs[0]
+            if i < first_essential:
+                # documents of non-essential terms alone cannot make the top K
+                heapq.heappop(next_docs)
+                continue
+
+            upper_bound = cumulative_bounds[first_essential]
+            while next_docs and next_docs[0][0] == doc_id:
+                i = next_docs[0][1]
+                if i >= first_essential:
+                    upper_bound += bounds[i]
+                cursors[i] += 1
+                if i >= first_essential and cursors[i] < len(doc_ids[i]):
+                    heapq.heapreplace(next_docs, (doc_ids[i][cursors[i]], i))
+                else:
+                    heapq.heappop(next_docs)
+            # candidates come in ascending docID, so a document ties with the K-th score and loses
+            if len(top_K) == K and upper_bound <= threshold:
+                continue
+
+            score = 0.0
+            for term_postings, w_tq, is_first in scoring_terms:
+                props = term_postings.get(doc_id)
+                if props is not None:
+                    score += w_tq * props['weight']
+                    num_scored += is_first
+            score /= self.doc_lengths[doc_id]
+
+            if len(top_K) < K:
+                heapq.heappush(top_K, (score, -doc_id))
+            elif score > threshold:
+                heapq.heapreplace(top_K, (score, -doc_id))
+            else:
+                continue
+
+            if len(top_K) == K:
+                threshold = top_K[0][0]
+                while first_essential < len(ordered_terms) and cumulative_bounds[first_essential + 1] <= threshold:
+                    first_essential += 1
+
+        num_postings = sum(len(term_postings) for term_postings in postings.values())
+        self.pruning_stats = {'postings': num_postings, 'scored': num_scored, 'skipped': num_postings - num_scored}
+        print("MaxScore scored {} of {} postings".format(num_scored, num_postings))
+        return {-neg_doc_id: score for score, neg_doc_id in top_K}
+
     # ====================================================================
     # ====================== RANKING PROCESSING ==========================
     # ====================================================================
@@ -257,7 +818,7 @@ class QueryParser:
 
         for term in terms.split(' '):
             # stem and case-folding
-            word_token = self.stemmer.stem(term).lower()
+            word_token = self.tokenizer.normalize(term)
             if len(word_token) == 0:
                 continue
             else: tokenized_terms.append(word_token)
@@ -265,24 +826,43 @@ class QueryParser:
         return tokenized_terms
 
     def tokenize_query(self, query):
-        query = query.strip()
-        terms = []
+        # tokenize, stem and case-fold, skipping empty strings
+        with self.stage('tokenize'):
+            return self.tokenizer.tokenize(query.strip())
+
+    def get_champion_postings(self, term):
+        # champion list of the term as a Posting, None if the index has no champion lists.
+        # Cached with the postings lists, under a key that cannot be a term.
+        key = ('champions', term)
+        posting = self.postings_cache.get(key)
+        if posting is not None:
+            return posting
 
-        for sentence_token in nltk.tokenize.sent_tokenize(query):
-            for word_token in nltk.tokenize.word_tokenize(sentence_token):
-                # stem and case-folding
-                word_token = self.stemmer.stem(word_token).lower()
-                if len(word_token) == 0:
-                    continue
-                else: terms.append(word_token)
-                
-        return terms
+        champions = self.segments.get_champions(term) if self.segments is not None else self.postings_reader.get_champions(term)
+        if champions is None:
+            return None
+        posting = Posting(term, len(champions), {doc_id: {'weight': weighted_tf(term_freq)} for doc_id, term_freq in champions})
+        self.postings_cache.put(key, posting, posting.estimate_size())
+        return posting
+
+    def get_max_score(self, term):
+        # highest wt,d / doc_len of the term, None if the index does not store it
+        if self.segments is not None:
+            return self.segments.get_max_score(term)
+        return self.postings_reader.get_max_score(term)
 
     def calculate_idf(self, term):
-        # print("calculating idf for", term)
         idf = 0
-        posting_obj = self.get_postings_list(term)
-        occurrences = int(posting_obj.occurrences)
+        if self.segments is not None:
+            # idf over the documents of every segment
+            return self.segments.get_idf(term)
+
+        term_stats = self.postings_reader.term_stats
+        if term_stats is not None:
+            term_id = self.postings_reader.get_term_id(term)
+            return term_stats.idfs[term_id] if term_id != -1 else idf
+
+        occurrences = self.postings_reader.get_doc_freq(term)
 
         if occurrences != 0:
             idf = math.log(self.N/occurrences, 10)
@@ -328,6 +908,9 @@ class QueryParser:
         return result
     
     def get_top_K_components(self, scores_dic, K):
+        if isinstance(scores_dic, DenseScores):
+            return scores_dic.top_K(K)
+
         result = []
         score_tuples = [(-score, doc_id) for doc_id, score in scores_dic.items()]
         
@@ -348,7 +931,11 @@ class QueryParser:
     # ===========================================================================
 
     def filter_relevant_words(self, query, terms):
-        stop_words = set(stopwords.words('english'))
+        if self.use_synonym_table:
+            # stop words, punctuation and terms outside the dictionary are already left out of the table
+            return [word for word in self.get_table_synonyms(terms) if word not in query]
+
+        stop_words = load_stop_words()
         relevant_synonyms = self.word_net(query)
         punc = set(punctuation)
         
@@ -358,19 +945,9 @@ class QueryParser:
         
         return relevant_words
 
-    # def word_net(self, query):
-    #     # Find synonyms for each word in the query
-    #     synonyms = set()
-    #     words = []
-    #     for word in query.split(' '):
-    #         for synset in wordnet.synsets(word, pos=['v', 'n']):
-    #             synonyms.update(synset.lemma_names())
-
-    #     print("Synonyms:", synonyms)
-    #     return synonyms
-    
     def word_net(self, query):
         # Find synonyms for each word in the query
+        wordnet = load_wordnet()
         words = []
         for word in query.split(' '):
             for synset in wordnet.synsets(word):
@@ -381,55 +958,77 @@ class QueryParser:
 
         # Keep only the top-ranked words
         relevant_words = set()
-        for word, pos, count in ranked_words[:50]:
+        for word, pos, count in ranked_words[:MAX_EXPANSION_WORDS]:
             if ' ' not in word:
                 relevant_words.add(word.replace('_', ' '))
 
         print("Relevant words:", relevant_words)
         return relevant_words
 
+    def get_table_synonyms(self, terms):
+        # Synonyms of the terms of the query in the synonym table, keeping the top-ranked ones like word_net
+        counts = {}
+        for term in set(terms):
+            for word, count in self.postings_reader.get_synonyms(term):
+                counts[word] = max(counts.get(word, 0), count)
+        ranked_words = sorted(counts.items(), key=lambda x: (-x[1], x[0]))
+        return [word for word, count in ranked_words[:MAX_EXPANSION_WORDS]]
+
     def rocchio(self, normalized_query_vectors, relevant_docs, alpha=1, beta=0.70, gamma=0.05):
-        docs_id_set = set()
-        
         centroid_weights = collections.defaultdict(float)
-        # anti_centroid_weights = collections.defaultdict(float)
         query_centroid = collections.defaultdict(float)
 
         num_relevant_docs = len(relevant_docs)
 
-        # Takes approx. 0.3 seconds for 10000+ dictionary terms
-        if not bool(self.term_weights_dict):
-            st = time.time()
-            self.term_weights_dict = self.get_all_doc_weights()
-            end = time.time()
-            # print("time taken for getting all weights: " + str(end - st))
-
-        st = time.time()
         # Find the weights of the the terms inside the relevant documents
-        for term, posting in self.term_weights_dict.items():
-            if not term[0].isalpha():
-                break
+        if self.has_forward_index():
+            # Only read the term vectors of the relevant documents from the forward index
+            for doc_id in sorted(set(relevant_docs)):
+                if doc_id not in self.forward_ptrs:
+                    continue
 
-            postings_dict = posting.postings
-            term_idf = self.calculate_idf(term)
-            for doc_id, props in postings_dict.items():
-                weight = props['weight']
-                # Add to set of document collection
-                # if doc_id not in docs_id_set:
-                #     docs_id_set.add(doc_id)
+                reader, forward_ptr = self.postings_reader, self.forward_ptrs[doc_id]
+                if self.segments is not None:
+                    # The term vector is in the segment owning the document
+                    reader, forward_ptr = self.segments.get_doc_vector_ref(doc_id)
+
+                for term_id, weight in reader.read_doc_vector(forward_ptr):
+                    term, doc_freq = reader.get_term(term_id)
+                    if not term[0].isalpha():
+                        continue
+
+                    if self.segments is not None:
+                        term_idf = self.segments.get_idf(term)
+                    elif self.postings_reader.term_stats is not None:
+                        term_idf = self.postings_reader.term_stats.idfs[term_id]
+                    else:
+                        term_idf = math.log(self.N/doc_freq, 10)
 
-                if doc_id in relevant_docs:
                     # Add to relevant centroid weights
                     centroid_weights[term] += weight * term_idf
-                # else: 
-                #     # Add to non-relevant centroid weights
-                #     anti_centroid_weights[term] += weight * term_idf
+        else:
+            # Indexes without a forward index have to scan the postings of every term
+            # Takes approx. 0.3 seconds for 10000+ dictionary terms
+            if not bool(self.term_weights_dict):
+                self.term_weights_dict = self.get_all_doc_weights()
+
+            for term, posting in self.term_weights_dict.items():
+                if not term[0].isalpha():
+                    continue
+
+                postings_dict = posting.postings
+                term_idf = self.calculate_idf(term)
+                for doc_id, props in postings_dict.items():
+                    weight = props['weight']
+
+                    if doc_id in relevant_docs:
+                        # Add to relevant centroid weights
+                        centroid_weights[term] += weight * term_idf
 
         # Calculate the average weight of the a term across all relevant documents 
         for term in centroid_weights:
             centroid_weights[term] /= num_relevant_docs
 
-        st = time.time()
         # Calculate the Rocchio algorithm
         for term, weight in normalized_query_vectors.items():
             query_centroid[term] = alpha * weight
@@ -437,68 +1036,34 @@ class QueryParser:
         for term, weight in centroid_weights.items():
             query_centroid[term] += beta * weight
 
-        # for term, weight in anti_centroid_weights.items():
-        #     query_centroid[term] -= gamma * weight
-
-        end = time.time()
-        # print("time taken calculate rocchio: " + str(end - st))
-
         return query_centroid
 
     # ==========================================================================
     # ====================== PHRASAL QUERY PROCESSING ==========================
     # ==========================================================================
     '''
-    Processes the phrasal query and returns a list of documents that are
-    relevant.  
+    Processes the phrasal query and returns the set of documents containing its
+    terms at consecutive positions, see phrase_matcher.match_phrase. candidates
+    restricts the documents checked, e.g. to the documents of a boolean query.
+    The documents of the pairs of adjacent terms in the biword index answer a
+    phrase of two terms, and restrict the documents checked for longer phrases.
     '''
-    def process_phrase(self, phrase):
-        postings_dict = {}
-        postings = []
-
-        # 1. Obtain the postings for each term
-        for term in phrase:
-            posting = self.get_postings_list(term)
-            if len(posting.postings) != 0:
-                postings_map = posting.postings
-                postings_dict[term] = postings_map
-                postings.append(set(postings_map.keys()))
-            else:
-                # postings.append(set())
-                # TODO: Check if returning an empty list since a term is not present in any document
-                return set()
-        
-        # 2. Find the common documents from the set of document IDs
-        common_docs = postings[0]
-        for i in range(1, len(postings)):
-            common_docs = common_docs & postings[i]
-
-        valid_docs = set()
-        # 3. For each common document, check document(s) for the term sequence
-        for doc in common_docs:
-            
-            is_valid = True
-
-            for i in range(0, len(phrase) - 1):
-                positions1 = postings_dict[phrase[i]][doc]['positions']
-                positions2 = postings_dict[phrase[i+1]][doc]['positions']
-                is_consecutive = self.check_consecutive(positions1, positions2)
-                if is_consecutive == False:
-                    is_valid = False
-                    break
-
-            if is_valid == True:
-                valid_docs.add(doc)
-            
-        return valid_docs
-    
-    def check_consecutive(self, arr1, arr2):
-        arr1_set = set(arr1)
-        # O(n) time complexity
-        for num in arr2:
-            if num - 1 in arr1_set:
-                return True
-        return False
+    def process_phrase(self, phrase, candidates=None):
+        for term1, term2 in zip(phrase, phrase[1:]):
+            doc_ids = self.get_biword_doc_ids(term1, term2)
+            if doc_ids is None:
+                continue
+            candidates = doc_ids if candidates is None else intersect([ListCursor(candidates), ListCursor(doc_ids)])
+            if len(phrase) == 2 or len(candidates) == 0:
+                return set(candidates)
+
+        if candidates is not None:
+            # Read the positions of the candidates through the skip pointers, unless a postings list
+            # is already decoded or cannot be read with a cursor
+            cursors = {term: self.get_postings_cursor(term) for term in phrase}
+            if all(isinstance(cursor, SkipCursor) and cursor.has_positions for cursor in cursors.values()):
+                return match_phrase_at(phrase, cursors, self.postings_reader.read_positions, candidates)
+        return match_phrase(phrase, self.get_postings_list, candidates)
 
     def is_phrase(self, string): 
         return string.count(' ') > 0
@@ -509,63 +1074,97 @@ class QueryParser:
 
     def get_all_doc_weights(self):
         doc_weights_dic = collections.defaultdict()
-        with open(self.postings_file, 'r') as f:
-            try:
-                for line in f:
-                    line = line.strip()
-                    context, occurrences, postings = line.split(' ', 2)
-                    posting = Posting(context, occurrences, postings)
-                    doc_weights_dic[context] = posting
-            except:
-                print("An error occurred")
+        try:
+            for context, occurrences, postings in self.postings_reader.iter_postings():
+                posting = Posting(context, occurrences, postings, self.postings_reader.read_positions)
+                doc_weights_dic[context] = posting
+        except:
+            print("An error occurred")
         
         return doc_weights_dic
 
-    # def get_all_doc_weights(self):
-    #     doc_weights_dic = collections.defaultdict()
-    #     output_queue = queue.Queue()
-
-    #     # Start a worker thread for each CPU core
-    #     num_threads = multiprocessing.cpu_count()
-    #     threads = []
-    #     with open(self.postings_file, 'r') as f:
-    #         chunk_size = int(os.path.getsize(self.postings_file) / num_threads) + 1
-    #         for i in range(num_threads):
-    #             thread = FileReaderThread(f, chunk_size, output_queue)
-    #             threads.append(thread)
-    #             thread.start()
-
-    #         # Read results from the output queue
-    #         for i in range(num_threads):
-    #             while True:
-    #                 chunk_result = output_queue.get()
-    #                 if chunk_result is None:
-    #                     break
-    #                 for context, posting in chunk_result.items():
-    #                     doc_weights_dic[context] = posting
-
-    #         # Wait for all threads to finish
-    #         for thread in threads:
-    #             thread.join()
-
-    #     return doc_weights_dic
+    def has_forward_index(self):
+        if self.segments is not None:
+            return all(reader.forward_buffer is not None for reader in self.segments.readers)
+        return self.postings_reader.forward_buffer is not None
+
+    '''
+    Returns a cursor over the docIDs of the term. Postings that are not cached are read through
+    the skip pointers of the binary postings file instead of being decoded in full.
+    '''
+    def get_postings_cursor(self, term):
+        if self.segments is None and self.postings_reader.is_binary and term not in self.postings_cache:
+            with self.stage('dictionary'):
+                postings_ptr = self.postings_reader.get_postings_ptr(term)
+            if postings_ptr == -1:
+                return ListCursor([])
+            cursor = self.postings_reader.get_cursor(postings_ptr)
+            if self.trace is not None:
+                self.trace.cursors.append(cursor)
+            return cursor
+        return ListCursor(self.get_postings_list(term).get_doc_ids())
+
+    '''
+    Returns the docIDs of the documents where term2 follows term1 from the biword index, or None if
+    the pair is not in the biword index or the index has delta segments
+    '''
+    def get_biword_doc_ids(self, term1, term2):
+        if self.segments is not None:
+            return None
+        # Cached with the postings lists, under a key that cannot be a term
+        key = ('biword', term1, term2)
+        doc_ids = self.postings_cache.get(key)
+        if doc_ids is None:
+            doc_ids = self.postings_reader.get_biword_doc_ids(term1, term2)
+            if doc_ids is None:
+                return None
+            self.postings_cache.put(key, doc_ids, estimate_doc_ids_size(doc_ids))
+        return doc_ids
+
+    '''
+    Returns the DocBitmap of the documents of the term, or None if the term is not dense, the index
+    has no bitmaps or has delta segments
+    '''
+    def get_postings_bitmap(self, term):
+        if self.segments is not None or self.postings_reader.bitmap_num_docs != len(self.doc_id_array):
+            return None
+        containers = self.postings_reader.get_bitmap_containers(term)
+        return DocBitmap(containers, self.doc_id_array) if containers is not None else None
 
     def get_postings_list(self, term):
-        postings_list_ptr = self.postings_reader.get_postings_ptr(term)
-        with open(self.postings_file, 'r') as f:
-            if postings_list_ptr == -1:
-                # print('[DEBUG] Cannot find term', term)
-                posting = Posting(term)
-            else:
-                # print('[DEBUG] Found term', term)
-                line = f.seek(postings_list_ptr, 0)
-                line = f.readline().strip()
-                context, occurrences, postings = line.split(' ', 2)
-
-                # Create a new Posting instance
-                posting = Posting(context, occurrences, postings)
-                # Postings.postings variable example: [{'doc_id': 246391, 'weight': 1.0, 'positions': [6]}, {'doc_id': 9, 'weight': 1.0, 'positions': [0]}]
+        posting = self.postings_cache.get(term)
+        if posting is not None:
+            return posting
+
+        with self.stage('postings', term=term):
+            return self.read_postings_list(term)
+
+    '''
+    Returns the Posting of a term that is not in the postings cache, read from the postings file
+    or merged from the segments, and caches it
+    '''
+    def read_postings_list(self, term):
+        if self.segments is not None:
+            # Merge the postings of the main index and of the delta segments
+            postings = self.segments.get_postings(term)
+            posting = Posting(term, len(postings), postings, self.postings_reader.read_positions)
+            self.postings_cache.put(term, posting, posting.estimate_size())
             return posting
+
+        with self.stage('dictionary'):
+            postings_list_ptr = self.postings_reader.get_postings_ptr(term)
+        if postings_list_ptr == -1:
+            posting = Posting(term)
+        else:
+            context, occurrences, postings = self.postings_reader.read_postings(postings_list_ptr)
+
+            # Create a new Posting instance
+            posting = Posting(context, occurrences, postings, self.postings_reader.read_positions)
+            # Postings.postings variable example: {246391: {'weight': 1.0, 'positions': [6]}, 9: {'weight': 1.0, 'positions': [0]}}
+            # or, for the binary format, {246391: {'weight': 1.0, 'tf': 1, 'positions_ptr': 1024}, ...}
+
+        self.postings_cache.put(term, posting, posting.estimate_size())
+        return posting
     
     def get_document(self, file_name):
         doc_length = dict()
@@ -579,6 +1178,43 @@ class QueryParser:
                 document_id = int(docid_length[0])
                 document_length = float(docid_length[1])
                 doc_length[document_id] = document_length
+                # Pointer to the term vector of the document in forward_index.txt
+                if len(docid_length) > 2:
+                    self.forward_ptrs[document_id] = int(docid_length[2])
+
+        if self.segments is not None:
+            # Documents of the delta segments are added to, or override, the ones of the main index
+            self.N = self.segments.get_total_num_docs()
+            for document_id in self.segments.owners:
+                doc_length[document_id] = self.segments.get_doc_length(document_id)
+                self.forward_ptrs[document_id] = self.segments.get_doc_vector_ref(document_id)[1]
             
         return doc_length
 
+def usage():
+    print("usage: " + sys.argv[0] + " [-b budget-in-ms] [-n number-of-runs]")
+    print("  checks that importing query_parser takes less than the budget (default {} ms) and does".format(IMPORT_TIME_BUDGET_MS))
+    print("  not load WordNet or the indexer, and exits with status 1 otherwise")
+
+if __name__ == '__main__':
+    budget = IMPORT_TIME_BUDGET_MS
+    num_runs = 5
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'b:n:')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-b':  # budget in milliseconds
+            budget = float(a)
+        elif o == '-n':  # number of runs
+            num_runs = int(a)
+        else:
+            assert False, "unhandled option"
+
+    import_time, loaded_wordnet, loaded_indexer = measure_import_time(num_runs)
+    print("import query_parser: {:.0f} ms (budget {:.0f} ms), WordNet loaded: {}, indexer loaded: {}".format(import_time, budget, loaded_wordnet, loaded_indexer))
+    if import_time > budget or loaded_wordnet or loaded_indexer:
+        sys.exit(1)
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+
+class QueryTrace:
+    '''
+    Trace of the stages of a query, e.g. the WordNet expansion, tokenization, dictionary lookups,
+    postings decoding, scoring, Rocchio and the top K selection, recorded by QueryParser when it
+    traces its queries. Every stage records its wall time and the change of the counters returned
+    by get_counters (postings bytes read, postings decoded, cache hits...) while it ran. Stages nest,
+    and the self time and self counters of a stage leave out the stages run inside it, so that the
+    self values of all the stages add up to the whole query.
+    '''
+
+    def __init__(self, get_counters):
+        self.get_counters = get_counters # function returning a dictionary { counter : cumulative value }
+        self.events = [] # finished stages, in the order they finished
+        self.stack = [] # stages running, outermost first
+        self.cursors = [] # cursors opened by the query, whose decoded postings are counted by get_counters
+
+    '''
+    Returns a context manager recording a stage named name, with args, e.g. the terms of the stage,
+    kept in its event
+    '''
+    def stage(self, name, **args):
+        return TraceStage(self, name, args)
+
+    '''
+    Starts a stage inside the stages running, see TraceStage
+    '''
+    def begin(self, name, args):
+        self.stack.append({'name': name, 'args': args, 'start': time.perf_counter(), 'counters': self.get_counters(),
+                           'child_time': 0.0, 'child_counters': {}})
+
+    '''
+    Ends the innermost stage running and records its event
+    '''
+    def end(self):
+        end = time.perf_counter()
+        counters = self.get_counters()
+        frame = self.stack.pop()
+        wall_time = end - frame['start']
+        deltas = {name: value - frame['counters'].get(name, 0) for name, value in counters.items()}
+        # a stage nested in a stage of the same name, whose wall time is already in the outer one
+        nested = any(outer['name'] == frame['name'] for outer in self.stack)
+        self.events.append({'name': frame['name'], 'depth': len(self.stack), 'nested': nested, 'start': frame['start'], 'wall_ms': wall_time * 1000,
+                            'self_ms': (wall_time - frame['child_time']) * 1000, 'args': frame['args'], 'counters': deltas,
+                            'self_counters': {name: value - frame['child_counters'].get(name, 0) for name, value in deltas.items()}})
+        if len(self.stack) != 0:
+            parent = self.stack[-1]
+            parent['child_time'] += wall_time
+            for name, value in deltas.items():
+                parent['child_counters'][name] = parent['child_counters'].get(name, 0) + value
+
+    '''
+    Returns the stages of the trace aggregated by name: the number of times every stage ran, its
+    wall time, self time and self counters
+    '''
+    def summarize(self):
+        stages = {}
+        for event in self.events:
+            stage = stages.setdefault(event['name'], {'calls': 0, 'wall_ms': 0.0, 'self_ms': 0.0})
+            stage['calls'] += 1
+            if not event['nested']:
+                stage['wall_ms'] += event['wall_ms']
+            stage['self_ms'] += event['self_ms']
+            for name, value in event['self_counters'].items():
+                stage[name] = stage.get(name, 0) + value
+        return stages
+
+    '''
+    Returns the trace as a dictionary that can be written as JSON: the outermost stage (the query),
+    the stages aggregated by name, see summarize, and every stage in the order they started, with
+    their start in milliseconds from the start of the query
+    '''
+    def to_dict(self):
+        events = sorted(self.events, key=lambda event: (event['start'], event['depth']))
+        origin = events[0]['start'] if len(events) != 0 else 0
+        root = events[0] if len(events) != 0 else {'args': {}, 'wall_ms': 0.0, 'counters': {}}
+        return {'query': root['args'], 'total_ms': root['wall_ms'], 'counters': root['counters'], 'stages': self.summarize(),
+                'events': [{'name': event['name'], 'depth': event['depth'], 'start_ms': (event['start'] - origin) * 1000,
+                            'wall_ms': event['wall_ms'], 'self_ms': event['self_ms'], 'args': event['args'],
+                            'counters': event['counters']} for event in events]}
+
+    '''
+    Returns the stages as complete events ('ph': 'X') of the Chrome trace event format, with their
+    args and the counters that changed, for chrome://tracing or Perfetto
+    '''
+    def to_chrome_events(self):
+        return [{'name': event['name'], 'cat': 'query', 'ph': 'X', 'ts': event['start'] * 1e6, 'dur': event['wall_ms'] * 1000,
+                 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': dict(event['args'], **{name: value for name, value in event['counters'].items() if value != 0})}
+                for event in self.events]
+
+class TraceStage:
+    '''
+    Context manager of a stage of a QueryTrace
+    '''
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.trace.begin(self.name, self.args)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.trace.end()
+        return False
+
+def write_traces(traces, trace_file, chrome=False):
+    """
+    Method to write the traces of queries into a JSON file
+
+        Parameters:
+            traces: a list of QueryTrace
+            chrome: True to write them in the Chrome trace event format, for chrome://tracing or Perfetto,
+                    instead of a list of QueryTrace.to_dict
+    """
+    with open(trace_file, 'w') as f:
+        if chrome:
+            json.dump({'traceEvents': [event for trace in traces for event in trace.to_chrome_events()], 'displayTimeUnit': 'ms'}, f)
+        else:
+            json.dump([trace.to_dict() for trace in traces], f, indent=2)
@@ -7,68 +7,134 @@ os.environ['OPENBLAS_NUM_THREADS'] = '1'
 
 import sys
 import getopt
+import time
 from query_parser import QueryParser
+from query_cache import QueryCache
+from query_trace import write_traces
+from doc_fields import parse_filter_date
 
 # python3 search.py -d dictionary.txt -p postings.txt -q queries.txt -o results.txt
 
 
 def usage():
     print("usage: " +
-          sys.argv[0] + " -d dictionary-file -p postings-file -q file-of-queries -o output-file-of-results")
+          sys.argv[0] + " -d dictionary-file -p postings-file -q file-of-queries -o output-file-of-results [-f] [-s] [-m] [-c] [-r cache-file] [-F field=value] [-t trace-file] [-T chrome-trace-file]")
+    print("  -q  a query file, or a directory of query files; repeat -q to run several query files")
+    print("      every query is written as one line of output-file-of-results, in order")
+    print("  -f  tokenize queries with the fast regex tokenizer, for indexes built with index.py -f")
+    print("  -s  fetch the postings of the terms shared by several queries once, before running the queries")
+    print("  -m  score the top 10 documents used for relevance feedback with MaxScore instead of every document")
+    print("  -c  only rank the documents of the champion lists, for indexes built with index.py -c (approximate)")
+    print("  -r  load the results of previous runs from cache-file, and save the results of this run into it")
+    print("  -F  only return the documents matching a filter, one of court=name, from=date, to=date (e.g. 2000-01-31)")
+    print("      or title=words; repeat -F to combine filters, or to allow several courts")
+    print("  -t  trace the stages of every query, and write the traces into trace-file as JSON")
+    print("  -T  trace the stages of every query, and write the traces into chrome-trace-file in the Chrome trace")
+    print("      event format, for chrome://tracing or Perfetto")
+
+
+def get_query_files(queries_paths):
+    """
+    returns the query files of the given query files and directories of query files,
+    where the files of a directory are sorted by name
+    """
+    query_files = []
+    for queries_path in queries_paths:
+        if os.path.isdir(queries_path):
+            for file_name in sorted(os.listdir(queries_path)):
+                file_path = os.path.join(queries_path, file_name)
+                if os.path.isfile(file_path):
+                    query_files.append(file_path)
+        else:
+            query_files.append(queries_path)
+    return query_files
+
+
+def parse_filter(option, filters):
+    """
+    adds the filter of a -F option, e.g. court=SG High Court, to the filters of QueryParser.process_query
+    """
+    name, _, value = option.partition('=')
+    names = {'court': 'court', 'from': 'date_from', 'to': 'date_to', 'title': 'title'}
+    if name not in names or value == '':
+        raise ValueError("unknown filter " + option)
+    if name in ('from', 'to'):
+        parse_filter_date(value)
+    if name == 'court' and 'court' in filters:
+        filters['court'] = [filters['court']] if isinstance(filters['court'], str) else filters['court']
+        filters['court'].append(value)
+    else:
+        filters[names[name]] = value
 
 
-def run_search(dict_file, postings_file, queries_path, results_file):
+def run_search(dict_file, postings_file, queries_paths, results_file, tokenizer_mode='nltk', prefetch=False, pruning=False, tiered=False, cache_file=None, filters=None, trace_file=None, chrome_trace_file=None):
     """
     using the given dictionary file and postings file,
-    perform searching on the given queries file and output the results to a file
+    perform searching on the given queries files and output the results to a file,
+    the dictionary, document table and postings cache are loaded once and reused by every query,
+    and the query cache is kept in cache_file between runs if given,
+    with filters, only the documents matching the filters are scored and returned,
+    and the stages of every query are traced into trace_file and chrome_trace_file if given
     """
     print('running search on the queries...')
-    # This is an empty method
-    # Pls implement your code in below
     
-    parser = QueryParser(dict_file, postings_file)
-    # inFiles = os.listdir(queries_path)
-    # sorted_files = sorted(inFiles)
-    # is_first_line = True
-
-    # # Iterate through all the files in the queries folder
-    # for file_name in sorted_files:
-    #     # if count == 0: break
-    #     file_path = os.path.join(queries_path, file_name)
-    #     if os.path.isfile(file_path):
-    #         with open(file_path, 'r') as file:
-    #             # Get the contents of the text file and split it by the break line
-    #             contents = file.read().split('\n')
-    #             result = parser.process_query(contents, 10, 2)
-    #             print('result for', file_name, result)
-
-    #             if is_first_line:
-    #                 with open(results_file, "w") as f:
-    #                     f.write(' '.join(map(str,result)))
-    #                     f.close()
-    #                     is_first_line = False
-                
-    #             else: 
-    #                 with open(results_file, "a") as f:
-    #                     f.write("\n" + ' '.join(map(str,result)))
-    #                     f.close()
-
-    with open(queries_path, 'r') as file:
-        # Get the contents of the text file and split it by the break line
-            contents = file.read().split('\n')
-            result = parser.process_query(contents, 10, 2)
-            print('result for', queries_path, result)
-
-            with open(results_file, "w") as f:
-                f.write(' '.join(map(str,result)))
-                f.close()
+    parser = QueryParser(dict_file, postings_file, tokenizer_mode=tokenizer_mode, query_cache=QueryCache(cache_file=cache_file),
+                         tracing=trace_file is not None or chrome_trace_file is not None)
+
+    queries = []
+    for file_path in get_query_files(queries_paths):
+        with open(file_path, 'r') as file:
+            # Get the contents of the text file and split it by the break line
+            queries.append((file_path, file.read().split('\n')))
+
+    if prefetch:
+        shared_terms = parser.prefetch_postings([contents[0] for _, contents in queries])
+        print('prefetched postings of', len(shared_terms), 'shared terms')
+
+    st = time.time()
+    num_skipped = num_postings = 0
+    traces = []
+    with open(results_file, "w") as f:
+        for i, (file_path, contents) in enumerate(queries):
+            result = parser.process_query(contents, 10, 2, pruning, tiered, filters)
+            print('result for', file_path, result)
+            if parser.tracing:
+                traces.append(parser.last_trace)
+            if pruning:
+                num_skipped += parser.pruning_stats['skipped']
+                num_postings += parser.pruning_stats['postings']
+
+            if i != 0:
+                f.write("\n")
+            f.write(' '.join(map(str,result)))
+    end = time.time()
+
+    if len(queries) != 0:
+        print('ran {} queries in {:.3f} seconds, {:.2f} queries/sec'.format(len(queries), end - st, len(queries) / max(end - st, 1e-9)))
+    if pruning:
+        print('MaxScore skipped {} of {} postings'.format(num_skipped, num_postings))
+    print('postings cache statistics:', parser.postings_cache.stats())
+    print('query cache statistics:', parser.query_cache.stats())
+    parser.query_cache.save()
+    if trace_file is not None:
+        write_traces(traces, trace_file)
+    if chrome_trace_file is not None:
+        write_traces(traces, chrome_trace_file, chrome=True)
 
                 
 
-dictionary_file = postings_file = file_of_queries = output_file_of_results = None
+dictionary_file = postings_file = file_of_output = None
+files_of_queries = []
+tokenizer_mode = 'nltk'
+prefetch = False
+pruning = False
+tiered = False
+cache_file = None
+filters = {}
+trace_file = chrome_trace_file = None
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], 'd:p:q:o:')
+    opts, args = getopt.getopt(sys.argv[1:], 'd:p:q:o:fsmcr:F:t:T:')
 except getopt.GetoptError:
     usage()
     sys.exit(2)
@@ -79,14 +145,35 @@ for o, a in opts:
     elif o == '-p':
         postings_file = a
     elif o == '-q':
-        file_of_queries = a
+        files_of_queries.append(a)
     elif o == '-o':
         file_of_output = a
+    elif o == '-f':
+        tokenizer_mode = 'fast'
+    elif o == '-s':
+        prefetch = True
+    elif o == '-m':
+        pruning = True
+    elif o == '-c':
+        tiered = True
+    elif o == '-r':
+        cache_file = a
+    elif o == '-F':
+        try:
+            parse_filter(a, filters)
+        except ValueError as e:
+            print(e)
+            usage()
+            sys.exit(2)
+    elif o == '-t':
+        trace_file = a
+    elif o == '-T':
+        chrome_trace_file = a
     else:
         assert False, "unhandled option"
 
-if dictionary_file == None or postings_file == None or file_of_queries == None or file_of_output == None:
+if dictionary_file == None or postings_file == None or len(files_of_queries) == 0 or file_of_output == None:
     usage()
     sys.exit(2)
 
-run_search(dictionary_file, postings_file, file_of_queries, file_of_output)
+run_search(dictionary_file, postings_file, files_of_queries, file_of_output, tokenizer_mode, prefetch, pruning, tiered, cache_file, filters, trace_file, chrome_trace_file)
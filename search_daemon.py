@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+import os
+os.environ['MKL_NUM_THREADS'] = '1'
+os.environ['NUMEXPR_NUM_THREADS'] = '1'
+os.environ['OMP_NUM_THREADS'] = '1'
+os.environ['OPENBLAS_NUM_THREADS'] = '1'
+
+import sys
+import json
+import time
+import getopt
+import signal
+import asyncio
+import concurrent.futures
+from doc_fields import check_filters
+
+# python3 search_daemon.py -d dictionary.txt -p postings.txt -s search.sock -w 4
+#
+# Protocol: every request and every response is a JSON object on a single line.
+#   request:  {"query": "quiet phone call", "relevant_docs": [6807771], "K": 10, "approach": 1, "pruning": false, "tiered": false,
+#              "filters": {"court": "SG High Court", "date_from": "2000-01-01"}, "trace": false}
+#   response: {"results": [246776, ...], "time_ms": 4.2}, or {"error": "..."}
+# With "trace": true, the response also holds the trace of the stages of the query, see QueryTrace.to_dict.
+# relevant_docs, K, approach, pruning, tiered and filters are optional, and mean the same as the lines of a
+# query file after the query and the K, approach, pruning, tiered and filters parameters of
+# QueryParser.process_query.
+# Requests on the same connection are answered in order.
+
+DEFAULT_SOCKET = "search.sock"
+
+# QueryParser of the worker process, loaded once by init_worker
+worker_parser = None
+
+def init_worker(dict_file, postings_file, tokenizer_mode):
+    """
+    Method to load the QueryParser of a worker process, silencing the progress printed by process_query
+    """
+    global worker_parser
+    # the daemon handles Ctrl-C and shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sys.stdout = open(os.devnull, 'w')
+    from query_parser import QueryParser
+    worker_parser = QueryParser(dict_file, postings_file, tokenizer_mode=tokenizer_mode)
+
+def run_query(query, relevant_docs, K, approach, pruning, tiered, filters=None, trace=False):
+    """
+    Method to run a query on the QueryParser of the worker process
+
+        Returns:
+            the list of docIDs returned by QueryParser.process_query, and the trace of the query as a
+            dictionary if trace, or else None
+    """
+    contents = [query] + [str(doc_id) for doc_id in relevant_docs]
+    worker_parser.tracing = trace
+    results = [int(doc_id) for doc_id in worker_parser.process_query(contents, K, approach, pruning, tiered, filters)]
+    return results, worker_parser.last_trace.to_dict() if trace else None
+
+class SearchDaemon:
+    """
+    Class that serves queries over a Unix socket or a localhost TCP port. The index is loaded once by
+    every one of num_workers worker processes, and concurrent requests are spread over the workers.
+    """
+
+    def __init__(self, dict_file, postings_file, num_workers=1, tokenizer_mode='nltk'):
+        self.executor = concurrent.futures.ProcessPoolExecutor(num_workers, initializer=init_worker,
+                                                               initargs=(dict_file, postings_file, tokenizer_mode))
+        self.num_workers = num_workers
+        self.num_queries = 0
+
+    def warm_up(self):
+        """
+        Method to start every worker process, so that the index is loaded before the first request
+        """
+        futures = [self.executor.submit(time.sleep, 0.1) for _ in range(self.num_workers)]
+        concurrent.futures.wait(futures)
+
+    async def handle_request(self, request):
+        """
+        Method to run a single request
+
+            Returns:
+                the response as a dictionary
+        """
+        try:
+            request = json.loads(request)
+            query = request['query']
+            relevant_docs = [int(doc_id) for doc_id in request.get('relevant_docs', [])]
+            K = int(request.get('K', 10))
+            approach = int(request.get('approach', 1))
+            pruning = bool(request.get('pruning', False))
+            tiered = bool(request.get('tiered', False))
+            filters = request.get('filters')
+            if filters is not None and not isinstance(filters, dict):
+                raise TypeError("filters must be an object")
+            if filters is not None:
+                check_filters(filters)
+            trace = bool(request.get('trace', False))
+        except (ValueError, KeyError, TypeError) as e:
+            return {'error': 'invalid request: {}'.format(e)}
+
+        st = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            results, query_trace = await loop.run_in_executor(self.executor, run_query, query, relevant_docs, K, approach, pruning, tiered,
+                                                              filters, trace)
+        except Exception as e:
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+        self.num_queries += 1
+        response = {'results': results, 'time_ms': (time.time() - st) * 1000}
+        if query_trace is not None:
+            response['trace'] = query_trace
+        return response
+
+    async def handle_connection(self, reader, writer):
+        """
+        Method to answer the requests of a connection, one line at a time
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if len(line.strip()) == 0:
+                    continue
+                response = await self.handle_request(line)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, port=None):
+        """
+        Method to serve requests on socket_path, or on localhost:port if port is given, until SIGINT or SIGTERM
+        """
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, lambda: stopped.done() or stopped.set_result(None))
+
+        if port is not None:
+            server = await asyncio.start_server(self.handle_connection, '127.0.0.1', port)
+            print('serving on 127.0.0.1:{}'.format(port))
+        else:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+            print('serving on {}'.format(socket_path))
+
+        try:
+            async with server:
+                await stopped
+        finally:
+            if port is None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    def close(self):
+        self.executor.shutdown()
+
+class SearchClient:
+    """
+    asyncio client of SearchDaemon. A client holds one connection, and its requests are sent one at a
+    time; open several clients to run queries concurrently.
+
+        client = await SearchClient.connect(socket_path='search.sock')
+        results = await client.search('quiet phone call', K=10, approach=1)
+        results, trace = await client.search('quiet phone call', trace=True)
+        await client.close()
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, socket_path=DEFAULT_SOCKET, port=None):
+        if port is not None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        else:
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+        return cls(reader, writer)
+
+    async def request(self, request):
+        """
+        Method to send a request and wait for its response, both as dictionaries
+        """
+        async with self.lock:
+            self.writer.write(json.dumps(request).encode('utf-8') + b'\n')
+            await self.writer.drain()
+            line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("search daemon closed the connection")
+        return json.loads(line)
+
+    async def search(self, query, relevant_docs=(), K=10, approach=1, pruning=False, tiered=False, filters=None, trace=False):
+        """
+        Method to run a query on the daemon
+
+            Returns:
+                the list of docIDs returned by QueryParser.process_query, or with trace, a tuple of the list
+                of docIDs and the trace of the query, see QueryTrace.to_dict
+        """
+        response = await self.request({'query': query, 'relevant_docs': list(relevant_docs), 'K': K, 'approach': approach,
+                                       'pruning': pruning, 'tiered': tiered, 'filters': filters, 'trace': trace})
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        if trace:
+            return response['results'], response.get('trace')
+        return response['results']
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def usage():
+    print("usage: " + sys.argv[0] + " -d dictionary-file -p postings-file [-s socket-file | -P port] [-w num-workers] [-f]")
+    print("  -s  serve on this Unix socket (default {})".format(DEFAULT_SOCKET))
+    print("  -P  serve on this localhost TCP port instead of a Unix socket")
+    print("  -w  number of worker processes, each holding a loaded index (default 1)")
+    print("  -f  tokenize queries with the fast regex tokenizer, for indexes built with index.py -f")
+
+if __name__ == '__main__':
+    dictionary_file = postings_file = None
+    socket_path = DEFAULT_SOCKET
+    port = None
+    num_workers = 1
+    tokenizer_mode = 'nltk'
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:p:s:P:w:f')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-s':
+            socket_path = a
+        elif o == '-P':
+            port = int(a)
+        elif o == '-w':
+            num_workers = int(a)
+        elif o == '-f':
+            tokenizer_mode = 'fast'
+        else:
+            assert False, "unhandled option"
+
+    if dictionary_file == None or postings_file == None:
+        usage()
+        sys.exit(2)
+
+    print('loading index into {} workers...'.format(num_workers))
+    daemon = SearchDaemon(dictionary_file, postings_file, num_workers, tokenizer_mode)
+    daemon.warm_up()
+    try:
+        asyncio.run(daemon.serve(socket_path, port))
+    finally:
+        daemon.close()
+        print('served {} queries'.format(daemon.num_queries))
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+import os
+import sys
+import time
+import getopt
+from string import punctuation
+from query_parser import MAX_EXPANSION_WORDS, QueryParser, load_stop_words, load_wordnet
+from postings_codec import encode_synonyms
+
+# python3 synonym_table.py -d dictionary.txt -p postings.txt
+#
+# Builds synonyms.txt, the synonym table of the query expansion (approach 2 of QueryParser.process_query),
+# in the index directory. For every WordNet word whose term is in the dictionary, the table keeps the
+# synonyms whose terms are all in the dictionary, in min-df to max-df-ratio * N documents, ranked by their
+# WordNet count, so that expanding a query is a lookup of the table instead of WordNet, and never adds
+# a term without postings. Run it again after the index is rebuilt or merged: a table built for another
+# index_version is ignored.
+
+def usage():
+    print("usage: " + sys.argv[0] + " -d dictionary-file -p postings-file [-m min-df] [-x max-df-ratio] [-n max-synonyms]")
+    print("  -m  smallest number of documents of a term of a synonym (default 2)")
+    print("  -x  largest share of the documents of a term of a synonym (default 0.5)")
+    print("  -n  number of synonyms kept for every term, by decreasing WordNet count (default {})".format(MAX_EXPANSION_WORDS))
+
+def build_synonyms(parser, min_doc_freq, max_doc_freq, max_synonyms):
+    """
+    Method to find the synonyms of the terms of the dictionary in WordNet
+
+        Parameters:
+            parser: the QueryParser of the index
+            min_doc_freq, max_doc_freq: the range of document frequency of every term of a synonym
+            max_synonyms: the number of synonyms kept for every term
+
+        Returns:
+            a dictionary { term : [(synonym, count)...] } by decreasing count, without the terms that
+            have no synonym left
+    """
+    wordnet = load_wordnet()
+    stop_words = load_stop_words()
+    punc = set(punctuation)
+    doc_freqs = {}
+
+    def get_doc_freq(term):
+        if term not in doc_freqs:
+            doc_freqs[term] = parser.postings_reader.get_doc_freq(term)
+        return doc_freqs[term]
+
+    synonyms = {}
+    for name in wordnet.all_lemma_names():
+        if '_' in name:
+            continue
+        terms = parser.tokenizer.tokenize(name)
+        if len(terms) != 1 or get_doc_freq(terms[0]) == 0:
+            continue
+        counts = synonyms.setdefault(terms[0], {})
+        for synset in wordnet.synsets(name):
+            for lemma in synset.lemmas():
+                word = lemma.name().replace('_', ' ')
+                if word in stop_words or word in punc:
+                    continue
+                word_terms = parser.tokenizer.tokenize(word)
+                # a synonym made of the term itself adds nothing to the query
+                if len(word_terms) == 0 or set(word_terms) == {terms[0]}:
+                    continue
+                if any(not min_doc_freq <= get_doc_freq(term) <= max_doc_freq for term in word_terms):
+                    continue
+                counts[word] = max(counts.get(word, 0), lemma.count())
+
+    return {term: sorted(counts.items(), key=lambda word_count: (-word_count[1], word_count[0]))[:max_synonyms]
+            for term, counts in synonyms.items() if len(counts) != 0}
+
+def write_synonyms(parser, synonyms, min_doc_freq, max_doc_freq, synonyms_file="synonyms.txt"):
+    """
+    Method to write the synonyms of build_synonyms into the synonym table of the index, see
+    postings_codec.encode_synonyms
+    """
+    words = sorted(set(word for word_counts in synonyms.values() for word, _ in word_counts))
+    word_indices = {word: index for index, word in enumerate(words)}
+    entries = sorted((parser.postings_reader.get_term_id(term), [(word_indices[word], count) for word, count in word_counts])
+                     for term, word_counts in synonyms.items())
+    encoded = encode_synonyms(parser.index_version, min_doc_freq, max_doc_freq, words, entries)
+    with open(synonyms_file, "wb") as f:
+        f.write(encoded)
+    return len(words), len(encoded)
+
+if __name__ == '__main__':
+    dictionary_file = postings_file = None
+    min_doc_freq = 2
+    max_doc_freq_ratio = 0.5
+    max_synonyms = MAX_EXPANSION_WORDS
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:p:m:x:n:')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-d':
+            dictionary_file = a
+        elif o == '-p':
+            postings_file = a
+        elif o == '-m':
+            min_doc_freq = int(a)
+        elif o == '-x':
+            max_doc_freq_ratio = float(a)
+        elif o == '-n':
+            max_synonyms = int(a)
+        else:
+            assert False, "unhandled option"
+
+    if dictionary_file == None or postings_file == None:
+        usage()
+        sys.exit(2)
+
+    parser = QueryParser(dictionary_file, postings_file)
+    if parser.segments is not None:
+        print("the index has delta segments, merge them with index.py -M before building the synonym table")
+        sys.exit(1)
+    if parser.index_version is None:
+        print("the index has no index_version.txt, rebuild it with index.py before building the synonym table")
+        sys.exit(1)
+
+    st = time.time()
+    max_doc_freq = int(max_doc_freq_ratio * parser.N)
+    synonyms = build_synonyms(parser, min_doc_freq, max_doc_freq, max_synonyms)
+    # next to the files of the main index, which a merge of delta segments moves into its own directory
+    num_words, num_bytes = write_synonyms(parser, synonyms, min_doc_freq, max_doc_freq, os.path.join(parser.main_dir, "synonyms.txt"))
+    print("{} terms with {} synonyms ({} distinct), df {} to {}, {} bytes in {:.1f} s".format(
+        len(synonyms), sum(len(word_counts) for word_counts in synonyms.values()), num_words,
+        min_doc_freq, max_doc_freq, num_bytes, time.time() - st))
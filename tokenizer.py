@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+import re
+import sys
+import csv
+import time
+import getopt
+import difflib
+import functools
+from nltk.tokenize import word_tokenize
+from nltk.tokenize import sent_tokenize
+from nltk.tokenize import NLTKWordTokenizer
+from nltk.stem.porter import PorterStemmer
+
+# Maximum number of distinct tokens whose stem is memoized by a Tokenizer
+STEM_CACHE_SIZE = 1 << 18
+
+# Tokenizer modes
+NLTK_MODE = 'nltk' # sent_tokenize and word_tokenize, i.e. Punkt and the NLTK word tokenizer
+FAST_MODE = 'fast' # regex sentence splitting in place of Punkt, then the NLTK word tokenizer
+
+# A candidate end of sentence: a word ending with '.', '?' or '!', optionally followed by closing
+# brackets and quotes, and then whitespace
+SENTENCE_END = re.compile(r'(\S*?)([.?!])[\]\)}>"\'»”’]*\s+')
+# Words whose period does not end a sentence, following the rules of Punkt: known abbreviations 
+# (e.g. "v." or "s."), and initials and numbers that are not followed by a capitalised word
+ABBREVIATION = re.compile(r'^(?:[^\W\d]|-?[.,]?\d[\d,.-]*|(?:[a-z]\.)+[a-z]|' \
+                          r'(?i:art|arts|cap|cf|ch|cl|co|corp|dr|etc|inc|ltd|mdm|mr|mrs|ms|no|nos|' \
+                          r'para|paras|pp|pte|reg|regs|s|sch|sec|ss|v|vol|vs))$')
+
+class Tokenizer:
+    """
+    Class that turns text into terms, i.e. tokenizes it into words and stems and case-folds every word,
+    shared by the indexer and the query parser so that both produce the same terms. Most words of a
+    judgment are repeats, so the stem of every distinct word is memoized in a bounded LRU cache.
+
+    mode: 'nltk' to split sentences with Punkt (sent_tokenize) and words with word_tokenize, or 'fast'
+          to split sentences with a regex and words with the NLTK word tokenizer (the one used by 
+          word_tokenize), which skips Punkt. Check that the fast mode matches on a sample of the dataset before using it,
+          see verify and the __main__ of this module.
+    cache_size: maximum number of memoized stems, 0 to stem every word again
+    """
+
+    def __init__(self, mode=NLTK_MODE, cache_size=STEM_CACHE_SIZE):
+        if mode not in (NLTK_MODE, FAST_MODE):
+            raise ValueError("unknown tokenizer mode: {}".format(mode))
+        self.mode = mode
+        self.stemmer = PorterStemmer()
+        self.word_tokenizer = NLTKWordTokenizer()
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self.stem)
+
+    def stem(self, word):
+        """
+        Method to stem and case-fold a word, normalize is the memoized version of this method
+        """
+        return self.stemmer.stem(word).lower()
+
+    def split_words(self, text):
+        """
+        Method to split text into words, line by line and sentence by sentence
+
+            Returns:
+                a list of string
+        """
+        words = []
+        for line in text.split("\n"):
+            if self.mode == NLTK_MODE:
+                for sentence_token in sent_tokenize(line):
+                    words += word_tokenize(sentence_token)
+            else:
+                for sentence_token in self.split_sentences(line):
+                    words += self.word_tokenizer.tokenize(sentence_token)
+        return words
+
+    def split_sentences(self, line):
+        """
+        Method to split a line into sentences with SENTENCE_END, the fast counterpart of sent_tokenize
+
+            Returns:
+                a list of string
+        """
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(line):
+            word, punctuation = match.group(1), match.group(2)
+            if punctuation == '.' and (word.endswith('.') or (ABBREVIATION.match(word) and not self.is_capitalised(line, match.end()))):
+                continue
+            sentences.append(line[start:match.end()].strip())
+            start = match.end()
+
+        if start < len(line) and len(line[start:].strip()) != 0:
+            sentences.append(line[start:].strip())
+        return sentences
+
+    def is_capitalised(self, line, offset):
+        """
+        Method to check if the word at offset of line starts with an upper case letter
+        """
+        return offset < len(line) and line[offset].isupper()
+
+    def tokenize(self, text):
+        """
+        Method to turn text into terms
+
+            Returns:
+                a list of terms in the order of the text, without empty terms
+        """
+        terms = []
+        for word in self.split_words(text):
+            # stem and case-folding
+            term = self.normalize(word)
+            # skip empty strings
+            if len(term) != 0:
+                terms.append(term)
+        return terms
+
+    def cache_info(self):
+        """
+        Method to get the hits, misses and size of the stem cache
+        """
+        return self.normalize.cache_info()
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(mode=NLTK_MODE):
+    """
+    Method to get the Tokenizer of a mode shared by the whole process, so that stems memoized while
+    tokenizing a document (or query) are reused for the next ones
+    """
+    return Tokenizer(mode)
+
+def verify(texts, mode=FAST_MODE, max_examples=5):
+    """
+    Method to check that a tokenizer mode produces the same terms as the NLTK mode
+
+        Parameters:
+            texts: a list of string, e.g. the content of a sample of documents
+            mode: the tokenizer mode to check
+
+        Returns:
+            the number of texts with the same terms, and up to max_examples differences as
+            (terms of the NLTK mode, terms of mode)
+    """
+    expected_tokenizer = Tokenizer(NLTK_MODE)
+    tokenizer = Tokenizer(mode)
+    num_same = 0
+    examples = []
+    for text in texts:
+        expected = expected_tokenizer.tokenize(text)
+        terms = tokenizer.tokenize(text)
+        if expected == terms:
+            num_same += 1
+            continue
+
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, expected, terms, autojunk=False).get_opcodes():
+            if tag != 'equal' and len(examples) < max_examples:
+                examples.append((expected[max(0, i1 - 2):i2 + 2], terms[max(0, j1 - 2):j2 + 2]))
+    return num_same, examples
+
+def benchmark(texts, mode, cache_size=STEM_CACHE_SIZE):
+    """
+    Method to measure the throughput of a tokenizer mode, with a cold stem cache
+
+        Returns:
+            the number of terms and the number of terms per second
+    """
+    tokenizer = Tokenizer(mode, cache_size)
+    st = time.time()
+    num_terms = 0
+    for text in texts:
+        num_terms += len(tokenizer.tokenize(text))
+    return num_terms, num_terms / (time.time() - st)
+
+def read_contents(in_dir, max_docs):
+    """
+    Method to read the content of the first max_docs documents of a dataset file
+    """
+    csv.field_size_limit(sys.maxsize)
+    contents = []
+    with open(in_dir, 'r') as file:
+        reader = csv.reader(file, delimiter = ',')
+        next(reader) # skip column titles
+        for data in reader:
+            if len(contents) == max_docs:
+                break
+            contents.append(data[2])
+    return contents
+
+def usage():
+    print("usage: " + sys.argv[0] + " -i dataset-file [-n number-of-documents]")
+    print("  checks that the fast tokenizer matches the NLTK tokenizer on the first documents (default 200)")
+    print("  of dataset-file, and prints the number of terms per second of every tokenizer")
+
+if __name__ == '__main__':
+    input_directory = None
+    max_docs = 200
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'i:n:')
+    except getopt.GetoptError:
+        usage()
+        sys.exit(2)
+
+    for o, a in opts:
+        if o == '-i':  # input directory
+            input_directory = a
+        elif o == '-n':  # number of documents
+            max_docs = int(a)
+        else:
+            assert False, "unhandled option"
+
+    if input_directory == None:
+        usage()
+        sys.exit(2)
+
+    texts = read_contents(input_directory, max_docs)
+
+    num_same, examples = verify(texts)
+    print("fast tokenizer matches the NLTK tokenizer on {} of {} documents".format(num_same, len(texts)))
+    for expected, terms in examples:
+        print("  nltk: {}\n  fast: {}".format(' '.join(expected), ' '.join(terms)))
+
+    for name, mode, cache_size in (("nltk", NLTK_MODE, 0), ("nltk + stem cache", NLTK_MODE, STEM_CACHE_SIZE), \
+                                   ("fast + stem cache", FAST_MODE, STEM_CACHE_SIZE)):
+        num_terms, terms_per_sec = benchmark(texts, mode, cache_size)
+        print("{:<20} {} terms, {:.0f} terms/sec".format(name, num_terms, terms_per_sec))